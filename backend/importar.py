@@ -1,11 +1,12 @@
 import os
-import requests
 import pandas as pd
 import math
 from datetime import datetime
 from dotenv import load_dotenv
 from io import BytesIO
 
+from supabase_client import get_session
+
 # -----------------------
 # CARREGAR .env
 # -----------------------
@@ -80,7 +81,7 @@ def json_safe(o):
 
 def supabase_upsert(table, data, conflict):
     url = f"{SUPABASE_URL}/rest/v1/{table}?on_conflict={conflict}"
-    r = requests.post(url, headers=HEADERS, json=data)
+    r = get_session().post(url, headers=HEADERS, json=data)
 
     if r.status_code not in (200, 201):
         raise RuntimeError(
@@ -95,7 +96,7 @@ def supabase_upsert(table, data, conflict):
 
 def get_or_create_clinica(cnpj, codigo_clinica):
     url = f"{SUPABASE_URL}/rest/v1/clinicas?cnpj=eq.{cnpj}"
-    r = requests.get(url, headers=HEADERS)
+    r = get_session().get(url, headers=HEADERS)
 
     if r.status_code == 200:
         rows = r.json()
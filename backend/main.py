@@ -1,19 +1,38 @@
 import os
 import asyncio
 import math
+import hashlib
+import json
 import re
+import tempfile
+import time
+import traceback
+import uuid
+from collections import deque
 from datetime import datetime, timedelta
+from itertools import islice
+from urllib.parse import quote
+import numpy as np
 import pandas as pd
-import requests
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from processor import processar_excel
+from processor import TABELAS_CONFLITO, processar_excel
+import snapshot_disco
+from supabase_client import (
+    close_async_client,
+    decodificar_json,
+    get_async_client,
+    pool_stats,
+    transferencia_stats,
+)
 from io import BytesIO, StringIO
 import csv
 from openpyxl import Workbook
+from pandas.api.types import union_categoricals
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 
@@ -51,6 +70,103 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Máximo de páginas buscadas em paralelo por leitura paginada
+SUPABASE_PAGE_FANOUT = int(os.getenv("SUPABASE_PAGE_FANOUT", "4"))
+
+# Tamanho máximo (já codificado na URL) de cada lista `in.(...)`. Listas
+# maiores viram vários lotes buscados em paralelo, abaixo dos limites de
+# URL de proxies/gateways (~8 KB).
+SUPABASE_IN_MAX_BYTES = int(os.getenv("SUPABASE_IN_MAX_BYTES", "4000"))
+
+# Estratégia de paginação por tabela (padrão: offset sequencial).
+# "paralela" exige uma ordem estável para que páginas buscadas em
+# requisições diferentes não se sobreponham; "keyset" exige uma chave
+# única e não nula (simples ou composta), servida por índice.
+PAGINACAO_TABELAS = {
+    "vw_dashboard_final": {
+        "modo": "paralela",
+        "ordem": "clinica_nome.asc,mes_ref_date.asc,clinica_id.asc",
+    },
+    "antecipacoes": {"modo": "keyset", "chave": ("id",)},
+}
+
+# Validade (segundos) do snapshot do portfólio usado por /dashboard e exportações
+PORTFOLIO_SNAPSHOT_TTL = float(os.getenv("PORTFOLIO_SNAPSHOT_TTL", "300"))
+
+# A cada tantos TTLs desde a última carga completa, o snapshot é baixado de
+# novo por inteiro em vez de sincronizado: edições que as marcas d'água não
+# enxergam (ex.: UPDATE nas tabelas da view) não ficam obsoletas para sempre.
+PORTFOLIO_SNAPSHOT_RECARGA_TTLS = float(os.getenv("PORTFOLIO_SNAPSHOT_RECARGA_TTLS", "12"))
+
+# Cópia em disco (Arrow IPC) do snapshot para workers recém-iniciados; vazio desativa
+PORTFOLIO_SNAPSHOT_DIR = os.getenv(
+    "PORTFOLIO_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "medsimples_portfolio")
+)
+# Muda quando o formato/enriquecimento do snapshot muda (descarta cópias antigas)
+SNAPSHOT_FORMATO = 7
+
+# Meses de histórico da vw_dashboard_final carregados no snapshot, contados
+# a partir do mês atual (filtro mes_ref_date=gte. na carga). Períodos mais
+# antigos são buscados sob demanda; 0 carrega o histórico inteiro.
+PORTFOLIO_HISTORICO_MESES = int(os.getenv("PORTFOLIO_HISTORICO_MESES", "36"))
+
+# Meses da janela do motor de limite (média de 12m até o mês de corte)
+JANELA_LIMITE_MESES = 12
+
+# Escritas nestas tabelas invalidam o snapshot do portfólio
+TABELAS_SNAPSHOT = {"antecipacoes", "clinica_limite", "clinicas", "importacoes"}
+
+# Colunas da vw_dashboard_final que cada consumidor do snapshot do
+# portfólio lê. O snapshot busca só a união (`SELECT_PORTFOLIO`), em vez de
+# `select=*`; a exportação ainda recorta por ExportPayload.columns.
+COLUNAS_PORTFOLIO = {
+    "enriquecimento": [
+        "mes_ref", "mes_ref_date", "valor_total_emitido", "taxa_pago_no_vencimento",
+        "taxa_inadimplencia", "tempo_medio_pagamento_dias", "parc_media_parcelas_pond",
+        "valor_medio_boleto", "limite_aprovado",
+    ],
+    "dashboard": [
+        "clinica_id", "clinica_nome", "cnpj", "mes_ref_date", "qtde_boletos",
+        "valor_total_emitido", "valor_medio_boleto", "taxa_pago_no_vencimento",
+        "taxa_inadimplencia", "tempo_medio_pagamento_dias", "parc_media_parcelas_pond",
+        "limite_aprovado",
+    ],
+    # Cálculo da exportação + colunas da view oferecidas no ExportModal
+    "export": [
+        "clinica_id", "clinica_nome", "cnpj", "mes_ref_date", "valor_total_emitido",
+        "limite_aprovado", "tempo_medio_pagamento_dias", "valor_medio_boleto",
+        "parc_media_parcelas_pond", "taxa_pago_no_vencimento", "score_credito",
+    ],
+}
+
+# Colunas calculadas no enriquecimento que a exportação sempre usa
+COLUNAS_EXPORT_CALCULADAS = [
+    "mes_idx", "valor_inad_real", "taxa_inadimplencia_real", "score_ajustado", "categoria_risco_ajustada",
+]
+
+# Dtypes declarados por tabela para o carregador colunar (supabase_get_df).
+# Colunas fora daqui seguem a inferência padrão do pandas.
+DTYPES_TABELAS = {
+    "vw_dashboard_final": {
+        "clinica_id": "category",
+        "mes_ref_date": "datetime64[ns]",
+        "qtde_boletos": "float64",
+        "valor_total_emitido": "float64",
+        "valor_medio_boleto": "float64",
+        "taxa_pago_no_vencimento": "float64",
+        "taxa_inadimplencia": "float64",
+        "tempo_medio_pagamento_dias": "float64",
+        "parc_media_parcelas_pond": "float64",
+        "limite_aprovado": "float64",
+    },
+    "antecipacoes": {"clinica_id": "category", "valor_liquido": "float64"},
+    "boletos_emitidos": {"clinica_id": "category", "valor_total": "float64"},
+    "inadimplencia": {"clinica_id": "category", "taxa": "float64"},
+    "taxa_pago_no_vencimento": {"clinica_id": "category", "taxa": "float64"},
+    "tempo_medio_pagamento": {"clinica_id": "category", "dias": "float64"},
+    "valor_medio_boleto": {"clinica_id": "category", "valor": "float64"},
+}
+
 class LimiteAprovadoPayload(BaseModel):
     limite_aprovado: float | None = None
     observacao: str | None = None
@@ -100,6 +216,13 @@ class ExportPayload(BaseModel):
     class Config:
         extra = "ignore"
 
+# Payload do limite sugerido em lote
+class LimitesSugeridosPayload(BaseModel):
+    clinica_ids: List[str]
+
+    class Config:
+        extra = "ignore"
+
 # New Pydantic Models for Dashboard Data
 class DashboardFiltrosPeriodo(BaseModel):
     min_mes_ref: Optional[str] = None
@@ -215,6 +338,11 @@ app.add_middleware(
 
 upload_lock = asyncio.Lock()
 
+
+@app.on_event("shutdown")
+async def fechar_cliente_http():
+    await close_async_client()
+
 @app.get("/")
 def read_root():
     return {"status": "ok"}
@@ -226,52 +354,58 @@ def read_root():
 # ==========================
 
 
-def supabase_post(table: str, data: dict, on_conflict: str | None = None):
+async def supabase_post(table: str, data: dict, on_conflict: str | None = None):
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     params = {}
     if on_conflict:
         params["on_conflict"] = on_conflict
 
-    r = requests.post(
+    r = await get_async_client().post(
         url,
         headers={**HEADERS, "Prefer": "return=representation"},
         params=params,
         json=data,
     )
+    _registrar_escrita()
+    if table in TABELAS_SNAPSHOT:
+        invalidar_snapshot()
 
     if r.status_code not in (200, 201):
         raise RuntimeError(f"Erro ao enviar para {table}: {r.status_code} - {r.text}")
 
     try:
-        return r.json()[0]
+        return decodificar_json(r, table)[0]
     except Exception:
         return None
 
 
-def supabase_patch(table: str, data: dict, match: dict):
+async def supabase_patch(table: str, data: dict, match: dict):
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     params = {}
     for key, value in match.items():
         params[key] = f"eq.{value}"
 
-    r = requests.patch(
+    r = await get_async_client().patch(
         url,
         headers={**HEADERS, "Prefer": "return=representation"},
         params=params,
         json=data,
     )
+    _registrar_escrita()
+    if table in TABELAS_SNAPSHOT:
+        invalidar_snapshot()
 
     if r.status_code not in (200, 204):
         raise RuntimeError(f"Erro ao atualizar {table}: {r.status_code} - {r.text}")
 
     try:
-        json_data = r.json()
+        json_data = decodificar_json(r, table)
         return json_data[0] if json_data else None
     except Exception:
         return None
 
 
-def supabase_get(table: str, select: str = "*", extra_params: dict | None = None):
+async def supabase_get(table: str, select: str = "*", extra_params: dict | None = None):
     """GET simples no PostgREST, retornando lista de dicts."""
     url = f"{SUPABASE_URL}/rest/v1/{table}"
 
@@ -279,47 +413,459 @@ def supabase_get(table: str, select: str = "*", extra_params: dict | None = None
     if extra_params:
         params.update(extra_params)
 
-    r = requests.get(url, headers=HEADERS, params=params)
+    r = await get_async_client().get(url, headers=HEADERS, params=params)
+
+    if r.status_code not in (200, 206):
+        raise RuntimeError(f"Erro ao buscar {table}: {r.status_code} - {r.text}")
+
+    return decodificar_json(r, table)
+
 
+async def _supabase_get_page(table: str, params: dict, headers: dict | None = None):
+    r = await get_async_client().get(
+        f"{SUPABASE_URL}/rest/v1/{table}",
+        headers=headers or HEADERS,
+        params=params,
+    )
     if r.status_code not in (200, 206):
         raise RuntimeError(f"Erro ao buscar {table}: {r.status_code} - {r.text}")
+    return r
+
+
+def _total_content_range(r) -> int | None:
+    """Total de linhas do header Content-Range (`0-999/12345`), se informado."""
+    content_range = r.headers.get("content-range") or ""
+    total = content_range.rsplit("/", 1)[-1]
+    return int(total) if total.isdigit() else None
+
+
+async def _iter_pages_offset(table: str, params: dict, page_size: int, offset: int = 0):
+    while True:
+        rows = decodificar_json(
+            await _supabase_get_page(table, {**params, "offset": str(offset)}), table
+        )
+        yield rows
+        if len(rows) < page_size:
+            break
+        offset += page_size
+
+
+async def _iter_pages_paralela(table: str, params: dict, page_size: int):
+    """
+    Pede o total (`Prefer: count=exact`) junto com a primeira página e
+    busca as demais em paralelo (no máximo SUPABASE_PAGE_FANOUT por vez),
+    entregando as páginas na ordem. Sem total, cai no offset sequencial.
+    """
+    first = await _supabase_get_page(
+        table,
+        {**params, "offset": "0"},
+        headers={**HEADERS, "Prefer": "count=exact"},
+    )
+    rows = decodificar_json(first, table)
+    yield rows
+    if len(rows) < page_size:
+        return
+
+    total = _total_content_range(first)
+    if total is None:
+        async for rows in _iter_pages_offset(table, params, page_size, page_size):
+            yield rows
+        return
+
+    async def fetch(offset):
+        return decodificar_json(
+            await _supabase_get_page(table, {**params, "offset": str(offset)}), table
+        )
+
+    offsets = iter(range(page_size, total, page_size))
+    pendentes = deque(
+        asyncio.create_task(fetch(offset))
+        for offset in islice(offsets, max(SUPABASE_PAGE_FANOUT, 1))
+    )
+    try:
+        while pendentes:
+            rows = await pendentes.popleft()
+            proximo = next(offsets, None)
+            if proximo is not None:
+                pendentes.append(asyncio.create_task(fetch(proximo)))
+            yield rows
+    finally:
+        for task in pendentes:
+            task.cancel()
+
+    # A tabela cresceu depois da contagem: segue sequencial até a página curta
+    if len(rows) == page_size:
+        async for rows in _iter_pages_offset(table, params, page_size, total):
+            yield rows
+
+
+def _valor_postgrest(value) -> str:
+    """Formata um valor para filtros lógicos (`or=`/`and=`) do PostgREST."""
+    txt = str(value)
+    if any(ch in txt for ch in ',()"'):
+        return '"' + txt.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return txt
+
+
+def _filtro_keyset(chave: tuple, ultimo: tuple) -> str:
+    """
+    Monta `(a.gt.A,and(a.eq.A,b.gt.B),...)`: linhas estritamente depois da
+    última chave vista, na ordem lexicográfica da chave composta.
+    """
+    ramos = []
+    for i, col in enumerate(chave):
+        iguais = [f"{c}.eq.{_valor_postgrest(v)}" for c, v in zip(chave[:i], ultimo[:i])]
+        cond = f"{col}.gt.{_valor_postgrest(ultimo[i])}"
+        ramos.append(f"and({','.join(iguais + [cond])})" if iguais else cond)
+    return f"({','.join(ramos)})"
+
+
+async def _iter_pages_keyset(table: str, params: dict, page_size: int, chave: tuple):
+    """
+    Paginação por chave (`id=gt.<último>`): cada página usa o índice da
+    chave em vez de pular `offset` linhas, e não duplica/perde linhas se
+    houver inserções durante a leitura.
+    """
+    params = {**params, "order": ",".join(f"{c}.asc" for c in chave)}
+
+    # Garante as colunas da chave no select; removidas antes de devolver
+    select = params.get("select") or "*"
+    extras = []
+    if select != "*":
+        presentes = {c.strip() for c in select.split(",")}
+        extras = [c for c in chave if c not in presentes]
+        if extras:
+            params["select"] = ",".join([select] + extras)
+
+    ultimo = None
+    while True:
+        page_params = dict(params)
+        if ultimo is not None:
+            if len(chave) == 1:
+                page_params[chave[0]] = f"gt.{ultimo[0]}"
+            else:
+                page_params["or"] = _filtro_keyset(chave, ultimo)
+        rows = decodificar_json(await _supabase_get_page(table, page_params), table)
+        if rows:
+            ultimo = tuple(rows[-1].get(c) for c in chave)
+        if extras:
+            for row in rows:
+                for c in extras:
+                    row.pop(c, None)
+        yield rows
+        if len(rows) < page_size:
+            break
+
 
-    return r.json()
+def _keyset_aplicavel(chave: tuple, extra_params: dict) -> bool:
+    """Keyset só vale se a chamada não usa os mesmos parâmetros da paginação."""
+    if not chave:
+        return False
+    ordem_chave = ",".join(f"{c}.asc" for c in chave)
+    if "order" in extra_params and extra_params["order"] != ordem_chave:
+        return False
+    if len(chave) == 1:
+        return chave[0] not in extra_params
+    return "or" not in extra_params
 
 
-def supabase_get_all(
+async def _iter_pages(
     table: str,
     select: str = "*",
     extra_params: dict | None = None,
     page_size: int = 1000,
+    paginacao: str | None = None,
 ):
-    all_rows = []
-    offset = 0
-    while True:
-        params = {"select": select, "limit": str(page_size), "offset": str(offset)}
-        if extra_params:
-            params.update(extra_params)
-        r = requests.get(f"{SUPABASE_URL}/rest/v1/{table}", headers=HEADERS, params=params)
-        if r.status_code not in (200, 206):
-            raise RuntimeError(f"Erro ao buscar {table}: {r.status_code} - {r.text}")
-        rows = r.json()
-        all_rows.extend(rows)
-        if len(rows) < page_size:
-            break
-        offset += page_size
-    return all_rows
+    """Gera as páginas (listas de dicts) de uma leitura, na ordem."""
+    config = PAGINACAO_TABELAS.get(table, {})
+    modo = paginacao or config.get("modo", "offset")
+
+    params = {"select": select, "limit": str(page_size)}
+    if extra_params:
+        params.update(extra_params)
+
+    # Chamadas que já limitam o resultado (ex.: limit=1) não são paginadas
+    if "limit" in (extra_params or {}) or "offset" in (extra_params or {}):
+        modo = "offset"
 
+    if modo == "keyset" and not _keyset_aplicavel(config.get("chave") or (), extra_params or {}):
+        modo = "offset"
 
-def supabase_delete(table: str, extra_params: dict | None = None):
+    if modo == "paralela":
+        if "order" not in params and config.get("ordem"):
+            params["order"] = config["ordem"]
+        pages = _iter_pages_paralela(table, params, page_size)
+    elif modo == "keyset":
+        pages = _iter_pages_keyset(table, params, page_size, tuple(config["chave"]))
+    else:
+        offset = int(params.pop("offset", 0) or 0)
+        pages = _iter_pages_offset(table, params, page_size, offset)
+
+    async for rows in pages:
+        yield rows
+
+
+# ==========================
+# COALESCÊNCIA DE LEITURAS
+# ==========================
+
+# Leituras idênticas em andamento: chave -> task da busca
+_leituras_em_voo: dict = {}
+_coalescencia = {"leituras": 0, "buscas_upstream": 0, "coalescidas": 0}
+
+# Sobe a cada escrita concluída e entra na chave das leituras: quem lê
+# depois de escrever nunca se junta a uma busca iniciada antes da escrita.
+_geracao_escritas = 0
+
+
+def _registrar_escrita():
+    global _geracao_escritas
+    _geracao_escritas += 1
+
+
+def coalescencia_stats():
+    """Contadores de leituras coalescidas (várias chamadas, uma busca)."""
+    return {**_coalescencia, "em_voo": len(_leituras_em_voo)}
+
+
+def _chave_leitura(tipo: str, table: str, select: str, extra_params: dict | None, *resto):
+    params = tuple(sorted((extra_params or {}).items()))
+    return (tipo, table, select, params, *resto)
+
+
+async def _single_flight(chave: tuple, buscar, copiar):
+    """
+    Chamadas concorrentes com a mesma chave (na mesma geração de escritas)
+    aguardam uma única busca. Cada leitor recebe a própria cópia do
+    resultado, que nunca é entregue diretamente: os endpoints alteram os
+    DataFrames/dicts que recebem.
+    """
+    _coalescencia["leituras"] += 1
+    chave = (_geracao_escritas, *chave)
+    task = _leituras_em_voo.get(chave)
+    if task is None:
+        task = _leituras_em_voo[chave] = asyncio.ensure_future(buscar())
+        task.add_done_callback(lambda _t: _leituras_em_voo.pop(chave, None))
+        _coalescencia["buscas_upstream"] += 1
+    else:
+        _coalescencia["coalescidas"] += 1
+
+    # shield: o cancelamento de um leitor não derruba a busca dos demais
+    resultado = await asyncio.shield(task)
+    return copiar(resultado)
+
+
+def _copiar_linhas(rows: list) -> list:
+    return [dict(row) for row in rows]
+
+
+async def supabase_get_all(
+    table: str,
+    select: str = "*",
+    extra_params: dict | None = None,
+    page_size: int = 1000,
+    paginacao: str | None = None,
+):
+    async def buscar():
+        all_rows = []
+        async for rows in _iter_pages(table, select, extra_params, page_size, paginacao):
+            all_rows.extend(rows)
+        return all_rows
+
+    chave = _chave_leitura("rows", table, select, extra_params, page_size, paginacao)
+    return await _single_flight(chave, buscar, _copiar_linhas)
+
+
+async def supabase_delete(table: str, extra_params: dict | None = None):
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     params = {}
     if extra_params:
         params.update(extra_params)
-    r = requests.delete(url, headers=HEADERS, params=params)
+    r = await get_async_client().delete(url, headers=HEADERS, params=params)
+    _registrar_escrita()
+    if table in TABELAS_SNAPSHOT:
+        invalidar_snapshot()
     if r.status_code not in (200, 204):
         raise RuntimeError(f"Erro ao deletar {table}: {r.status_code} - {r.text}")
 
 
+async def supabase_rpc(fn: str, params: dict | None = None):
+    """Chama uma função SQL exposta pelo PostgREST (POST /rpc/<fn>)."""
+    url = f"{SUPABASE_URL}/rest/v1/rpc/{fn}"
+
+    async def buscar():
+        r = await get_async_client().post(url, headers=HEADERS, json=params or {})
+        if r.status_code != 200:
+            raise RuntimeError(f"Erro ao chamar rpc/{fn}: {r.status_code} - {r.text}")
+        return decodificar_json(r, f"rpc/{fn}")
+
+    chave = ("rpc", fn, json.dumps(params or {}, sort_keys=True))
+    return await _single_flight(chave, buscar, _copiar_linhas)
+
+
+# ---- Filtros `in.(...)` em lotes ----
+
+
+def _lotes_in(valores, max_bytes: int = SUPABASE_IN_MAX_BYTES) -> list:
+    """
+    Divide os valores (distintos, ordenados) em lotes cuja lista
+    `in.(...)` codificada na URL cabe em `max_bytes`.
+    """
+    lotes, atual, tamanho = [], [], 0
+    for valor in sorted({str(v) for v in valores if v is not None}):
+        custo = len(quote(valor, safe="")) + 3  # vírgula codificada (%2C)
+        if atual and tamanho + custo > max_bytes:
+            lotes.append(atual)
+            atual, tamanho = [], 0
+        atual.append(valor)
+        tamanho += custo
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+
+async def _em_lotes_in(coluna: str, valores, extra_params: dict | None, buscar) -> list:
+    """Chama `buscar(params)` por lote de `coluna=in.(...)`, em paralelo (até SUPABASE_PAGE_FANOUT)."""
+    semaforo = asyncio.Semaphore(max(SUPABASE_PAGE_FANOUT, 1))
+
+    async def um_lote(lote):
+        async with semaforo:
+            return await buscar({**(extra_params or {}), coluna: f"in.({','.join(lote)})"})
+
+    return await asyncio.gather(*(um_lote(lote) for lote in _lotes_in(valores)))
+
+
+async def supabase_get_all_in(
+    table: str,
+    coluna: str,
+    valores,
+    select: str = "*",
+    extra_params: dict | None = None,
+    **kwargs,
+) -> list:
+    """
+    supabase_get_all com `coluna=in.(valores)` em lotes concorrentes,
+    concatenados na ordem dos lotes. `order`/`limit` valem dentro de cada
+    lote: a ordem entre linhas com o mesmo valor de `coluna` é preservada.
+    """
+    partes = await _em_lotes_in(
+        coluna,
+        valores,
+        extra_params,
+        lambda params: supabase_get_all(table, select=select, extra_params=params, **kwargs),
+    )
+    return [row for parte in partes for row in parte]
+
+
+async def _get_all_ou_vazio(table: str, **kwargs):
+    try:
+        return await supabase_get_all(table, **kwargs)
+    except Exception:
+        return []
+
+
+async def _get_all_in_ou_vazio(table: str, coluna: str, valores, **kwargs):
+    try:
+        return await supabase_get_all_in(table, coluna, valores, **kwargs)
+    except Exception:
+        return []
+
+
+# ==========================
+# CARREGADOR COLUNAR
+# ==========================
+
+
+def _coluna_tipada(values: list, dtype: str):
+    """Converte os valores de uma coluna (uma página) para o dtype declarado."""
+    if dtype == "category":
+        return pd.Categorical(values)
+    serie = pd.Series(values, dtype=object)
+    if dtype.startswith("datetime64"):
+        return pd.to_datetime(serie, errors="coerce").astype(dtype).array
+    return pd.to_numeric(serie, errors="coerce").astype(dtype).array
+
+
+def _concat_categorias(partes: list):
+    """Junta categóricos de páginas diferentes numa categoria única (ordenada)."""
+    categorias = pd.Index(sorted(set().union(*(p.categories for p in partes))))
+    return union_categoricals([p.set_categories(categorias) for p in partes])
+
+
+async def supabase_get_df(
+    table: str,
+    select: str = "*",
+    extra_params: dict | None = None,
+    dtypes: dict | None = None,
+    page_size: int = 1000,
+    paginacao: str | None = None,
+) -> pd.DataFrame:
+    """
+    Lê a tabela inteira direto para um DataFrame. Cada página vira arrays
+    tipados (DTYPES_TABELAS) assim que chega, então a lista de dicts nunca
+    existe inteira em memória. Colunas sem dtype declarado mantêm a
+    inferência do pandas, como em `to_df`.
+    """
+    dtypes = DTYPES_TABELAS.get(table, {}) if dtypes is None else dtypes
+    chave = _chave_leitura(
+        "df", table, select, extra_params, page_size, paginacao, tuple(sorted(dtypes.items()))
+    )
+    return await _single_flight(
+        chave,
+        lambda: _carregar_df(table, select, extra_params, dtypes, page_size, paginacao),
+        lambda df: df.copy(),
+    )
+
+
+async def _carregar_df(
+    table: str,
+    select: str,
+    extra_params: dict | None,
+    dtypes: dict,
+    page_size: int,
+    paginacao: str | None,
+) -> pd.DataFrame:
+    colunas: dict[str, list] = {}
+    async for rows in _iter_pages(table, select, extra_params, page_size, paginacao):
+        if not rows:
+            continue
+        for col in rows[0]:
+            values = [row.get(col) for row in rows]
+            if col in dtypes:
+                colunas.setdefault(col, []).append(_coluna_tipada(values, dtypes[col]))
+            else:
+                colunas.setdefault(col, []).extend(values)
+
+    if not colunas:
+        return pd.DataFrame(columns=[c.strip() for c in select.split(",") if c.strip() != "*"])
+
+    dados = {}
+    for col, partes in colunas.items():
+        if col not in dtypes:
+            dados[col] = partes
+        elif dtypes[col] == "category":
+            dados[col] = _concat_categorias(partes)
+        else:
+            dados[col] = pd.concat([pd.Series(p) for p in partes], ignore_index=True)
+        colunas[col] = None
+    return pd.DataFrame(dados)
+
+
+async def supabase_get_df_in(
+    table: str, coluna: str, valores, select: str = "*", extra_params: dict | None = None, **kwargs
+) -> pd.DataFrame:
+    """supabase_get_df com `coluna=in.(valores)` em lotes concorrentes (ver supabase_get_all_in)."""
+    partes = await _em_lotes_in(
+        coluna,
+        valores,
+        extra_params,
+        lambda params: supabase_get_df(table, select=select, extra_params=params, **kwargs),
+    )
+    if not partes:
+        return pd.DataFrame(columns=[c.strip() for c in select.split(",") if c.strip() != "*"])
+    return _concat_frames(partes)
+
+
 def _parse_brl_number(value: str | None):
     if value is None:
         return None
@@ -383,32 +929,50 @@ def _normalize_cnpj(value: str | None):
     return re.sub(r"\D", "", str(value))
 
 
-def get_limite_utilizado_atual(clinica_id: str):
+def _uuid_valido(valor) -> bool:
     try:
-        rows = supabase_get_all(
-            "antecipacoes",
-            select="valor_liquido,data_reembolso",
-            extra_params={
-                "clinica_id": f"eq.{clinica_id}",
-            },
-        )
-        total_antecipado = 0.0
-        total_reembolsado = 0.0
-        for row in rows or []:
-            valor = _safe_float(row.get("valor_liquido")) or 0.0
-            total_antecipado += valor
-            if row.get("data_reembolso"):
-                total_reembolsado += valor
-        aberto = max(total_antecipado - total_reembolsado, 0.0)
-        return aberto
+        uuid.UUID(str(valor))
+        return True
+    except ValueError:
+        return False
+
+
+async def exposicao_por_clinica(clinica_ids: list | None = None) -> dict:
+    """
+    Exposição em antecipações agregada no banco (rpc exposicao_por_clinica,
+    sql/create_exposicao_por_clinica.sql): clinica_id -> {total_antecipado,
+    total_reembolsado, em_aberto}. Sem `clinica_ids`, todas as clínicas;
+    clínicas sem antecipação não aparecem; ids que não são uuid são
+    ignorados (o parâmetro da rpc é uuid[]).
+    """
+    params = {}
+    if clinica_ids is not None:
+        params["p_clinica_ids"] = sorted({str(c) for c in clinica_ids if _uuid_valido(c)})
+        if not params["p_clinica_ids"]:
+            return {}
+    rows = await supabase_rpc("exposicao_por_clinica", params)
+    return {
+        str(row["clinica_id"]): {
+            "total_antecipado": _safe_float(row.get("total_antecipado")) or 0.0,
+            "total_reembolsado": _safe_float(row.get("total_reembolsado")) or 0.0,
+            "em_aberto": _safe_float(row.get("em_aberto")) or 0.0,
+        }
+        for row in rows or []
+        if row.get("clinica_id")
+    }
+
+
+async def get_limite_utilizado_atual(clinica_id: str):
+    try:
+        exposicao = await exposicao_por_clinica([clinica_id])
+        return exposicao.get(str(clinica_id), {}).get("em_aberto", 0.0)
     except Exception:
         return None
-    return None
 
 
-def get_limite_aprovado_atual(clinica_id: str):
+async def get_limite_aprovado_atual(clinica_id: str):
     try:
-        rows = supabase_get(
+        rows = await supabase_get(
             "clinica_limite",
             select="limite_aprovado",
             extra_params={
@@ -441,6 +1005,16 @@ def ping():
     return {"status": "ok"}
 
 
+@app.get("/supabase/metricas")
+def supabase_metricas():
+    """Contadores do cliente HTTP compartilhado (conexões, coalescência e bytes)."""
+    return {
+        "conexoes": pool_stats(),
+        "coalescencia": coalescencia_stats(),
+        "transferencia": transferencia_stats(),
+    }
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """
@@ -449,7 +1023,12 @@ async def upload_file(file: UploadFile = File(...)):
     try:
         async with upload_lock:
             contents = await file.read()
-            resultado = processar_excel(contents, arquivo_nome=file.filename)
+            try:
+                resultado = await run_in_threadpool(
+                    processar_excel, contents, arquivo_nome=file.filename
+                )
+            finally:
+                invalidar_snapshot()
             return resultado
     except Exception as e:
         raise HTTPException(
@@ -480,7 +1059,7 @@ async def definir_limite_aprovado(clinica_id: str, payload: LimiteAprovadoPayloa
 
 
     try:
-        inserido = supabase_post("clinica_limite", row)
+        inserido = await supabase_post("clinica_limite", row)
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -494,7 +1073,7 @@ async def listar_limites_clinica(clinica_id: str):
     do mais recente para o mais antigo.
     """
     try:
-        rows = supabase_get_all(
+        rows = await supabase_get_all(
             "clinica_limite",
             select=(
                 "limite_aprovado,"
@@ -525,7 +1104,7 @@ async def registrar_limite_utilizacao(clinica_id: str, payload: LimiteUtilizacao
         detail="Registro manual de uso desativado. Use antecipações.",
     )
     try:
-        limite_rows = supabase_get(
+        limite_rows = await supabase_get(
             "clinica_limite",
             select="limite_aprovado",
             extra_params={
@@ -547,7 +1126,7 @@ async def registrar_limite_utilizacao(clinica_id: str, payload: LimiteUtilizacao
             detail="É necessário aprovar um limite antes de registrar uso.",
         )
 
-    utilizado_atual = get_limite_utilizado_atual(clinica_id) or 0.0
+    utilizado_atual = await get_limite_utilizado_atual(clinica_id) or 0.0
     valor_novo = _safe_float(payload.valor_utilizado) or 0.0
     disponivel = max(limite_aprovado - utilizado_atual, 0.0)
 
@@ -570,7 +1149,7 @@ async def registrar_limite_utilizacao(clinica_id: str, payload: LimiteUtilizacao
     }
 
     try:
-        inserido = supabase_post("limite_utilizacoes", row)
+        inserido = await supabase_post("limite_utilizacoes", row)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao registrar uso: {e}")
 
@@ -580,7 +1159,7 @@ async def registrar_limite_utilizacao(clinica_id: str, payload: LimiteUtilizacao
 @app.get("/clinicas/{clinica_id}/limite_utilizacao")
 async def listar_limite_utilizacao(clinica_id: str):
     try:
-        rows = supabase_get_all(
+        rows = await supabase_get_all(
             "limite_utilizacoes",
             select="valor_utilizado,data_referencia,criado_em,observacao,registrado_por",
             extra_params={
@@ -597,22 +1176,26 @@ async def listar_limite_utilizacao(clinica_id: str):
 @app.get("/antecipacoes/resumo")
 async def resumo_antecipacoes(clinica_id: str | None = None):
     try:
-        antecipacoes = supabase_get_all(
-            "antecipacoes",
-            select="clinica_id,cnpj,valor_liquido,data_reembolso",
-        )
-        limites = supabase_get_all(
-            "clinica_limite",
-            select="clinica_id,limite_aprovado,aprovado_em",
-        )
-        clinicas_rows = supabase_get_all(
-            "clinicas",
-            select="id,codigo_clinica,nome,cnpj",
+        exposicao, limites, clinicas_rows = await asyncio.gather(
+            exposicao_por_clinica([clinica_id] if clinica_id else None),
+            supabase_get_all(
+                "clinica_limite",
+                select="clinica_id,limite_aprovado,aprovado_em",
+            ),
+            supabase_get_all(
+                "clinicas",
+                select="id,codigo_clinica,nome,cnpj",
+            ),
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao carregar antecipações: {e}")
 
-    df_ant = to_df(antecipacoes, ["clinica_id", "cnpj", "valor_liquido", "data_reembolso"])
+    return await run_in_threadpool(
+        _montar_resumo_antecipacoes, exposicao, limites, clinicas_rows, clinica_id
+    )
+
+
+def _montar_resumo_antecipacoes(exposicao, limites, clinicas_rows, clinica_id):
     df_lim = to_df(limites, ["clinica_id", "limite_aprovado", "aprovado_em"])
     df_clin = to_df(clinicas_rows, ["id", "codigo_clinica", "nome", "cnpj"])
 
@@ -622,10 +1205,6 @@ async def resumo_antecipacoes(clinica_id: str | None = None):
             subset=["clinica_id"], keep="last"
         )
 
-    if not df_ant.empty:
-        df_ant["valor_liquido"] = pd.to_numeric(df_ant["valor_liquido"], errors="coerce").fillna(0)
-        df_ant["reembolsado"] = df_ant["data_reembolso"].notna()
-
     resumo = []
     clinicas_map = {}
     if not df_clin.empty:
@@ -645,15 +1224,15 @@ async def resumo_antecipacoes(clinica_id: str | None = None):
         for _, row in df_lim.iterrows():
             limite_map[_safe_str(row.get("clinica_id"))] = _safe_float(row.get("limite_aprovado"))
 
-    clinica_ids = set(limite_map.keys()) | set(df_ant["clinica_id"].dropna().astype(str)) if not df_ant.empty else set(limite_map.keys())
+    clinica_ids = set(limite_map.keys()) | set(exposicao.keys())
     if clinica_id:
         clinica_ids = {clinica_id}
 
     for cid in clinica_ids:
-        df_c = df_ant[df_ant["clinica_id"].astype(str) == str(cid)] if not df_ant.empty else pd.DataFrame()
-        total_antecipado = float(df_c["valor_liquido"].sum()) if not df_c.empty else 0.0
-        total_reembolsado = float(df_c[df_c["reembolsado"]]["valor_liquido"].sum()) if not df_c.empty else 0.0
-        aberto = max(total_antecipado - total_reembolsado, 0.0)
+        exp_c = exposicao.get(str(cid), {})
+        total_antecipado = exp_c.get("total_antecipado", 0.0)
+        total_reembolsado = exp_c.get("total_reembolsado", 0.0)
+        aberto = exp_c.get("em_aberto", 0.0)
         limite_aprovado = limite_map.get(str(cid))
         saldo = None
         perc = None
@@ -685,7 +1264,7 @@ async def listar_antecipacoes(clinica_id: str | None = None):
         params = {"order": "data_antecipacao.desc"}
         if clinica_id:
             params["clinica_id"] = f"eq.{clinica_id}"
-        rows = supabase_get_all(
+        rows = await supabase_get_all(
             "antecipacoes",
             select=(
                 "id,clinica_id,cnpj,data_antecipacao,valor_liquido,valor_taxa,valor_a_pagar,"
@@ -702,7 +1281,7 @@ async def listar_antecipacoes(clinica_id: str | None = None):
 
 @app.post("/antecipacoes")
 async def registrar_antecipacao(payload: AntecipacaoPayload):
-    limite_aprovado = get_limite_aprovado_atual(payload.clinica_id)
+    limite_aprovado = await get_limite_aprovado_atual(payload.clinica_id)
     if limite_aprovado is None:
         raise HTTPException(
             status_code=400,
@@ -711,7 +1290,7 @@ async def registrar_antecipacao(payload: AntecipacaoPayload):
 
     today = datetime.utcnow().date().isoformat()
     try:
-        inadimplente_rows = supabase_get_all(
+        inadimplente_rows = await supabase_get_all(
             "antecipacoes",
             select="id",
             extra_params={
@@ -734,24 +1313,11 @@ async def registrar_antecipacao(payload: AntecipacaoPayload):
         )
 
     try:
-        existentes = supabase_get_all(
-            "antecipacoes",
-            select="valor_liquido,data_reembolso",
-            extra_params={"clinica_id": f"eq.{payload.clinica_id}"},
-        )
+        exposicao = await exposicao_por_clinica([payload.clinica_id])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao validar saldo: {e}")
 
-    df_exist = to_df(existentes, ["valor_liquido", "data_reembolso"])
-    total_antecipado = 0.0
-    total_reembolsado = 0.0
-    if not df_exist.empty:
-        df_exist["valor_liquido"] = pd.to_numeric(df_exist["valor_liquido"], errors="coerce").fillna(0)
-        total_antecipado = float(df_exist["valor_liquido"].sum())
-        total_reembolsado = float(
-            df_exist[df_exist["data_reembolso"].notna()]["valor_liquido"].sum()
-        )
-    em_aberto = max(total_antecipado - total_reembolsado, 0.0)
+    em_aberto = exposicao.get(str(payload.clinica_id), {}).get("em_aberto", 0.0)
     saldo = max(limite_aprovado - em_aberto, 0.0)
 
     valor_liquido = _safe_float(payload.valor_liquido) or 0.0
@@ -777,7 +1343,7 @@ async def registrar_antecipacao(payload: AntecipacaoPayload):
     }
 
     try:
-        inserido = supabase_post("antecipacoes", row)
+        inserido = await supabase_post("antecipacoes", row)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao registrar antecipação: {e}")
 
@@ -788,7 +1354,7 @@ async def registrar_antecipacao(payload: AntecipacaoPayload):
 async def marcar_reembolso(antecipacao_id: str, payload: ReembolsoPayload):
     data_reembolso = payload.data_reembolso or datetime.utcnow().strftime("%Y-%m-%d")
     try:
-        atualizado = supabase_patch(
+        atualizado = await supabase_patch(
             "antecipacoes",
             {"data_reembolso": data_reembolso},
             {"id": antecipacao_id},
@@ -814,7 +1380,7 @@ async def importar_antecipacoes_csv(
         delimiter = ";" if ";" in first_line else ","
         reader = csv.DictReader(text.splitlines(), delimiter=delimiter)
 
-        clinicas_rows = supabase_get_all("clinicas", select="id,cnpj,nome,codigo_clinica")
+        clinicas_rows = await supabase_get_all("clinicas", select="id,cnpj,nome,codigo_clinica")
         clinicas_map = {
             _normalize_cnpj(r.get("cnpj")): _safe_str(r.get("id"))
             for r in (clinicas_rows or [])
@@ -888,12 +1454,12 @@ async def importar_antecipacoes_csv(
         aberto_map = {}
         existing_keys = set()
         if clinica_ids:
-            ids_in = ",".join(sorted(clinica_ids))
-
-            limite_rows = supabase_get_all(
+            limite_rows = await supabase_get_all_in(
                 "clinica_limite",
+                "clinica_id",
+                clinica_ids,
                 select="clinica_id,limite_aprovado,aprovado_em",
-                extra_params={"clinica_id": f"in.({ids_in})", "order": "aprovado_em.desc"},
+                extra_params={"order": "aprovado_em.desc"},
             )
             for row in limite_rows or []:
                 cid = _safe_str(row.get("clinica_id"))
@@ -922,35 +1488,19 @@ async def importar_antecipacoes_csv(
                         },
                     )
 
-            antecipacoes_rows = supabase_get_all(
-                "antecipacoes",
-                select="clinica_id,valor_liquido,data_reembolso",
-                extra_params={"clinica_id": f"in.({ids_in})"},
-            )
-            df_ant = to_df(
-                antecipacoes_rows, ["clinica_id", "valor_liquido", "data_reembolso"]
-            )
-            if not df_ant.empty:
-                df_ant["valor_liquido"] = pd.to_numeric(
-                    df_ant["valor_liquido"], errors="coerce"
-                ).fillna(0)
-                df_ant["reembolsado"] = df_ant["data_reembolso"].notna()
-                for cid, group in df_ant.groupby("clinica_id"):
-                    total_antecipado = float(group["valor_liquido"].sum())
-                    total_reembolsado = float(
-                        group[group["reembolsado"]]["valor_liquido"].sum()
-                    )
-                    aberto_map[_safe_str(cid)] = max(
-                        total_antecipado - total_reembolsado, 0.0
-                    )
+            exposicao = await exposicao_por_clinica(clinica_ids)
+            for cid, exp_c in exposicao.items():
+                aberto_map[cid] = exp_c["em_aberto"]
 
-            existente_params = {"clinica_id": f"in.({ids_in})"}
+            existente_params = {}
             if min_date and max_date:
                 existente_params["and"] = (
                     f"(data_antecipacao.gte.{min_date},data_antecipacao.lte.{max_date})"
                 )
-            existente_rows = supabase_get_all(
+            existente_rows = await supabase_get_all_in(
                 "antecipacoes",
+                "clinica_id",
+                clinica_ids,
                 select="clinica_id,data_antecipacao,valor_liquido,valor_taxa,valor_a_pagar,data_reembolso",
                 extra_params=existente_params,
             )
@@ -1082,7 +1632,7 @@ async def importar_antecipacoes_csv(
         chunk_size = 500
         for i in range(0, len(payloads), chunk_size):
             chunk = payloads[i : i + chunk_size]
-            supabase_post("antecipacoes", chunk)
+            await supabase_post("antecipacoes", chunk)
             inserted += len(chunk)
 
         return {
@@ -1112,7 +1662,7 @@ async def importar_antecipacoes_redash(
 
     url = f"{REDASH_BASE_URL.rstrip('/')}/api/queries/{REDASH_QUERY_ID}/results.csv"
     try:
-        r = requests.get(url, params={"api_key": REDASH_API_KEY}, timeout=30)
+        r = await get_async_client().get(url, params={"api_key": REDASH_API_KEY}, timeout=30)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao acessar Redash: {e}")
     if r.status_code != 200:
@@ -1142,7 +1692,7 @@ async def importar_antecipacoes_redash(
                 return row.get(key)
         return None
 
-    clinicas_rows = supabase_get_all("clinicas", select="id,cnpj,nome,codigo_clinica")
+    clinicas_rows = await supabase_get_all("clinicas", select="id,cnpj,nome,codigo_clinica")
     cnpj_to_ids = {}
     for row in clinicas_rows or []:
         cnpj_norm = _normalize_cnpj(row.get("cnpj"))
@@ -1239,11 +1789,12 @@ async def importar_antecipacoes_redash(
     existing_redash_refs = set()
     make_dup_key = None
     if clinica_ids:
-        ids_in = ",".join(sorted(clinica_ids))
-        limite_rows = supabase_get_all(
+        limite_rows = await supabase_get_all_in(
             "clinica_limite",
+            "clinica_id",
+            clinica_ids,
             select="clinica_id,limite_aprovado,aprovado_em",
-            extra_params={"clinica_id": f"in.({ids_in})", "order": "aprovado_em.desc"},
+            extra_params={"order": "aprovado_em.desc"},
         )
         for row in limite_rows or []:
             cid = _safe_str(row.get("clinica_id"))
@@ -1273,43 +1824,27 @@ async def importar_antecipacoes_redash(
                 )
 
         if replace:
-            supabase_delete(
+            await supabase_delete(
                 "antecipacoes",
                 extra_params={
                     "or": "(registrado_por.eq.import_redash,redash_id.not.is.null,observacao.like.redash:%)"
                 },
             )
 
-        antecipacoes_rows = supabase_get_all(
-            "antecipacoes",
-            select="clinica_id,valor_liquido,data_reembolso",
-            extra_params={"clinica_id": f"in.({ids_in})"},
-        )
-        df_ant = to_df(
-            antecipacoes_rows, ["clinica_id", "valor_liquido", "data_reembolso"]
-        )
-        if not df_ant.empty:
-            df_ant["valor_liquido"] = pd.to_numeric(
-                df_ant["valor_liquido"], errors="coerce"
-            ).fillna(0)
-            df_ant["reembolsado"] = df_ant["data_reembolso"].notna()
-            for cid, group in df_ant.groupby("clinica_id"):
-                total_antecipado = float(group["valor_liquido"].sum())
-                total_reembolsado = float(
-                    group[group["reembolsado"]]["valor_liquido"].sum()
-                )
-                aberto_map[_safe_str(cid)] = max(
-                    total_antecipado - total_reembolsado, 0.0
-                )
+        exposicao = await exposicao_por_clinica(clinica_ids)
+        for cid, exp_c in exposicao.items():
+            aberto_map[cid] = exp_c["em_aberto"]
 
         if not replace:
-            existente_params = {"clinica_id": f"in.({ids_in})"}
+            existente_params = {}
             if min_date and max_date:
                 existente_params["and"] = (
                     f"(data_antecipacao.gte.{min_date},data_antecipacao.lte.{max_date})"
                 )
-            existente_rows = supabase_get_all(
+            existente_rows = await supabase_get_all_in(
                 "antecipacoes",
+                "clinica_id",
+                clinica_ids,
                 select=(
                     "clinica_id,data_antecipacao,valor_liquido,valor_taxa,valor_a_pagar,"
                     "data_reembolso,observacao,redash_id"
@@ -1539,7 +2074,7 @@ async def importar_antecipacoes_redash(
     chunk_size = 500
     for i in range(0, len(payloads), chunk_size):
         chunk = payloads[i : i + chunk_size]
-        supabase_post("antecipacoes", chunk)
+        await supabase_post("antecipacoes", chunk)
         inserted += len(chunk)
 
     return {
@@ -1554,7 +2089,7 @@ async def importar_antecipacoes_redash(
 @app.get("/antecipacoes/redash-status")
 async def antecipacoes_redash_status():
     try:
-        rows = supabase_get(
+        rows = await supabase_get(
             "antecipacoes",
             select="criado_em,registrado_por",
             extra_params={
@@ -1577,6 +2112,70 @@ async def antecipacoes_redash_status():
 
 
 
+def _media_inadimplencia_real_por_clinica(dash_rows: list) -> dict[str, float]:
+    """Inadimplência real (ponderada por valor emitido) por clínica, ignorando o mês atual."""
+    media_inadimplencia_por_clinica: dict[str, float] = {}
+    df_dash = to_df(dash_rows)
+
+    if not df_dash.empty:
+        # Ignorar mês atual
+        hoje_utc = datetime.utcnow()
+        primeiro_dia_mes_atual = hoje_utc.replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0
+        ).date()
+        if "mes_ref_date" in df_dash.columns:
+            df_dash["mes_ref_date"] = pd.to_datetime(
+                df_dash["mes_ref_date"], errors="coerce"
+            )
+            df_dash = df_dash[
+                df_dash["mes_ref_date"].dt.date < primeiro_dia_mes_atual
+            ]
+
+        # Tipos numéricos e preenchimento de nulos
+        for col in [
+            "valor_total_emitido",
+            "taxa_pago_no_vencimento",
+            "taxa_inadimplencia",
+        ]:
+            if col in df_dash.columns:
+                df_dash[col] = pd.to_numeric(df_dash[col], errors="coerce")
+
+        df_dash = df_dash.fillna(
+            {
+                "valor_total_emitido": 0,
+                "taxa_pago_no_vencimento": 0,
+                "taxa_inadimplencia": 0,
+            }
+        )
+
+        # Cálculo da inadimplência real
+        df_dash["taxa_pago_no_vencimento"] = df_dash[
+            "taxa_pago_no_vencimento"
+        ].clip(0, 1)
+        df_dash["taxa_inad_dos_atrasados"] = df_dash["taxa_inadimplencia"].clip(0, 1)
+        df_dash["valor_nao_pago_no_venc"] = df_dash["valor_total_emitido"] * (
+            1 - df_dash["taxa_pago_no_vencimento"]
+        )
+        df_dash["valor_inad_real"] = (
+            df_dash["valor_nao_pago_no_venc"]
+            * df_dash["taxa_inad_dos_atrasados"]
+        )
+
+        # Agregar por clínica (média ponderada)
+        agg_df = df_dash.groupby("clinica_id").agg(
+            valor_inad_real_total=("valor_inad_real", "sum"),
+            valor_total_emitido_total=("valor_total_emitido", "sum"),
+        )
+
+        for cid, row in agg_df.iterrows():
+            emitido = row["valor_total_emitido_total"]
+            inad = row["valor_inad_real_total"]
+            if emitido > 0:
+                media_inadimplencia_por_clinica[str(cid)] = inad / emitido
+
+    return media_inadimplencia_por_clinica
+
+
 @app.get("/historico")
 async def listar_historico():
     """
@@ -1589,7 +2188,7 @@ async def listar_historico():
 
     # 1) Buscar importações + clínica
     try:
-        importacoes = supabase_get_all(
+        importacoes = await supabase_get_all(
             "importacoes",
             select=(
                 "id,clinica_id,arquivo_nome,total_linhas,status,criado_em,"
@@ -1615,17 +2214,21 @@ async def listar_historico():
     media_inadimplencia_por_clinica: dict[str, float] = {}
 
     if clinica_ids:
-        ids_in = ",".join(clinica_ids)
-
-        # 2.1 Boletos emitidos
-        try:
-            boletos_rows = supabase_get_all(
+        # 2.1 Boletos emitidos / 2.2 base da inadimplência REAL
+        boletos_rows, dash_rows = await asyncio.gather(
+            _get_all_in_ou_vazio(
                 "boletos_emitidos",
+                "clinica_id",
+                clinica_ids,
                 select="clinica_id,qtde",
-                extra_params={"clinica_id": f"in.({ids_in})"},
-            )
-        except Exception:
-            boletos_rows = []
+            ),
+            _get_all_in_ou_vazio(
+                "vw_dashboard_final",
+                "clinica_id",
+                clinica_ids,
+                select="clinica_id,mes_ref_date,valor_total_emitido,taxa_pago_no_vencimento,taxa_inadimplencia",
+            ),
+        )
 
         # Agregar boletos (soma)
         for row in boletos_rows or []:
@@ -1641,73 +2244,9 @@ async def listar_historico():
                 totais_boletos_por_clinica.get(cid, 0) + qtde
             )
 
-        # 2.2 Inadimplência REAL
-        try:
-            dash_rows = supabase_get_all(
-                "vw_dashboard_final",
-                select="clinica_id,mes_ref_date,valor_total_emitido,taxa_pago_no_vencimento,taxa_inadimplencia",
-                extra_params={"clinica_id": f"in.({ids_in})"},
-            )
-        except Exception:
-            dash_rows = []
-
-        df_dash = to_df(dash_rows)
-
-        if not df_dash.empty:
-            # Ignorar mês atual
-            hoje_utc = datetime.utcnow()
-            primeiro_dia_mes_atual = hoje_utc.replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0
-            ).date()
-            if "mes_ref_date" in df_dash.columns:
-                df_dash["mes_ref_date"] = pd.to_datetime(
-                    df_dash["mes_ref_date"], errors="coerce"
-                )
-                df_dash = df_dash[
-                    df_dash["mes_ref_date"].dt.date < primeiro_dia_mes_atual
-                ]
-
-            # Tipos numéricos e preenchimento de nulos
-            for col in [
-                "valor_total_emitido",
-                "taxa_pago_no_vencimento",
-                "taxa_inadimplencia",
-            ]:
-                if col in df_dash.columns:
-                    df_dash[col] = pd.to_numeric(df_dash[col], errors="coerce")
-
-            df_dash = df_dash.fillna(
-                {
-                    "valor_total_emitido": 0,
-                    "taxa_pago_no_vencimento": 0,
-                    "taxa_inadimplencia": 0,
-                }
-            )
-
-            # Cálculo da inadimplência real
-            df_dash["taxa_pago_no_vencimento"] = df_dash[
-                "taxa_pago_no_vencimento"
-            ].clip(0, 1)
-            df_dash["taxa_inad_dos_atrasados"] = df_dash["taxa_inadimplencia"].clip(0, 1)
-            df_dash["valor_nao_pago_no_venc"] = df_dash["valor_total_emitido"] * (
-                1 - df_dash["taxa_pago_no_vencimento"]
-            )
-            df_dash["valor_inad_real"] = (
-                df_dash["valor_nao_pago_no_venc"]
-                * df_dash["taxa_inad_dos_atrasados"]
-            )
-
-            # Agregar por clínica (média ponderada)
-            agg_df = df_dash.groupby("clinica_id").agg(
-                valor_inad_real_total=("valor_inad_real", "sum"),
-                valor_total_emitido_total=("valor_total_emitido", "sum"),
-            )
-
-            for cid, row in agg_df.iterrows():
-                emitido = row["valor_total_emitido_total"]
-                inad = row["valor_inad_real_total"]
-                if emitido > 0:
-                    media_inadimplencia_por_clinica[str(cid)] = inad / emitido
+        media_inadimplencia_por_clinica = await run_in_threadpool(
+            _media_inadimplencia_real_por_clinica, dash_rows
+        )
 
     # 3) Enriquecer cada registro do histórico com os totais reais
     historico_enriquecido = []
@@ -1741,27 +2280,37 @@ async def dashboard_resumo_geral():
 
     try:
         # --- Tabelas base ---
-        boletos_rows = supabase_get_all(
-            "boletos_emitidos", select="clinica_id,mes_ref,qtde,valor_total"
+        (
+            df_boletos,
+            df_inad,
+            df_taxa_venc,
+            df_tempo,
+            df_ticket,
+        ) = await asyncio.gather(
+            supabase_get_df(
+                "boletos_emitidos", select="clinica_id,mes_ref,qtde,valor_total"
+            ),
+            supabase_get_df("inadimplencia", select="clinica_id,mes_ref,taxa"),
+            supabase_get_df("taxa_pago_no_vencimento", select="clinica_id,mes_ref,taxa"),
+            supabase_get_df("tempo_medio_pagamento", select="clinica_id,mes_ref,dias"),
+            supabase_get_df("valor_medio_boleto", select="clinica_id,mes_ref,valor"),
         )
-        inad_rows = supabase_get_all("inadimplencia", select="clinica_id,mes_ref,taxa")
-        taxa_venc_rows = supabase_get_all("taxa_pago_no_vencimento", select="clinica_id,mes_ref,taxa")
-        tempo_rows = supabase_get_all("tempo_medio_pagamento", select="clinica_id,mes_ref,dias")
-        ticket_rows = supabase_get_all("valor_medio_boleto", select="clinica_id,mes_ref,valor")
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Erro ao carregar dados do Supabase: {e}"
         )
 
-    # ----------------------
-    # DataFrames
-    # ----------------------
-    df_boletos = to_df(boletos_rows, ["clinica_id", "mes_ref", "qtde", "valor_total"])
-    df_inad = to_df(inad_rows, ["clinica_id", "mes_ref", "taxa"])
-    df_taxa_venc = to_df(taxa_venc_rows, ["clinica_id", "mes_ref", "taxa"])
-    df_tempo = to_df(tempo_rows, ["clinica_id", "mes_ref", "dias"])
-    df_ticket = to_df(ticket_rows, ["clinica_id", "mes_ref", "valor"])
+    return await run_in_threadpool(
+        _montar_resumo_geral,
+        df_boletos,
+        df_inad,
+        df_taxa_venc,
+        df_tempo,
+        df_ticket,
+    )
 
+
+def _montar_resumo_geral(df_boletos, df_inad, df_taxa_venc, df_tempo, df_ticket):
     # Garantir tipos numéricos
     if not df_boletos.empty:
         df_boletos["qtde"] = pd.to_numeric(df_boletos["qtde"], errors="coerce").fillna(
@@ -1969,46 +2518,73 @@ def _safe_str(v):
     return str(v)
 
 
-def _format_mes_ref(dt: Timestamp | None):
-    if dt is None or pd.isna(dt):
-        return None
+def _mes_idx(datas: pd.Series) -> pd.Series:
+    """Índice inteiro do mês (ano*12 + mês-1): janelas viram aritmética inteira."""
+    return (datas.dt.year * 12 + datas.dt.month - 1).astype("int32")
+
+
+def _mes_idx_de(dt) -> int:
+    return int(dt.year * 12 + dt.month - 1)
+
+
+def _mes_ref_de_idx(idx: int) -> str:
+    return f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+
+
+def _meses_ref_de_idx(idx: pd.Series) -> pd.Series:
+    """Rótulos "YYYY-MM" de uma coluna de índices (formata só os distintos)."""
+    return idx.map({i: _mes_ref_de_idx(int(i)) for i in idx.unique()})
+
+
+def _format_mes_ref(dt: Timestamp | None):
+    if dt is None or pd.isna(dt):
+        return None
     try:
         return dt.strftime("%Y-%m")
     except Exception:
         return None
 
 
-def _cutoff_mes_fechado_por_importacao(df_importacoes: pd.DataFrame, clinica_id: str):
-    """
-    Retorna o último mês fechado com base no mês da última importação.
-    Regra: o mês fechado é o mês imediatamente anterior ao mês do upload.
-    """
-    if df_importacoes is None or df_importacoes.empty or not clinica_id:
-        return None
-    df_clin = df_importacoes[df_importacoes["clinica_id"] == clinica_id].copy()
-    if df_clin.empty:
-        return None
-    df_clin["criado_em"] = pd.to_datetime(df_clin["criado_em"], errors="coerce")
-    df_clin = df_clin.dropna(subset=["criado_em"])
-    if df_clin.empty:
-        return None
-    ultimo_upload = df_clin["criado_em"].max()
-    mes_upload = pd.Timestamp(ultimo_upload).to_period("M").to_timestamp()
-    return mes_upload - pd.Timedelta(days=1)
+COLUNAS_CUTOFFS = ["ultimo_upload", "mes_upload_ref", "cutoff_dt"]
 
 
-def _mes_upload_por_importacao(df_importacoes: pd.DataFrame, clinica_id: str):
-    if df_importacoes is None or df_importacoes.empty or not clinica_id:
-        return None
-    df_clin = df_importacoes[df_importacoes["clinica_id"] == clinica_id].copy()
-    if df_clin.empty:
-        return None
-    df_clin["criado_em"] = pd.to_datetime(df_clin["criado_em"], errors="coerce")
-    df_clin = df_clin.dropna(subset=["criado_em"])
-    if df_clin.empty:
-        return None
-    ultimo_upload = df_clin["criado_em"].max()
-    return _format_mes_ref(pd.Timestamp(ultimo_upload))
+def _tabela_cutoffs(df_importacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    clinica_id -> (ultimo_upload, mes_upload_ref, cutoff_dt) numa única
+    passada agrupada sobre as importações. Regra: o mês fechado é o mês
+    imediatamente anterior ao mês do último upload; cutoff_dt é o seu
+    último dia. Clínicas sem upload válido ficam de fora.
+    """
+    vazio = pd.DataFrame(columns=COLUNAS_CUTOFFS, index=pd.Index([], name="clinica_id"))
+    if df_importacoes is None or df_importacoes.empty:
+        return vazio
+    # ISO 8601 explícito: a inferência pelo primeiro valor descartaria
+    # timestamps com outra quantidade de casas decimais
+    criado_em = pd.to_datetime(df_importacoes["criado_em"], errors="coerce", format="ISO8601")
+    if criado_em.dt.tz is not None:
+        criado_em = criado_em.dt.tz_localize(None)
+    ultimo = criado_em.groupby(df_importacoes["clinica_id"]).max().dropna()
+    if ultimo.empty:
+        return vazio
+    mes_upload = ultimo.dt.to_period("M").dt.to_timestamp()
+    tabela = pd.DataFrame({
+        "ultimo_upload": ultimo,
+        "mes_upload_ref": ultimo.dt.strftime("%Y-%m"),
+        "cutoff_dt": mes_upload - pd.Timedelta(days=1),
+    })
+    tabela.index = tabela.index.map(str).rename("clinica_id")
+    return tabela
+
+
+def _cutoffs_clinicas(tabela_cutoffs: pd.DataFrame, clinica_ids, padrao, max_dt) -> pd.Series:
+    """
+    Corte de cada clínica pela tabela de cutoffs; sem upload, `padrao`.
+    Nunca passa do último mês disponível (`max_dt`).
+    """
+    ids = pd.Index([str(cid) for cid in clinica_ids], name="clinica_id")
+    cutoffs = tabela_cutoffs["cutoff_dt"].reindex(ids)
+    cutoffs = pd.to_datetime(cutoffs).fillna(padrao)
+    return cutoffs.where(cutoffs <= max_dt, max_dt)
     
 
 # ==========================
@@ -2053,7 +2629,7 @@ async def listar_clinicas_dashboard():
     para uso no filtro do dashboard de crédito & risco.
     """
     try:
-        rows = supabase_get_all(
+        rows = await supabase_get_all(
             "vw_dashboard_final",
             select="clinica_id,clinica_nome,cnpj",
         )
@@ -2076,7 +2652,7 @@ async def listar_clinicas_dashboard():
     clinicas = []
     clinicas_info_map = {}
     try:
-        clinicas_rows = supabase_get_all(
+        clinicas_rows = await supabase_get_all(
             "clinicas",
             select="id,cnpj,nome,codigo_clinica",
         )
@@ -2109,23 +2685,39 @@ async def listar_clinicas_dashboard():
     return clinicas
 
 
+# Faixas de score: (limite inferior inclusivo, valor), em ordem decrescente.
+# Usadas tanto pelas funções escalares quanto pelas versões sobre arrays.
+FAIXAS_FATOR_LIMITE = ((0.80, 0.90), (0.70, 0.75), (0.60, 0.60), (0.50, 0.45), (0.40, 0.35), (0.20, 0.25))
+FATOR_LIMITE_MINIMO = 0.15
+FAIXAS_CATEGORIA = ((0.80, "A"), (0.60, "B"), (0.40, "C"), (0.20, "D"))
+CATEGORIA_MINIMA = "E"
+
+
+def _faixa(s, faixas, minimo):
+    for limite, valor in faixas:
+        if s >= limite:
+            return valor
+    return minimo
+
+
+def _faixa_arr(scores: np.ndarray, faixas, minimo) -> np.ndarray:
+    """Primeira faixa cujo limite o score atinge; NaN cai no mínimo."""
+    return np.select([scores >= limite for limite, _ in faixas], [valor for _, valor in faixas], default=minimo)
+
+
+def _scores_arr(valores) -> np.ndarray:
+    return pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
 def _fator_limite_score(s):
     s = _safe_float(s)
     if s is None:
-        return 0.15
-    if s >= 0.80:
-        return 0.90
-    if s >= 0.70:
-        return 0.75
-    if s >= 0.60:
-        return 0.60
-    if s >= 0.50:
-        return 0.45
-    if s >= 0.40:
-        return 0.35
-    if s >= 0.20:
-        return 0.25
-    return 0.15
+        return FATOR_LIMITE_MINIMO
+    return _faixa(s, FAIXAS_FATOR_LIMITE, FATOR_LIMITE_MINIMO)
+
+
+def _fator_limite_score_arr(scores) -> np.ndarray:
+    return _faixa_arr(_scores_arr(scores), FAIXAS_FATOR_LIMITE, FATOR_LIMITE_MINIMO)
 
 def _clamp01(x):
     try:
@@ -2148,523 +2740,1511 @@ def _calc_score_row(row):
     score = 1.0 - (0.50 * risk_inad + 0.25 * risk_atraso + 0.15 * risk_dias + 0.10 * risk_parc)
     return max(0.0, min(1.0, score))
 
+
+def _clamp01_arr(x: np.ndarray) -> np.ndarray:
+    return np.nan_to_num(np.clip(x, 0.0, 1.0), nan=0.0)
+
+
+def _calc_score_df(df: pd.DataFrame) -> pd.Series:
+    """
+    Mesmo cálculo de `_calc_score_row`, coluna a coluna: pesos, divisores e
+    clamp idênticos; coluna ausente ou valor nulo/não numérico não gera risco.
+    """
+    def col(nome):
+        if nome not in df.columns:
+            return np.full(len(df), np.nan)
+        return _scores_arr(df[nome].to_numpy())
+
+    risk_inad = _clamp01_arr(col("taxa_inadimplencia_real") / 0.03)
+    risk_atraso = _clamp01_arr((1.0 - col("taxa_pago_no_vencimento")) / 0.25)
+    risk_dias = _clamp01_arr((col("tempo_medio_pagamento_dias") - 5.0) / 60.0)
+    risk_parc = _clamp01_arr((col("parc_media_parcelas_pond") - 1.0) / 11.0)
+    score = 1.0 - (0.50 * risk_inad + 0.25 * risk_atraso + 0.15 * risk_dias + 0.10 * risk_parc)
+    return pd.Series(np.clip(score, 0.0, 1.0), index=df.index, dtype="float64")
+
 def _categoria_from_score(s):
     s = _safe_float(s)
     if s is None: return None
-    if s >= 0.80: return "A"
-    if s >= 0.60: return "B"
-    if s >= 0.40: return "C"
-    if s >= 0.20: return "D"
-    return "E"
+    return _faixa(s, FAIXAS_CATEGORIA, CATEGORIA_MINIMA)
+
+
+def _categoria_from_score_arr(scores) -> np.ndarray:
+    """Categorias A-E por faixa; score nulo vira None (objeto)."""
+    s = _scores_arr(scores)
+    cat = _faixa_arr(s, FAIXAS_CATEGORIA, CATEGORIA_MINIMA).astype(object)
+    cat[np.isnan(s)] = None
+    return cat
+
+LIMITE_TETO_GLOBAL = 3_000_000.0
+
+# Ordem da tupla devolvida por `_calculate_limite_sugerido`
+COMPONENTES_LIMITE = [
+    "limite_sugerido", "base_media12m", "base_media3m", "base_ultimo_mes",
+    "base_mensal_mix", "fator", "share_portfolio_12m",
+]
+
+
+def _calcular_limites_sugeridos(
+    df_full: pd.DataFrame,
+    cutoffs: pd.Series,
+    particao: dict | None = None,
+    emitido_por_mes: pd.Series | None = None,
+) -> pd.DataFrame:
+    """
+    Limite sugerido e componentes de todas as clínicas de `cutoffs`
+    (clinica_id -> último mês fechado, NaT = sem corte) em poucas passadas
+    agrupadas. Com `particao` (do snapshot), só as linhas dessas clínicas
+    são lidas; com `emitido_por_mes` (mes_idx -> emissão do portfólio), o
+    share de 12m também não varre o frame inteiro. Retorna um DataFrame
+    indexado por clinica_id com as colunas de COMPONENTES_LIMITE;
+    componente ausente fica NaN.
+    """
+    cutoffs = pd.to_datetime(pd.Series(cutoffs, dtype=object), errors="coerce")
+    cutoffs.index = cutoffs.index.map(str)
+    cutoffs = cutoffs[~cutoffs.index.duplicated()]
+    vazio = pd.DataFrame(np.nan, index=cutoffs.index.rename("clinica_id"), columns=COMPONENTES_LIMITE)
+    if df_full.empty or cutoffs.empty:
+        return vazio
+
+    df_clin = df_full if particao is None else _linhas_clinicas(df_full, particao, cutoffs.index)
+    # Corte por mês: linhas do mês do cutoff ou anteriores (NaN = sem corte)
+    corte_idx = _mes_idx(cutoffs[cutoffs.notna()])
+    clinicas = df_clin["clinica_id"].astype(object)
+    corte = clinicas.map(corte_idx)
+    dentro = clinicas.isin(cutoffs.index) & (corte.isna() | (df_clin["mes_idx"] <= corte))
+    if not dentro.any():
+        return vazio
+
+    chave = clinicas[dentro]
+    meses = df_clin.loc[dentro, "mes_idx"]
+    valor = df_clin.loc[dentro, "valor_total_emitido"]
+    ultimo = meses.groupby(chave).transform("max")
+    inicio_12m = ultimo - 11
+    em_12m = meses >= inicio_12m
+    no_ultimo = meses == ultimo
+
+    res = pd.DataFrame({
+        "total_emit_12m": valor.where(em_12m).groupby(chave).sum(),
+        "n_meses_12m": meses.where(em_12m).groupby(chave).nunique(),
+        "base_media3m": valor.where(meses >= ultimo - 2).groupby(chave).mean(),
+        "base_ultimo_mes": valor.where(no_ultimo).groupby(chave).sum(),
+        "score_ultimo_mes": df_clin.loc[dentro, "score_ajustado"].where(no_ultimo).groupby(chave).mean(),
+        "inicio_12m": inicio_12m.groupby(chave).first(),
+    })
+    res["base_media12m"] = (res["total_emit_12m"] / res["n_meses_12m"]).where(res["n_meses_12m"] > 0)
+
+    # Mesma média ponderada de `componentes`/`pesos`, só com as bases presentes
+    pesos = {"base_media12m": 0.50, "base_media3m": 0.30, "base_ultimo_mes": 0.20}
+    soma = pd.Series(0.0, index=res.index)
+    soma_pesos = pd.Series(0.0, index=res.index)
+    for col, peso in pesos.items():
+        presente = res[col].notna()
+        soma = soma + (peso * res[col]).where(presente, 0.0)
+        soma_pesos = soma_pesos + presente * peso
+    res["base_mensal_mix"] = (soma / soma_pesos).where(soma_pesos > 0)
+    res["fator"] = _fator_limite_score_arr(res["score_ultimo_mes"])
+
+    # Emissão do portfólio inteiro desde o início da janela de 12m: uma soma
+    # por data de início distinta (na prática, poucas), não uma por clínica
+    if emitido_por_mes is None:
+        totais_portfolio = {
+            inicio: _safe_float(df_full.loc[df_full["mes_idx"] >= inicio, "valor_total_emitido"].sum())
+            for inicio in res["inicio_12m"].unique()
+        }
+    else:
+        totais_portfolio = {
+            inicio: _safe_float(emitido_por_mes[emitido_por_mes.index >= inicio].sum())
+            for inicio in res["inicio_12m"].unique()
+        }
+    total_portfolio = res["inicio_12m"].map(totais_portfolio).astype("float64")
+    res["share_portfolio_12m"] = (res["total_emit_12m"] / total_portfolio).where(total_portfolio > 0)
+
+    bruto = res["base_mensal_mix"].fillna(0.0) * res["fator"].fillna(0.0)
+    maior_base = res[["base_media12m", "base_media3m", "base_ultimo_mes"]].clip(lower=0).max(axis=1).fillna(0.0)
+    teto = np.minimum(1.5 * maior_base, LIMITE_TETO_GLOBAL)
+    res["limite_sugerido"] = np.minimum(bruto, teto).where(bruto > 0)
+
+    res.index.name = "clinica_id"
+    return res[COMPONENTES_LIMITE].reindex(cutoffs.index).astype("float64")
+
 
 def _calculate_limite_sugerido(
     clinica_id: str,
     df_full: pd.DataFrame,
     cutoff_dt: "Timestamp | None" = None,
+    particao: dict | None = None,
 ):
     """
     Calcula o limite de crédito sugerido e seus componentes para uma única clínica.
     Retorna uma tupla com todos os componentes calculados.
     """
-    LIMITE_TETO_GLOBAL = 3_000_000.0
-    
-    resultados = {
-        "limite_sugerido": None, "base_media12m": None, "base_media3m": None,
-        "base_ultimo_mes": None, "base_mensal_mix": None, "fator": None, "share_portfolio_12m": None,
+    cutoffs = pd.Series({str(clinica_id): cutoff_dt}, dtype=object)
+    linha = _calcular_limites_sugeridos(df_full, cutoffs, particao).iloc[0]
+    return tuple(_safe_float(linha[c]) for c in COMPONENTES_LIMITE)
+
+
+def _motores_limite(
+    df: pd.DataFrame,
+    particao: dict,
+    tabela_cutoffs: pd.DataFrame,
+    resumo_mensal: pd.DataFrame,
+    clinica_ids,
+) -> dict:
+    """
+    Campos do motor de limite (os mesmos de `limite_motor` no /dashboard)
+    para várias clínicas numa única passada de `_calcular_limites_sugeridos`.
+    Só lê as linhas dessas clínicas e o `resumo_mensal` do snapshot.
+    Retorna {clinica_id: motor}; o corte segue a regra do mês anterior ao upload.
+    """
+    ids = list(dict.fromkeys(map(str, clinica_ids)))
+    if not ids:
+        return {}
+    hoje_utc = datetime.utcnow().date()
+    first_day = hoje_utc.replace(day=1)
+    cutoffs = _cutoffs_clinicas(
+        tabela_cutoffs, ids, pd.to_datetime(first_day) - pd.Timedelta(days=1),
+        resumo_mensal["mes_ref_date"].max(),
+    )
+    limites = _calcular_limites_sugeridos(df, cutoffs, particao, resumo_mensal["valor_total_emitido"])
+
+    motores = {}
+    for cid in ids:
+        cutoff_dt = cutoffs.loc[cid]
+        # Meses da clínica já vêm ordenados no snapshot: busca binária pelo corte
+        meses_clin = _linhas_clinica(df, particao, cid)["mes_idx"].to_numpy()
+        n_ate_corte = (
+            int(np.searchsorted(meses_clin, _mes_idx_de(cutoff_dt), side="right"))
+            if pd.notna(cutoff_dt) else len(meses_clin)
+        )
+        componentes = [_safe_float(v) for v in limites.loc[cid, COMPONENTES_LIMITE]]
+        (
+            limite_sugerido, base_media12m, base_media3m, base_ultimo_mes,
+            base_mensal_mix, fator, share_portfolio_12m
+        ) = componentes
+        motores[cid] = {
+            "mes_ref_base": _mes_ref_de_idx(int(meses_clin[n_ate_corte - 1])) if n_ate_corte else None,
+            "mes_ref_regra": _format_mes_ref(pd.Timestamp(cutoff_dt)),
+            "mes_upload_referencia": tabela_cutoffs["mes_upload_ref"].get(cid),
+            "regra_limite": "mes_anterior_ao_upload",
+            "limite_sugerido": limite_sugerido,
+            "limite_sugerido_base_media12m": base_media12m,
+            "limite_sugerido_base_media3m": base_media3m,
+            "limite_sugerido_base_ultimo_mes": base_ultimo_mes,
+            "limite_sugerido_base_mensal_mix": base_mensal_mix,
+            "limite_sugerido_fator": fator,
+            "limite_sugerido_teto_global": LIMITE_TETO_GLOBAL,
+            "limite_sugerido_share_portfolio_12m": share_portfolio_12m,
+        }
+    return motores
+
+# ==========================
+# SNAPSHOT DO PORTFÓLIO
+# ==========================
+
+_snapshot: dict | None = None
+_snapshot_versao = 0
+_snapshot_lock = asyncio.Lock()
+
+
+def invalidar_snapshot():
+    """
+    Vence o snapshot (memória e disco); leituras em andamento não o repõem.
+    O snapshot vencido fica como base da próxima sincronização incremental.
+    """
+    global _snapshot_versao
+    _snapshot_versao += 1
+    _registrar_escrita()
+    if PORTFOLIO_SNAPSHOT_DIR:
+        snapshot_disco.remover(PORTFOLIO_SNAPSHOT_DIR)
+
+
+def _enriquecer_portfolio(df: pd.DataFrame) -> pd.DataFrame:
+    """Tipos, inadimplência real, score e categoria ajustados da vw_dashboard_final."""
+    if df.empty:
+        return df
+    df["mes_ref_date"] = pd.to_datetime(df.get("mes_ref_date", df.get("mes_ref")), errors="coerce")
+    df = df.dropna(subset=["mes_ref_date"])
+    df["mes_idx"] = _mes_idx(df["mes_ref_date"])
+
+    numeric_cols = ["valor_total_emitido", "taxa_pago_no_vencimento", "taxa_inadimplencia", "tempo_medio_pagamento_dias", "parc_media_parcelas_pond", "valor_medio_boleto", "limite_aprovado"]
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df["taxa_pago_no_vencimento"] = df["taxa_pago_no_vencimento"].clip(0, 1).fillna(0)
+    df["taxa_inadimplencia"] = df["taxa_inadimplencia"].clip(0, 1).fillna(0)
+    df["valor_nao_pago_no_venc"] = df["valor_total_emitido"].fillna(0) * (1 - df["taxa_pago_no_vencimento"])
+    df["valor_inad_real"] = df["valor_nao_pago_no_venc"] * df["taxa_inadimplencia"]
+    df["taxa_inadimplencia_real"] = (df["valor_inad_real"] / df["valor_total_emitido"]).where(df["valor_total_emitido"] > 0, 0)
+    df["taxa_inadimplencia"] = df["taxa_inadimplencia_real"]
+    df["score_ajustado"] = _calc_score_df(df)
+    df["categoria_risco_ajustada"] = pd.Series(_categoria_from_score_arr(df["score_ajustado"]), index=df.index).infer_objects()
+    return df
+
+
+def _clinicas_info_map(clinicas_rows: list) -> dict:
+    clinicas_info_map = {}
+    for row in clinicas_rows or []:
+        cid = _safe_str(row.get("id"))
+        if not cid:
+            continue
+        clinicas_info_map[cid] = {
+            "codigo_clinica": _safe_str(row.get("codigo_clinica")) or _safe_str(row.get("nome")),
+            "nome": _safe_str(row.get("nome")),
+            "cnpj": _safe_str(row.get("cnpj")),
+        }
+    return clinicas_info_map
+
+
+def _utilizacao_por_clinica(df_exp: pd.DataFrame) -> dict:
+    """Valor antecipado ainda não reembolsado, por clínica."""
+    if df_exp.empty:
+        return {}
+    return dict(zip(df_exp["clinica_id"].astype(str), df_exp["em_aberto"].astype(float)))
+
+
+def _linhas_do_frame(df: pd.DataFrame) -> list:
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _uniao_colunas(*listas) -> list:
+    """União das colunas, na ordem em que aparecem."""
+    return list(dict.fromkeys(c for lista in listas for c in lista))
+
+
+SELECT_PORTFOLIO = ",".join(_uniao_colunas(*COLUNAS_PORTFOLIO.values()))
+
+
+def _montar_snapshot(
+    frames: dict,
+    versao: int,
+    marcas: dict | None,
+    idade: float = 0.0,
+    mes_idx_carga: int | None = None,
+    baixado_em: float | None = None,
+) -> dict:
+    """
+    Deriva os mapas do snapshot a partir dos frames (vindos do Supabase, do
+    disco ou de uma sincronização). `frames`: portfolio (já enriquecido, a
+    partir do mês `mes_idx_carga`; None = histórico inteiro), importacoes,
+    clinicas, exposicao (rpc exposicao_por_clinica) e resumo_mensal (rpc
+    resumo_mensal_dashboard). `baixado_em` (time.time()) é a última carga
+    completa da qual os frames descendem; None = agora.
+    """
+    df = frames["portfolio"]
+    return {
+        "versao": versao,
+        "marcas": marcas,
+        "versao_dados": _carimbo(marcas),
+        "carregado_em": time.monotonic() - idade,
+        "baixado_em": time.time() if baixado_em is None else baixado_em,
+        "frames": frames,
+        "df": df,
+        "mes_idx_carga": mes_idx_carga,
+        "particao": _particionar_por_clinica(df),
+        "resumo_mensal": _resumo_mensal_snapshot(frames.get("resumo_mensal"), df),
+        "cutoffs": _tabela_cutoffs(frames["importacoes"]),
+        "clinicas_info_map": _clinicas_info_map(_linhas_do_frame(frames["clinicas"])),
+        "utilizacao_por_clinica": _utilizacao_por_clinica(frames["exposicao"]),
+        # Ranking por período, preenchido sob demanda pelo /dashboard
+        "cache_ranking": {},
+        # Snapshot estendido com meses anteriores à carga (`_snapshot_desde`)
+        "cache_historico": {},
     }
 
-    df_clin_all = df_full[df_full["clinica_id"] == clinica_id].copy()
-    if cutoff_dt is not None and not pd.isna(cutoff_dt):
-        df_clin_all = df_clin_all[df_clin_all["mes_ref_date"] <= cutoff_dt].copy()
-    if df_clin_all.empty:
-        return tuple(resultados.values())
-
-    last_dt_clin = df_clin_all["mes_ref_date"].max()
-
-    if pd.isna(last_dt_clin):
-        return tuple(resultados.values())
-
-    dt_inicio_12m = last_dt_clin - pd.DateOffset(months=11)
-    df_clin_12m = df_clin_all[df_clin_all["mes_ref_date"] >= dt_inicio_12m].copy()
-    total_emit_12m = _safe_float(df_clin_12m["valor_total_emitido"].sum())
-    n_meses_12m = int(df_clin_12m["mes_ref_date"].nunique() or 0)
-    if n_meses_12m > 0 and total_emit_12m is not None:
-        resultados["base_media12m"] = total_emit_12m / n_meses_12m
-
-    dt_inicio_3m = last_dt_clin - pd.DateOffset(months=2)
-    df_last3 = df_clin_all[(df_clin_all["mes_ref_date"] >= dt_inicio_3m) & (df_clin_all["mes_ref_date"] <= last_dt_clin)].copy()
-    if not df_last3.empty:
-        resultados["base_media3m"] = _safe_float(df_last3["valor_total_emitido"].mean())
-
-    df_ultimo_mes = df_clin_all[df_clin_all["mes_ref_date"] == last_dt_clin].copy()
-    if not df_ultimo_mes.empty:
-        resultados["base_ultimo_mes"] = _safe_float(df_ultimo_mes["valor_total_emitido"].sum())
-
-    componentes, pesos = [], []
-    if resultados["base_media12m"] is not None: componentes.append(resultados["base_media12m"]); pesos.append(0.50)
-    if resultados["base_media3m"] is not None: componentes.append(resultados["base_media3m"]); pesos.append(0.30)
-    if resultados["base_ultimo_mes"] is not None: componentes.append(resultados["base_ultimo_mes"]); pesos.append(0.20)
-    
-    if componentes and sum(pesos) > 0:
-        resultados["base_mensal_mix"] = sum(c * p for c, p in zip(componentes, pesos)) / sum(pesos)
 
-    if not df_ultimo_mes.empty:
-        score_para_limite = _safe_float(df_ultimo_mes["score_ajustado"].mean())
-        resultados["fator"] = _fator_limite_score(score_para_limite)
+def _snapshot_valido(snap: dict | None) -> bool:
+    return (
+        snap is not None
+        and snap["versao"] == _snapshot_versao
+        and time.monotonic() - snap["carregado_em"] < PORTFOLIO_SNAPSHOT_TTL
+    )
+
+
+def _ordenar_portfolio(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Linhas de cada clínica contíguas e em ordem de mês: (nome, id, mês).
+    Com nomes distintos coincide com a ordem da view (nome, mês, id), e é a
+    mesma após carga completa ou incremental.
+    """
+    if df.empty:
+        return df
+    # Nome único por clínica: garante a contiguidade mesmo se o nome variar
+    nome = df.groupby("clinica_id", observed=True)["clinica_nome"].transform("first")
+    return (
+        df.assign(_nome_ordem=nome)
+        .sort_values(
+            ["_nome_ordem", "clinica_id", "mes_ref_date"],
+            kind="mergesort",
+            key=lambda c: c.astype(str) if c.name == "clinica_id" else c,
+        )
+        .drop(columns="_nome_ordem")
+        .reset_index(drop=True)
+    )
+
+
+def _particionar_por_clinica(df: pd.DataFrame) -> dict:
+    """
+    clinica_id -> (início, fim) das linhas da clínica num frame em que elas
+    são contíguas (snapshot ordenado ou qualquer recorte dele), na ordem em
+    que as clínicas aparecem.
+    """
+    if df.empty:
+        return {}
+    codigos, ids = pd.factorize(df["clinica_id"])
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+    fins = np.r_[inicios[1:], len(codigos)]
+    return {
+        str(ids[codigos[i]]): (int(i), int(f))
+        for i, f in zip(inicios, fins)
+        if codigos[i] >= 0
+    }
 
-    df_port_12m = df_full[df_full["mes_ref_date"] >= dt_inicio_12m].copy()
-    if not df_port_12m.empty and total_emit_12m is not None:
-        total_emit_portfolio_12m = _safe_float(df_port_12m["valor_total_emitido"].sum())
-        if total_emit_portfolio_12m and total_emit_portfolio_12m > 0:
-            resultados["share_portfolio_12m"] = _safe_float(total_emit_12m / total_emit_portfolio_12m)
 
-    base_para_limite = resultados["base_mensal_mix"] or 0.0
-    fator_limite = resultados["fator"] or 0.0
-    bruto = base_para_limite * fator_limite
+def _resumo_mensal_portfolio(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agregado do portfólio por mes_idx (ordenado): emissão total e data do
+    mês. Basta para `todos_meses`, o último mês e o share de 12m sem varrer
+    as linhas de todas as clínicas.
+    """
+    if df.empty:
+        return pd.DataFrame(
+            {"valor_total_emitido": pd.Series(dtype="float64"), "mes_ref_date": pd.Series(dtype="datetime64[ns]")},
+            index=pd.Index([], dtype="int32", name="mes_idx"),
+        )
+    return df.groupby("mes_idx").agg(
+        valor_total_emitido=("valor_total_emitido", "sum"),
+        mes_ref_date=("mes_ref_date", "max"),
+    )
 
-    if bruto > 0:
-        bases_validas = [b for b in [resultados["base_media12m"], resultados["base_media3m"], resultados["base_ultimo_mes"]] if b is not None and b > 0]
-        maior_base = max(bases_validas) if bases_validas else 0
-        teto_dinamico = 1.5 * maior_base
-        resultados["limite_sugerido"] = min(bruto, teto_dinamico, LIMITE_TETO_GLOBAL)
 
-    return tuple(resultados.values())
+def _resumo_mensal_snapshot(df_resumo: pd.DataFrame | None, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `_resumo_mensal_portfolio` a partir do agregado do banco, que cobre
+    também os meses fora da janela carregada; sem ele, das linhas carregadas.
+    Sem a rpc o banco traz só o primeiro mês da view: os meses e valores vêm
+    das linhas carregadas, e esse mês entra sem valor (para o mínimo dos
+    filtros).
+    """
+    if df_resumo is None or df_resumo.empty:
+        return _resumo_mensal_portfolio(df)
+    datas = pd.to_datetime(df_resumo["mes_ref_date"])
+    resumo = df_resumo.assign(mes_ref_date=datas, mes_idx=_mes_idx(datas)).groupby("mes_idx").agg(
+        valor_total_emitido=("valor_total_emitido", "sum"),
+        mes_ref_date=("mes_ref_date", "max"),
+    )
+    if df_resumo["valor_total_emitido"].notna().any():
+        return resumo
+    resumo["valor_total_emitido"] = np.nan
+    return _resumo_mensal_portfolio(df).combine_first(resumo)[list(resumo.columns)]
+
+
+def _linhas_clinica(df: pd.DataFrame, particao: dict, clinica_id) -> pd.DataFrame:
+    """Linhas de uma clínica como fatia do frame (sem cópia)."""
+    inicio, fim = particao.get(str(clinica_id), (0, 0))
+    return df.iloc[inicio:fim]
+
+
+def _linhas_clinicas(df: pd.DataFrame, particao: dict, clinica_ids) -> pd.DataFrame:
+    """Linhas de várias clínicas; custo proporcional às linhas delas."""
+    faixas = [particao[c] for c in dict.fromkeys(map(str, clinica_ids)) if c in particao]
+    if len(faixas) == 1:
+        return df.iloc[faixas[0][0]:faixas[0][1]]
+    if not faixas:
+        return df.iloc[0:0]
+    return df.take(np.concatenate([np.arange(i, f) for i, f in faixas]))
+
+
+# ---- Marcas d'água / carimbo de versão ----
+
+# nome -> (tabela, coluna, filtros). A contagem e o maior valor de cada
+# marca formam o carimbo de versão do snapshot; o maior valor também é a
+# marca d'água da sincronização incremental.
+MARCAS_SNAPSHOT = {
+    "importacoes": ("importacoes", "criado_em", None),
+    "antecipacoes": ("antecipacoes", "criado_em", None),
+    "antecipacoes_reembolso": ("antecipacoes", "data_reembolso", {"data_reembolso": "not.is.null"}),
+    "antecipacoes_atualizacao": ("antecipacoes", "atualizado_em", None),
+    "clinica_limite": ("clinica_limite", "aprovado_em", None),
+    "clinicas": ("clinicas", "id", None),
+}
 
-@app.get("/dashboard", response_model=DashboardData)
-async def dashboard_completo(
-    clinica_id: str | None = None,
-    meses: int = 12,
-    inicio: str | None = None,
-    fim: str | None = None,
-    mes_ref_custom: str | None = None,
-):
-    try:
-        rows = supabase_get_all("vw_dashboard_final", select="*")
-        df = to_df(rows)
-        if df.empty:
-            return {"filtros": {}, "contexto": {}, "kpis": {}, "series": {}, "ranking_clinicas": []}
-
-        df["mes_ref_date"] = pd.to_datetime(df.get("mes_ref_date", df.get("mes_ref")), errors="coerce")
-        df = df.dropna(subset=["mes_ref_date"])
-        df["mes_ref_period"] = df["mes_ref_date"].dt.to_period("M")
-
-        numeric_cols = ["valor_total_emitido", "taxa_pago_no_vencimento", "taxa_inadimplencia", "tempo_medio_pagamento_dias", "parc_media_parcelas_pond", "valor_medio_boleto", "limite_aprovado"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df["taxa_pago_no_vencimento"] = df["taxa_pago_no_vencimento"].clip(0, 1).fillna(0)
-        df["taxa_inadimplencia"] = df["taxa_inadimplencia"].clip(0, 1).fillna(0)
-        df["valor_nao_pago_no_venc"] = df["valor_total_emitido"].fillna(0) * (1 - df["taxa_pago_no_vencimento"])
-        df["valor_inad_real"] = df["valor_nao_pago_no_venc"] * df["taxa_inadimplencia"]
-        df["taxa_inadimplencia_real"] = (df["valor_inad_real"] / df["valor_total_emitido"]).where(df["valor_total_emitido"] > 0, 0)
-        df["taxa_inadimplencia"] = df["taxa_inadimplencia_real"]
-        df["score_ajustado"] = df.apply(_calc_score_row, axis=1)
-        df["categoria_risco_ajustada"] = df["score_ajustado"].apply(_categoria_from_score)
-        
-        min_dt, max_dt = df["mes_ref_date"].min(), df["mes_ref_date"].max()
+# nome -> (tabela, ordem). Tabelas pequenas sem coluna de atualização: a
+# marca é um hash do conteúdo inteiro, então renomear uma clínica (mesma
+# contagem, mesmo id máximo) também muda o carimbo.
+MARCAS_CONTEUDO = {
+    "clinicas_conteudo": ("clinicas", "id.asc"),
+}
+
+# Marcas que dependem de migração (sql/add_antecipacoes_atualizado_em.sql)
+MARCAS_OPCIONAIS = {"antecipacoes_atualizacao"}
+
+# Marcas cuja mudança torna a exposição por clínica obsoleta
+MARCAS_ANTECIPACOES = ("antecipacoes", "antecipacoes_reembolso", "antecipacoes_atualizacao")
+
+
+async def _marca_tabela(table: str, coluna: str, extra_params: dict | None = None):
+    """Total de linhas e maior valor de `coluna`, numa única requisição."""
+    r = await _supabase_get_page(
+        table,
+        {"select": coluna, "order": f"{coluna}.desc.nullslast", "limit": "1", **(extra_params or {})},
+        headers={**HEADERS, "Prefer": "count=exact"},
+    )
+    rows = decodificar_json(r, table)
+    return [_total_content_range(r), rows[0].get(coluna) if rows else None]
 
+
+async def _marca_conteudo(table: str, ordem: str) -> str:
+    """Hash das linhas da tabela inteira (só para tabelas pequenas)."""
+    rows = await supabase_get_all(table, extra_params={"order": ordem})
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def _ler_marcas() -> dict | None:
+    """Marcas atuais; None se alguma marca obrigatória não pôde ser lida."""
+    nomes = list(MARCAS_SNAPSHOT) + list(MARCAS_CONTEUDO)
+    resultados = await asyncio.gather(
+        *(_marca_tabela(*MARCAS_SNAPSHOT[nome]) for nome in MARCAS_SNAPSHOT),
+        *(_marca_conteudo(*MARCAS_CONTEUDO[nome]) for nome in MARCAS_CONTEUDO),
+        return_exceptions=True,
+    )
+    marcas = {}
+    for nome, resultado in zip(nomes, resultados):
+        if isinstance(resultado, Exception):
+            if nome not in MARCAS_OPCIONAIS:
+                return None
+            resultado = None
+        marcas[nome] = resultado
+    return marcas
+
+
+def _carimbo(marcas: dict | None) -> str | None:
+    if marcas is None:
+        return None
+    return json.dumps([SNAPSHOT_FORMATO, sorted(marcas.items())], default=str)
+
+
+def _filtro_desde(marca: list | None, coluna: str) -> dict:
+    """Linhas com `coluna` >= marca d'água (gte: empates são reaplicados)."""
+    if not marca or marca[1] is None:
+        return {}
+    return {coluna: f"gte.{marca[1]}"}
+
+
+def _filtro_meses(idx_inicio: int | None, idx_fim: int | None = None) -> dict:
+    """Linhas da view com mes_ref_date entre os meses (mes_idx) dados, extremos inclusivos."""
+    condicoes = []
+    if idx_inicio is not None:
+        condicoes.append(("gte", f"{_mes_ref_de_idx(idx_inicio)}-01"))
+    if idx_fim is not None:
+        fim_mes = pd.Timestamp(f"{_mes_ref_de_idx(idx_fim)}-01") + pd.offsets.MonthEnd(0)
+        condicoes.append(("lte", fim_mes.date().isoformat()))
+    if not condicoes:
+        return {}
+    if len(condicoes) == 1:
+        op, valor = condicoes[0]
+        return {"mes_ref_date": f"{op}.{valor}"}
+    return {"and": "(" + ",".join(f"mes_ref_date.{op}.{valor}" for op, valor in condicoes) + ")"}
+
+
+def _mes_idx_carga() -> int | None:
+    """Primeiro mês (mes_idx) da janela carregada no snapshot; None = histórico inteiro."""
+    if PORTFOLIO_HISTORICO_MESES <= 0:
+        return None
+    return _mes_idx_de(datetime.utcnow().date()) - PORTFOLIO_HISTORICO_MESES
+
+
+# ---- Carga completa e sincronização incremental ----
+
+SELECT_SNAPSHOT = {
+    "importacoes": "id,clinica_id,criado_em",
+    "clinicas": "id,cnpj,nome,codigo_clinica",
+}
+
+COLUNAS_EXPOSICAO = ["clinica_id", "total_antecipado", "total_reembolsado", "em_aberto"]
+
+# Chaves de mescla das linhas sincronizadas. A view tem o grão das tabelas
+# de fatos do upload (TABELAS_CONFLITO); as demais usam o id.
+CHAVES_SNAPSHOT = {
+    "portfolio": [c.strip() for c in TABELAS_CONFLITO["boletos_emitidos"].split(",")],
+    "importacoes": ["id"],
+}
+
+
+async def _baixar_importacoes(extra_params: dict | None = None) -> pd.DataFrame:
+    rows = await supabase_get_all(
+        "importacoes", select=SELECT_SNAPSHOT["importacoes"], extra_params=extra_params
+    )
+    return to_df(rows, SELECT_SNAPSHOT["importacoes"].split(","))
+
+
+async def _baixar_exposicao() -> pd.DataFrame:
+    exposicao = await exposicao_por_clinica()
+    rows = [{"clinica_id": cid, **exp_c} for cid, exp_c in sorted(exposicao.items())]
+    return to_df(rows, COLUNAS_EXPOSICAO)
+
+
+COLUNAS_RESUMO_MENSAL = ["mes_ref_date", "valor_total_emitido"]
+
+
+async def _baixar_primeiro_mes() -> list:
+    """Primeiro mês da view inteira, sem janela (order=mes_ref_date, limit=1)."""
+    rows = await supabase_get(
+        "vw_dashboard_final",
+        select="mes_ref_date",
+        extra_params={"order": "mes_ref_date.asc", "limit": "1"},
+    )
+    dt = pd.to_datetime(rows[0].get("mes_ref_date"), errors="coerce") if rows else pd.NaT
+    return [] if pd.isna(dt) else [dt]
+
+
+async def _baixar_resumo_mensal(mes_idx_carga: int | None = None) -> pd.DataFrame:
+    """
+    Emissão do portfólio por mês, agregada no banco (rpc
+    resumo_mensal_dashboard, sql/create_resumo_mensal_dashboard.sql), com
+    todos os meses da view, inclusive os fora da janela carregada. Sem a
+    função no banco e com janela, só o primeiro mês da view
+    (`_baixar_primeiro_mes`, valor nulo); sem janela volta vazio e o
+    snapshot agrega as linhas.
+    """
+    try:
+        rows = await supabase_rpc("resumo_mensal_dashboard")
+    except Exception:
+        rows = None
+    if rows is None and mes_idx_carga is not None:
         try:
-            importacoes_rows = supabase_get_all(
-                "importacoes",
-                select="clinica_id,criado_em",
-            )
+            meses = await _baixar_primeiro_mes()
         except Exception:
-            importacoes_rows = []
-        df_importacoes = to_df(importacoes_rows, ["clinica_id", "criado_em"])
+            meses = []
+        return pd.DataFrame({
+            "mes_ref_date": pd.to_datetime(pd.Series(meses, dtype="datetime64[ns]")),
+            "valor_total_emitido": pd.Series(np.nan, index=range(len(meses)), dtype="float64"),
+        })
+    df = to_df(rows or [], COLUNAS_RESUMO_MENSAL)
+    if not set(COLUNAS_RESUMO_MENSAL) <= set(df.columns):
+        return to_df([], COLUNAS_RESUMO_MENSAL)
+    return pd.DataFrame({
+        "mes_ref_date": pd.to_datetime(df["mes_ref_date"], errors="coerce"),
+        "valor_total_emitido": pd.to_numeric(df["valor_total_emitido"], errors="coerce").astype("float64"),
+    }).dropna(subset=["mes_ref_date"]).reset_index(drop=True)
 
-        clinicas_info_map = {}
+
+async def _baixar_snapshot(versao: int) -> dict:
+    # Marcas antes dos dados: o que mudar durante a carga volta na próxima sincronização
+    try:
+        marcas = await _ler_marcas()
+    except Exception:
+        marcas = None
+
+    async def ou_vazio(coro, colunas):
         try:
-            clinicas_rows = supabase_get_all(
-                "clinicas",
-                select="id,cnpj,nome,codigo_clinica",
+            return await coro
+        except Exception:
+            return to_df([], colunas)
+
+    # Só a janela recente da view; meses anteriores vêm sob demanda
+    mes_idx_carga = _mes_idx_carga()
+    df, df_importacoes, clinicas_rows, df_exp, df_resumo = await asyncio.gather(
+        supabase_get_df(
+            "vw_dashboard_final", select=SELECT_PORTFOLIO, extra_params=_filtro_meses(mes_idx_carga)
+        ),
+        ou_vazio(_baixar_importacoes(), SELECT_SNAPSHOT["importacoes"].split(",")),
+        _get_all_ou_vazio("clinicas", select=SELECT_SNAPSHOT["clinicas"]),
+        ou_vazio(_baixar_exposicao(), COLUNAS_EXPOSICAO),
+        _baixar_resumo_mensal(mes_idx_carga),
+    )
+
+    def montar():
+        frames = {
+            "portfolio": _ordenar_portfolio(_enriquecer_portfolio(df)),
+            "importacoes": df_importacoes,
+            "clinicas": to_df(clinicas_rows, SELECT_SNAPSHOT["clinicas"].split(",")),
+            "exposicao": df_exp,
+            "resumo_mensal": df_resumo,
+        }
+        return _montar_snapshot(frames, versao, marcas, mes_idx_carga=mes_idx_carga)
+
+    return await run_in_threadpool(montar)
+
+
+def _concat_frames(partes: list) -> pd.DataFrame:
+    """pd.concat preservando colunas categóricas (categorias unidas)."""
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    if len(partes) == 1:
+        return partes[0].reset_index(drop=True)
+    df = pd.concat(partes, ignore_index=True)
+    for col in partes[0].columns:
+        if isinstance(partes[0][col].dtype, pd.CategoricalDtype) and col in df.columns:
+            df[col] = _concat_categorias([pd.Categorical(p[col]) for p in partes])
+    return df
+
+
+def _mesclar_por_chave(df: pd.DataFrame, delta: pd.DataFrame, chave: list) -> pd.DataFrame:
+    """Substitui em `df` as linhas com a mesma chave de `delta` e insere as novas."""
+    if delta.empty:
+        return df
+    if df.empty:
+        return delta.reset_index(drop=True)
+    chaves_delta = pd.MultiIndex.from_frame(delta[chave].astype(object))
+    manter = ~pd.MultiIndex.from_frame(df[chave].astype(object)).isin(chaves_delta)
+    return _concat_frames([df[manter], delta])
+
+
+async def _sincronizar_snapshot(base: dict, versao: int) -> dict | None:
+    """
+    Atualiza o snapshot `base` buscando só o que mudou desde as marcas
+    d'água dele: importações e limites novos apontam as clínicas cujas
+    linhas da view são rebuscadas e mescladas pela chave (clinica_id,
+    mes_ref). Retorna None quando a mudança não é incremental (clínicas
+    alteradas, exclusões, marcas indisponíveis) e é preciso baixar tudo.
+    """
+    antigas = base["marcas"]
+    marcas = await _ler_marcas()
+    if antigas is None or marcas is None or any(
+        marcas[nome] != antigas.get(nome) for nome in ("clinicas", *MARCAS_CONTEUDO)
+    ):
+        return None
+
+    frames = dict(base["frames"])
+
+    # Exposição: uma linha por clínica, agregada no banco; rebuscada quando
+    # alguma marca de antecipações muda. Sem atualizado_em um reembolso não
+    # muda nenhuma marca confiável, então rebusca a cada sincronização.
+    rebuscar_exposicao = (
+        marcas["antecipacoes_atualizacao"] is None
+        or any(marcas[nome] != antigas[nome] for nome in MARCAS_ANTECIPACOES)
+    )
+
+    if marcas == antigas and not rebuscar_exposicao:
+        return {**base, "versao": versao, "carregado_em": time.monotonic()}
+
+    async def nada():
+        return None
+
+    delta_imp, delta_lim, df_exp = await asyncio.gather(
+        _baixar_importacoes(_filtro_desde(antigas["importacoes"], "criado_em"))
+        if marcas["importacoes"] != antigas["importacoes"] else nada(),
+        supabase_get_all(
+            "clinica_limite",
+            select="clinica_id",
+            extra_params=_filtro_desde(antigas["clinica_limite"], "aprovado_em"),
+        )
+        if marcas["clinica_limite"] != antigas["clinica_limite"] else nada(),
+        _baixar_exposicao() if rebuscar_exposicao else nada(),
+    )
+
+    clinicas_alteradas = set()
+    if delta_imp is not None:
+        frames["importacoes"] = _mesclar_por_chave(
+            frames["importacoes"], delta_imp, CHAVES_SNAPSHOT["importacoes"]
+        )
+        if len(frames["importacoes"]) != marcas["importacoes"][0]:
+            return None  # houve exclusão
+        clinicas_alteradas.update(delta_imp["clinica_id"].dropna())
+    if delta_lim:
+        clinicas_alteradas.update(r["clinica_id"] for r in delta_lim if r.get("clinica_id"))
+
+    if df_exp is not None:
+        frames["exposicao"] = df_exp
+
+    if clinicas_alteradas:
+        delta_view, frames["resumo_mensal"] = await asyncio.gather(
+            supabase_get_df_in(
+                "vw_dashboard_final", "clinica_id", clinicas_alteradas, select=SELECT_PORTFOLIO,
+                extra_params=_filtro_meses(base["mes_idx_carga"]),
+            ),
+            _baixar_resumo_mensal(base["mes_idx_carga"]),
+        )
+
+        def mesclar_view():
+            delta = _enriquecer_portfolio(delta_view)
+            return _ordenar_portfolio(
+                _mesclar_por_chave(frames["portfolio"], delta, CHAVES_SNAPSHOT["portfolio"])
             )
+
+        frames["portfolio"] = await run_in_threadpool(mesclar_view)
+
+    return await run_in_threadpool(
+        _montar_snapshot, frames, versao, marcas, 0.0, base["mes_idx_carga"], base["baixado_em"]
+    )
+
+
+# ---- Snapshot em disco (warm restart) ----
+
+_tarefas_snapshot: set = set()
+
+
+def _em_segundo_plano(coro):
+    task = asyncio.ensure_future(coro)
+    _tarefas_snapshot.add(task)
+    task.add_done_callback(_tarefas_snapshot.discard)
+
+
+def _gravar_snapshot_disco(snap: dict):
+    if not PORTFOLIO_SNAPSHOT_DIR or snap["marcas"] is None:
+        return
+    try:
+        snapshot_disco.gravar(
+            PORTFOLIO_SNAPSHOT_DIR,
+            snap["frames"],
+            {
+                "formato": SNAPSHOT_FORMATO,
+                "marcas": snap["marcas"],
+                "mes_idx_carga": snap["mes_idx_carga"],
+                "baixado_em": snap["baixado_em"],
+                "gravado_em": time.time(),
+            },
+        )
+    except Exception:
+        traceback.print_exc()
+
+
+def _ler_snapshot_disco(versao: int) -> dict | None:
+    if not PORTFOLIO_SNAPSHOT_DIR:
+        return None
+    lido = snapshot_disco.carregar(PORTFOLIO_SNAPSHOT_DIR)
+    if lido is None:
+        return None
+    frames, meta = lido
+    if meta.get("formato") != SNAPSHOT_FORMATO:
+        return None
+    idade = max(time.time() - float(meta["gravado_em"]), 0.0)
+    return _montar_snapshot(
+        frames, versao, meta["marcas"], idade, meta.get("mes_idx_carga"), meta.get("baixado_em", 0.0)
+    )
+
+
+async def _atualizar_snapshot(base: dict | None, versao: int) -> dict:
+    """
+    Sincroniza a partir de `base` quando possível; senão (ou quando a última
+    carga completa já passou de PORTFOLIO_SNAPSHOT_RECARGA_TTLS TTLs) baixa tudo.
+    """
+    recarga_vencida = (
+        base is not None
+        and time.time() - base["baixado_em"] >= PORTFOLIO_SNAPSHOT_TTL * PORTFOLIO_SNAPSHOT_RECARGA_TTLS
+    )
+    if base is not None and not recarga_vencida:
+        try:
+            snap = await _sincronizar_snapshot(base, versao)
+            if snap is not None:
+                if snap["frames"] is not base["frames"] or base["versao"] != versao:
+                    _em_segundo_plano(run_in_threadpool(_gravar_snapshot_disco, snap))
+                return snap
         except Exception:
-            clinicas_rows = []
-        for row in clinicas_rows or []:
-            cid = _safe_str(row.get("id"))
-            if not cid:
-                continue
-            clinicas_info_map[cid] = {
-                "codigo_clinica": _safe_str(row.get("codigo_clinica")) or _safe_str(row.get("nome")),
-                "nome": _safe_str(row.get("nome")),
-                "cnpj": _safe_str(row.get("cnpj")),
-            }
+            traceback.print_exc()
+    snap = await _baixar_snapshot(versao)
+    _em_segundo_plano(run_in_threadpool(_gravar_snapshot_disco, snap))
+    return snap
+
+
+async def _revalidar_snapshot(snap: dict):
+    """Sincroniza em segundo plano o snapshot lido do disco."""
+    global _snapshot
+    try:
+        async with _snapshot_lock:
+            if _snapshot is not snap:
+                return
+            versao = _snapshot_versao
+            novo = await _atualizar_snapshot(snap, versao)
+            if versao == _snapshot_versao:
+                _snapshot = novo
+    except Exception:
+        traceback.print_exc()
+
+
+async def get_portfolio_snapshot() -> dict:
+    """
+    Portfólio já enriquecido (vw_dashboard_final + importações, clínicas e
+    exposição em antecipações), compartilhado por /dashboard e exportações.
+    Vence após PORTFOLIO_SNAPSHOT_TTL segundos ou quando alguma escrita
+    chama `invalidar_snapshot`; aí é sincronizado de forma incremental a
+    partir das marcas d'água. Os consumidores não devem alterar os frames
+    do snapshot.
+
+    Um worker recém-iniciado usa a cópia em disco (PORTFOLIO_SNAPSHOT_DIR),
+    mesmo vencida, e a sincroniza em segundo plano.
+    """
+    global _snapshot
+    if _snapshot_valido(_snapshot):
+        return _snapshot
+    async with _snapshot_lock:
+        if _snapshot_valido(_snapshot):
+            return _snapshot
+        versao = _snapshot_versao
 
+        if _snapshot is None:
+            disco = await run_in_threadpool(_ler_snapshot_disco, versao)
+            if disco is not None and versao == _snapshot_versao:
+                _snapshot = disco
+                if not _snapshot_valido(disco):
+                    _em_segundo_plano(_revalidar_snapshot(disco))
+                return disco
+
+        snap = await _atualizar_snapshot(_snapshot, versao)
+        # Uma escrita durante a carga torna este snapshot obsoleto
+        if versao == _snapshot_versao:
+            _snapshot = snap
+        return snap
+
+
+# ---- Histórico fora da janela carregada ----
+
+
+async def _snapshot_desde(snap: dict, mes_idx_minimo: int | None) -> dict:
+    """
+    `snap` se a carga já cobre `mes_idx_minimo`; senão um snapshot estendido
+    com os meses anteriores buscados sob demanda (mes_ref_date=gte./lte.),
+    guardado em `snap` para os pedidos seguintes.
+    """
+    carga = snap["mes_idx_carga"]
+    if carga is None or mes_idx_minimo is None or mes_idx_minimo >= carga:
+        return snap
+    estendido = snap["cache_historico"].get("snap")
+    if estendido is not None and estendido["mes_idx_carga"] <= mes_idx_minimo:
+        return estendido
+
+    df_antigo = await supabase_get_df(
+        "vw_dashboard_final",
+        select=SELECT_PORTFOLIO,
+        extra_params=_filtro_meses(mes_idx_minimo, carga - 1),
+    )
+
+    def montar():
+        portfolio = _concat_frames([_enriquecer_portfolio(df_antigo), snap["df"]])
+        frames = {**snap["frames"], "portfolio": _ordenar_portfolio(portfolio)}
+        idade = time.monotonic() - snap["carregado_em"]
+        return _montar_snapshot(
+            frames, snap["versao"], snap["marcas"], idade, mes_idx_minimo, snap["baixado_em"]
+        )
+
+    estendido = await run_in_threadpool(montar)
+    snap["cache_historico"]["snap"] = estendido
+    return estendido
+
+
+def _clinicas_no_periodo(snap: dict, idx_inicio: int, idx_fim: int) -> list:
+    """Clínicas com linha carregada entre os meses dados (busca binária na faixa de cada uma)."""
+    meses = snap["df"]["mes_idx"].to_numpy()
+    return [
+        cid
+        for cid, (i, f) in snap["particao"].items()
+        if np.searchsorted(meses[i:f], idx_inicio) < np.searchsorted(meses[i:f], idx_fim, side="right")
+    ]
+
+
+async def _ultimo_mes_no_banco(snap: dict, clinica_id: str, corte: int) -> int | None:
+    """
+    Último mês (mes_idx) da clínica na view até o corte, para clínicas sem
+    linha até o corte na janela carregada; guardado em `snap`.
+    """
+    cache = snap["cache_historico"].setdefault("ultimo_mes", {})
+    chave = (clinica_id, corte)
+    if chave not in cache:
         try:
-            antecipacoes_rows = supabase_get_all(
-                "antecipacoes",
-                select="clinica_id,valor_liquido,data_reembolso",
+            rows = await supabase_get(
+                "vw_dashboard_final",
+                select="mes_ref_date",
+                extra_params={
+                    "clinica_id": f"eq.{clinica_id}",
+                    **_filtro_meses(None, corte),
+                    "order": "mes_ref_date.desc",
+                    "limit": "1",
+                },
             )
         except Exception:
-            antecipacoes_rows = []
-        df_ant = to_df(antecipacoes_rows, ["clinica_id", "valor_liquido", "data_reembolso"])
-        utilizacao_por_clinica = {}
-        if not df_ant.empty:
-            df_ant["valor_liquido"] = pd.to_numeric(
-                df_ant["valor_liquido"], errors="coerce"
-            ).fillna(0)
-            df_ant["reembolsado"] = df_ant["data_reembolso"].notna()
-            for cid, group in df_ant.groupby("clinica_id"):
-                total_antecipado = float(group["valor_liquido"].sum())
-                total_reembolsado = float(
-                    group[group["reembolsado"]]["valor_liquido"].sum()
-                )
-                utilizacao_por_clinica[_safe_str(cid)] = max(
-                    total_antecipado - total_reembolsado, 0.0
-                )
+            return None
+        dt = pd.to_datetime(rows[0].get("mes_ref_date"), errors="coerce") if rows else pd.NaT
+        cache[chave] = None if pd.isna(dt) else _mes_idx_de(dt)
+    return cache[chave]
 
-        hoje_utc = datetime.utcnow().date()
-        first_day_month = hoje_utc.replace(day=1)
-        last_complete_end = pd.to_datetime(first_day_month) - pd.Timedelta(days=1)
-        end_dt_base = min(max_dt, last_complete_end)
-        if mes_ref_custom:
-            try:
-                custom_dt = pd.to_datetime(str(mes_ref_custom) + "-01", errors="raise")
-                if custom_dt <= max_dt:
-                    end_dt_base = custom_dt
-            except Exception:
-                pass
 
-        if inicio and fim:
-            dt_inicio = pd.to_datetime(inicio + "-01")
-            dt_fim = pd.to_datetime(fim + "-01") + pd.offsets.MonthEnd(0)
-            dt_fim = min(dt_fim, end_dt_base)
+async def _mes_idx_limites(snap: dict, clinica_ids) -> int | None:
+    """
+    Primeiro mês que o motor de limite lê para essas clínicas: 11 meses antes
+    do último mês com dados de cada uma até o seu corte. Sem linha até o
+    corte na janela carregada, esse mês vem do banco (`_ultimo_mes_no_banco`).
+    None quando a carga já cobre tudo.
+    """
+    carga = snap["mes_idx_carga"]
+    resumo = snap["resumo_mensal"]
+    ids = list(dict.fromkeys(map(str, clinica_ids or [])))
+    if carga is None or resumo.empty or not ids:
+        return None
+    hoje_utc = datetime.utcnow().date()
+    first_day = hoje_utc.replace(day=1)
+    cortes = _mes_idx(_cutoffs_clinicas(
+        snap["cutoffs"], ids, pd.to_datetime(first_day) - pd.Timedelta(days=1),
+        resumo["mes_ref_date"].max(),
+    )).to_numpy()
+
+    meses = snap["df"]["mes_idx"].to_numpy()
+    ultimos, pendentes = [], []
+    for cid, corte in zip(ids, cortes):
+        i, f = snap["particao"].get(cid, (0, 0))
+        n = np.searchsorted(meses[i:f], corte, side="right")
+        if n:
+            ultimos.append(int(meses[i + n - 1]))
         else:
-            dt_fim = end_dt_base
-            dt_inicio = dt_fim - pd.DateOffset(months=meses - 1)
-
-        periodo_inicio = pd.Period(dt_inicio, freq="M")
-        periodo_fim = pd.Period(dt_fim, freq="M")
-        df_recorte_all = df[
-            (df["mes_ref_period"] >= periodo_inicio)
-            & (df["mes_ref_period"] <= periodo_fim)
-        ].copy()
-
-        def _weighted_avg(df_slice, value_col, weight_col="valor_total_emitido"):
-            if df_slice.empty or value_col not in df_slice.columns:
-                return None
-            values = pd.to_numeric(df_slice[value_col], errors="coerce")
-            if weight_col in df_slice.columns:
-                weights = pd.to_numeric(df_slice[weight_col], errors="coerce").fillna(0)
-            else:
-                weights = pd.Series([0] * len(values), index=values.index)
-            mask = values.notna()
-            values = values[mask]
-            weights = weights[mask]
-            if values.empty:
-                return None
-            total_weight = weights.sum()
-            if total_weight and total_weight > 0:
-                return float((values * weights).sum() / total_weight)
-            return float(values.mean())
+            pendentes.append((cid, int(corte)))
 
-        def _mean(df_slice, col):
-            if df_slice.empty or col not in df_slice.columns:
-                return None
-            values = pd.to_numeric(df_slice[col], errors="coerce")
-            if values.dropna().empty:
-                return None
-            return float(values.mean())
+    if pendentes:
+        semaforo = asyncio.Semaphore(max(SUPABASE_PAGE_FANOUT, 1))
 
-        if not df_recorte_all.empty:
-            df_recorte_all = df_recorte_all.copy()
+        async def buscar(cid, corte):
+            async with semaforo:
+                return await _ultimo_mes_no_banco(snap, cid, corte)
 
-        nome_clinica = "Todas as clínicas"
-        codigo_clinica = None
-        nome_real = None
-        if clinica_id:
-            nomes = df[df["clinica_id"] == clinica_id]["clinica_nome"].dropna().unique().tolist()
-            nome_clinica = nomes[0] if nomes else "Clínica selecionada"
-            info = clinicas_info_map.get(str(clinica_id), {})
-            codigo_clinica = info.get("codigo_clinica") or nome_clinica
-            nome_real = info.get("nome")
-        
-        if clinica_id:
-            df_ctx = df_recorte_all[df_recorte_all["clinica_id"] == clinica_id].copy()
-        else:
-            df_ctx = df_recorte_all.copy()
+        ultimos += [u for u in await asyncio.gather(*(buscar(c, k) for c, k in pendentes)) if u is not None]
+    if not ultimos:
+        return None
+    return min(ultimos) - (JANELA_LIMITE_MESES - 1)
 
-        kpis = {}
-        if not df_ctx.empty:
-            max_ctx_dt = df_ctx["mes_ref_date"].max()
-            df_ctx_ultimo = df_ctx[df_ctx["mes_ref_date"] == max_ctx_dt]
-            kpis["score_atual"] = _safe_float(df_ctx_ultimo["score_ajustado"].mean())
-            kpis["categoria_risco"] = _categoria_from_score(kpis["score_atual"])
-            kpis["valor_total_emitido_periodo"] = _safe_float(df_ctx["valor_total_emitido"].sum())
-            kpis["valor_emitido_ultimo_mes"] = _safe_float(df_ctx_ultimo["valor_total_emitido"].sum())
-            kpis["inadimplencia_media_periodo"] = _weighted_avg(df_ctx, "taxa_inadimplencia_real")
-            kpis["inadimplencia_ultimo_mes"] = _weighted_avg(df_ctx_ultimo, "taxa_inadimplencia_real")
-            kpis["taxa_pago_no_vencimento_media_periodo"] = _weighted_avg(df_ctx, "taxa_pago_no_vencimento")
-            kpis["taxa_pago_no_vencimento_ultimo_mes"] = _weighted_avg(df_ctx_ultimo, "taxa_pago_no_vencimento")
-            kpis["ticket_medio_periodo"] = _mean(df_ctx, "valor_medio_boleto")
-            kpis["ticket_medio_ultimo_mes"] = _mean(df_ctx_ultimo, "valor_medio_boleto")
-            kpis["tempo_medio_pagamento_media_periodo"] = _mean(df_ctx, "tempo_medio_pagamento_dias")
-            kpis["tempo_medio_pagamento_ultimo_mes"] = _mean(df_ctx_ultimo, "tempo_medio_pagamento_dias")
-            kpis["parcelas_media_periodo"] = _mean(df_ctx, "parc_media_parcelas_pond")
-            kpis["parcelas_media_ultimo_mes"] = _mean(df_ctx_ultimo, "parc_media_parcelas_pond")
-
-            df_series_base = df_ctx.copy()
-            df_series_base["mes_ref"] = df_series_base["mes_ref_period"].astype(str)
-            score_por_mes_df = (
-                df_series_base.groupby("mes_ref", as_index=False)["score_ajustado"]
-                .mean()
-                .sort_values("mes_ref")
-            )
-            if not score_por_mes_df.empty:
-                kpis["score_mes_anterior"] = (
-                    score_por_mes_df["score_ajustado"].iloc[-2]
-                    if len(score_por_mes_df) > 1
-                    else None
-                )
-                kpis["score_variacao_vs_m1"] = (
-                    kpis["score_atual"] - kpis["score_mes_anterior"]
-                    if kpis.get("score_atual") is not None and kpis.get("score_mes_anterior") is not None
-                    else None
-                )
-        
-        limit_motor = None
-        if clinica_id:
-            hoje_utc = datetime.utcnow().date()
-            first_day = hoje_utc.replace(day=1)
-            cutoff_dt = _cutoff_mes_fechado_por_importacao(df_importacoes, clinica_id)
-            if cutoff_dt is None:
-                cutoff_dt = pd.to_datetime(first_day) - pd.Timedelta(days=1)
-            if pd.isna(cutoff_dt) or cutoff_dt > max_dt:
-                cutoff_dt = max_dt
-            df_clin_cut = df[
-                (df["clinica_id"] == clinica_id) & (df["mes_ref_date"] <= cutoff_dt)
-            ].copy()
-            last_dt_clin = df_clin_cut["mes_ref_date"].max() if not df_clin_cut.empty else None
-            mes_upload_ref = _mes_upload_por_importacao(df_importacoes, clinica_id)
-            (
-                limite_sugerido, base_media12m, base_media3m, base_ultimo_mes,
-                base_mensal_mix, fator, share_portfolio_12m
-            ) = _calculate_limite_sugerido(clinica_id, df, cutoff_dt)
-            limit_motor = {
-                "mes_ref_base": _format_mes_ref(last_dt_clin),
-                "mes_ref_regra": _format_mes_ref(pd.Timestamp(cutoff_dt)),
-                "mes_upload_referencia": mes_upload_ref,
-                "regra_limite": "mes_anterior_ao_upload",
-                "limite_sugerido": limite_sugerido,
-                "limite_sugerido_base_media12m": base_media12m,
-                "limite_sugerido_base_media3m": base_media3m,
-                "limite_sugerido_base_ultimo_mes": base_ultimo_mes,
-                "limite_sugerido_base_mensal_mix": base_mensal_mix,
-                "limite_sugerido_fator": fator,
-                "limite_sugerido_teto_global": 3_000_000.0,
-                "limite_sugerido_share_portfolio_12m": share_portfolio_12m,
-            }
-            kpis.update(limit_motor)
-            limite_utilizado = _safe_float(utilizacao_por_clinica.get(clinica_id))
-            kpis["limite_utilizado"] = limite_utilizado
-            if kpis.get("limite_aprovado") is not None:
-                usado = limite_utilizado or 0.0
-                kpis["limite_disponivel"] = max(float(kpis["limite_aprovado"]) - usado, 0.0)
+
+async def _snapshot_periodo_limites(
+    snap: dict, idx_inicio: int, idx_fim: int, clinica_ids=(), clinicas_do_periodo: bool = True
+) -> dict:
+    """
+    Snapshot que cobre o período e a janela de 12m dos limites até o corte
+    das `clinica_ids` e, com `clinicas_do_periodo`, das clínicas com linhas
+    no período (`_mes_idx_limites`).
+    """
+    periodo = await _snapshot_desde(snap, idx_inicio)
+    if periodo["mes_idx_carga"] is None:
+        return periodo
+    clinica_ids = list(clinica_ids)
+    if clinicas_do_periodo:
+        cache = periodo["cache_historico"].setdefault("clinicas_periodo", {})
+        if (idx_inicio, idx_fim) not in cache:
+            if len(cache) >= RANKING_CACHE_MAX:
+                cache.clear()
+            cache[(idx_inicio, idx_fim)] = _clinicas_no_periodo(periodo, idx_inicio, idx_fim)
+        clinica_ids += cache[(idx_inicio, idx_fim)]
+    minimo = await _mes_idx_limites(periodo, clinica_ids)
+    if minimo is None or minimo >= periodo["mes_idx_carga"]:
+        return periodo
+    return await _snapshot_desde(snap, minimo)
+
+
+async def _snapshot_dashboard(
+    snap: dict,
+    clinica_id: str | None,
+    meses: int,
+    inicio: str | None,
+    fim: str | None,
+    mes_ref_custom: str | None,
+    secoes: frozenset,
+) -> dict:
+    """
+    Snapshot que cobre o que o /dashboard pedido lê: o período e, para o
+    ranking e a clínica, a janela de 12m dos limites até o corte de cada uma.
+    """
+    resumo = snap["resumo_mensal"]
+    if snap["mes_idx_carga"] is None or resumo.empty:
+        return snap
+    idx_inicio, idx_fim = _periodo_dashboard(resumo["mes_ref_date"].max(), meses, inicio, fim, mes_ref_custom)
+    limites_clinica = bool(clinica_id) and ("kpis" in secoes or "limite_motor" in secoes)
+    return await _snapshot_periodo_limites(
+        snap, idx_inicio, idx_fim, [clinica_id] if limites_clinica else (), "ranking" in secoes
+    )
+
+
+# Partes do /dashboard que podem ser pedidas em `sections`
+SECOES_DASHBOARD = ("kpis", "series", "ranking", "limite_motor", "filtros")
+
+# Períodos distintos com ranking guardado por snapshot
+RANKING_CACHE_MAX = 32
+
+
+def _secoes_dashboard(sections: str | None) -> frozenset:
+    """Seções de `sections` (separadas por vírgula); ausente = todas."""
+    if sections is None or not sections.strip():
+        return frozenset(SECOES_DASHBOARD)
+    pedidas = {s.strip() for s in sections.split(",") if s.strip()}
+    invalidas = pedidas - set(SECOES_DASHBOARD)
+    if invalidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Seções inválidas: {', '.join(sorted(invalidas))}. Use: {', '.join(SECOES_DASHBOARD)}",
+        )
+    return frozenset(pedidas)
+
+
+def _media_ponderada_segmentos(valores: np.ndarray, pesos: np.ndarray, inicios, fins) -> list:
+    """
+    Média ponderada de cada segmento contíguo com a regra de `_weighted_avg`
+    (valores nulos ignorados; sem peso positivo, média simples; sem valores,
+    None) e as mesmas somas, na mesma ordem — o resultado é bit a bit igual.
+    """
+    medias = []
+    for inicio, fim in zip(inicios, fins):
+        v = valores[inicio:fim]
+        validos = ~np.isnan(v)
+        v = v[validos]
+        if not len(v):
+            medias.append(None)
+            continue
+        w = pesos[inicio:fim][validos]
+        total = w.sum()
+        medias.append(float((v * w).sum() / total) if total and total > 0 else float(v.mean()))
+    return medias
+
+
+def _agregar_series_mensais(df_ctx: pd.DataFrame) -> pd.DataFrame:
+    """
+    Todas as séries mensais do /dashboard numa passada: as linhas são
+    agrupadas por mes_idx (ordem estável), somas e médias saem de um único
+    groupby e as médias ponderadas pelo valor emitido, de cada segmento de
+    mês. Uma linha por mês, em ordem, com o rótulo em `mes_ref`.
+    """
+    df_mes = df_ctx.sort_values("mes_idx", kind="stable")
+    agregacoes = {
+        "score_ajustado": "mean",
+        "valor_total_emitido": "sum",
+        "valor_medio_boleto": "mean",
+        "qtde_boletos": "sum",
+        "tempo_medio_pagamento_dias": "mean",
+        "parc_media_parcelas_pond": "mean",
+    }
+    por_mes = df_mes.groupby("mes_idx", sort=True).agg(
+        {col: fn for col, fn in agregacoes.items() if col in df_mes.columns}
+    )
+    por_mes["mes_ref"] = [_mes_ref_de_idx(int(i)) for i in por_mes.index]
+
+    meses = df_mes["mes_idx"].to_numpy()
+    inicios = np.flatnonzero(np.r_[True, meses[1:] != meses[:-1]])
+    fins = np.r_[inicios[1:], len(meses)]
+    pesos = df_mes["valor_total_emitido"].fillna(0).to_numpy(dtype="float64")
+    for coluna, nome in (
+        ("taxa_inadimplencia_real", "taxa_inadimplencia"),
+        ("taxa_pago_no_vencimento", "taxa_pago_no_vencimento"),
+    ):
+        if coluna in df_mes.columns:
+            valores = df_mes[coluna].to_numpy(dtype="float64", na_value=np.nan)
+            por_mes[nome] = _media_ponderada_segmentos(valores, pesos, inicios, fins)
         else:
-            kpis["limite_sugerido_teto_global"] = 3_000_000.0
+            por_mes[nome] = None
+    return por_mes
 
-        series_data = {}
-        if not df_ctx.empty:
-            df_series_base = df_ctx.copy()
-            df_series_base["mes_ref"] = df_series_base["mes_ref_period"].astype(str)
 
-            score_por_mes = (
-                df_series_base.groupby("mes_ref", as_index=False)["score_ajustado"]
-                .mean()
-                .sort_values("mes_ref")
-            )
-            series_data["score_por_mes"] = [
-                {"mes_ref": r["mes_ref"], "score_credito": _safe_float(r["score_ajustado"])}
-                for _, r in score_por_mes.iterrows()
-            ]
+def _montar_ranking(
+    df_recorte: pd.DataFrame,
+    limites: pd.Series,
+    clinicas_info_map: dict,
+    utilizacao_por_clinica: dict,
+) -> list:
+    """
+    Ranking de clínicas do período com operações agrupadas (custo O(linhas)):
+    a linha do último mês de cada clínica via idxmax, somas do período e a
+    inadimplência ponderada como numerador/denominador. Ordenado por score
+    (desc.); empates ficam na ordem em que as clínicas aparecem.
+    """
+    if df_recorte.empty:
+        return []
+    grupos = df_recorte.groupby("clinica_id", observed=True, sort=False)
+    ultimo = grupos["mes_idx"].transform("max")
+    linhas = df_recorte.loc[grupos["mes_idx"].idxmax()]
+
+    inad = df_recorte["taxa_inadimplencia_real"]
+    peso = df_recorte["valor_total_emitido"].fillna(0).where(inad.notna())
+    aux = pd.DataFrame({
+        "score_ultimo": df_recorte["score_ajustado"].where(df_recorte["mes_idx"] == ultimo),
+        "emitido": df_recorte["valor_total_emitido"],
+        "inad": inad,
+        "inad_x_peso": inad * peso,
+        "peso": peso,
+    })
+    agg = aux.groupby(df_recorte["clinica_id"], observed=True, sort=False).agg(
+        score=("score_ultimo", "mean"),
+        emitido=("emitido", "sum"),
+        inad_num=("inad_x_peso", "sum"),
+        inad_den=("peso", "sum"),
+        inad_n=("inad", "count"),
+        inad_media=("inad", "mean"),
+    )
+    # Mesma regra de _weighted_avg: sem peso positivo, média simples
+    inad_media = (agg["inad_num"] / agg["inad_den"]).where(agg["inad_den"] > 0, agg["inad_media"])
+    inad_media = inad_media.where(agg["inad_n"] > 0)
+
+    def coluna(nome):
+        if nome not in linhas.columns:
+            return [None] * len(linhas)
+        return linhas[nome].tolist()
+
+    tem_aprovado = "limite_aprovado" in linhas.columns
+    ranking = []
+    for cid, nome, cnpj, aprovado, score, emitido, inad_periodo in zip(
+        agg.index.astype(str),
+        coluna("clinica_nome"),
+        coluna("cnpj"),
+        coluna("limite_aprovado"),
+        agg["score"],
+        agg["emitido"],
+        inad_media,
+    ):
+        info = clinicas_info_map.get(cid, {})
+        score = _safe_float(score)
+        aprovado = _safe_float(aprovado)
+        utilizado = _safe_float(utilizacao_por_clinica.get(cid, 0))
+        ranking.append({
+            "clinica_id": cid,
+            "clinica_nome": _safe_str(nome),
+            "clinica_codigo": info.get("codigo_clinica") or _safe_str(nome),
+            "clinica_nome_real": info.get("nome"),
+            "cnpj": _safe_str(cnpj),
+            "score_credito": score,
+            "categoria_risco": _categoria_from_score(score),
+            "limite_aprovado": aprovado,
+            "limite_utilizado": utilizado,
+            "limite_disponivel": (
+                max((aprovado or 0) - (utilizado or 0), 0.0) if tem_aprovado else None
+            ),
+            "limite_sugerido": _safe_float(limites.get(cid)),
+            "valor_total_emitido_periodo": _safe_float(emitido),
+            "inadimplencia_media_periodo": _safe_float(inad_periodo),
+        })
+    return sorted(ranking, key=lambda x: (x["score_credito"] or 0), reverse=True)
 
-            valor_emitido = (
-                df_series_base.groupby("mes_ref", as_index=False)["valor_total_emitido"]
-                .sum()
-                .sort_values("mes_ref")
-            )
-            if "valor_medio_boleto" in df_series_base.columns:
-                valor_medio = (
-                    df_series_base.groupby("mes_ref", as_index=False)["valor_medio_boleto"]
-                    .mean()
-                    .rename(columns={"valor_medio_boleto": "valor_medio_boleto"})
-                )
-                valor_emitido = valor_emitido.merge(valor_medio, on="mes_ref", how="left")
-            if "qtde_boletos" in df_series_base.columns:
-                qtde_boletos = (
-                    df_series_base.groupby("mes_ref", as_index=False)["qtde_boletos"]
-                    .sum()
-                )
-                valor_emitido = valor_emitido.merge(qtde_boletos, on="mes_ref", how="left")
-            series_data["valor_emitido_por_mes"] = [
-                {
-                    "clinica_id": clinica_id if clinica_id else None,
-                    "mes_ref": r["mes_ref"],
-                    "valor_total_emitido": _safe_float(r["valor_total_emitido"]),
-                    "valor_medio_boleto": _safe_float(r.get("valor_medio_boleto")) if "valor_medio_boleto" in valor_emitido.columns else None,
-                    "qtde_boletos": _safe_float(r.get("qtde_boletos")) if "qtde_boletos" in valor_emitido.columns else None,
-                }
-                for _, r in valor_emitido.iterrows()
-            ]
 
-            inad_por_mes = (
-                df_series_base.groupby("mes_ref")
-                .apply(lambda g: _weighted_avg(g, "taxa_inadimplencia_real"))
-                .reset_index(name="taxa_inadimplencia")
-                .sort_values("mes_ref")
-            )
-            series_data["inadimplencia_por_mes"] = [
-                {"mes_ref": r["mes_ref"], "taxa_inadimplencia": _safe_float(r["taxa_inadimplencia"])}
-                for _, r in inad_por_mes.iterrows()
-            ]
+def _periodo_dashboard(
+    max_dt, meses: int, inicio: str | None, fim: str | None, mes_ref_custom: str | None
+) -> tuple:
+    """
+    Período do /dashboard como índices de mês (ano*12 + mês-1), extremos
+    inclusivos: `inicio`/`fim` ou os `meses` até o último mês fechado.
+    """
+    hoje_utc = datetime.utcnow().date()
+    first_day_month = hoje_utc.replace(day=1)
+    last_complete_end = pd.to_datetime(first_day_month) - pd.Timedelta(days=1)
+    end_dt_base = min(max_dt, last_complete_end)
+    if mes_ref_custom:
+        try:
+            custom_dt = pd.to_datetime(str(mes_ref_custom) + "-01", errors="raise")
+            if custom_dt <= max_dt:
+                end_dt_base = custom_dt
+        except Exception:
+            pass
 
-            pago_venc_por_mes = (
-                df_series_base.groupby("mes_ref")
-                .apply(lambda g: _weighted_avg(g, "taxa_pago_no_vencimento"))
-                .reset_index(name="taxa_pago_no_vencimento")
-                .sort_values("mes_ref")
-            )
-            series_data["taxa_pago_no_vencimento_por_mes"] = [
-                {"mes_ref": r["mes_ref"], "taxa_pago_no_vencimento": _safe_float(r["taxa_pago_no_vencimento"])}
-                for _, r in pago_venc_por_mes.iterrows()
-            ]
+    if inicio and fim:
+        idx_inicio = _mes_idx_de(pd.to_datetime(inicio + "-01"))
+        idx_fim = min(_mes_idx_de(pd.to_datetime(fim + "-01")), _mes_idx_de(end_dt_base))
+    else:
+        idx_fim = _mes_idx_de(end_dt_base)
+        idx_inicio = idx_fim - (meses - 1)
+    return idx_inicio, idx_fim
+
+
+def _montar_dashboard(
+    df: pd.DataFrame,
+    particao: dict,
+    tabela_cutoffs: pd.DataFrame,
+    clinicas_info_map: dict,
+    utilizacao_por_clinica: dict,
+    clinica_id: str | None,
+    meses: int,
+    inicio: str | None,
+    fim: str | None,
+    mes_ref_custom: str | None,
+    secoes: frozenset = frozenset(SECOES_DASHBOARD),
+    resumo_mensal: pd.DataFrame | None = None,
+    cache_ranking: dict | None = None,
+):
+    """
+    Parte CPU (pandas) do /dashboard — roda fora do event loop. Só as
+    `secoes` pedidas são calculadas; as demais voltam vazias.
+
+    Com `clinica_id`, KPIs, séries e motor de limite leem só as linhas da
+    clínica e o `resumo_mensal` do portfólio; o ranking (igual para todas
+    as clínicas) sai de `cache_ranking` quando o período já foi pedido.
+    """
+    if df.empty:
+        return {"filtros": {}, "contexto": {}, "kpis": {}, "series": {}, "ranking_clinicas": []}
+
+    if resumo_mensal is None:
+        resumo_mensal = _resumo_mensal_portfolio(df)
+    max_dt = resumo_mensal["mes_ref_date"].max()
+    idx_inicio, idx_fim = _periodo_dashboard(max_dt, meses, inicio, fim, mes_ref_custom)
+
+    def _no_periodo(frame):
+        return frame[(frame["mes_idx"] >= idx_inicio) & (frame["mes_idx"] <= idx_fim)]
+
+    def _weighted_avg(df_slice, value_col, weight_col="valor_total_emitido"):
+        if df_slice.empty or value_col not in df_slice.columns:
+            return None
+        values = pd.to_numeric(df_slice[value_col], errors="coerce")
+        if weight_col in df_slice.columns:
+            weights = pd.to_numeric(df_slice[weight_col], errors="coerce").fillna(0)
+        else:
+            weights = pd.Series([0] * len(values), index=values.index)
+        mask = values.notna()
+        values = values[mask]
+        weights = weights[mask]
+        if values.empty:
+            return None
+        total_weight = weights.sum()
+        if total_weight and total_weight > 0:
+            return float((values * weights).sum() / total_weight)
+        return float(values.mean())
 
-            tempo_por_mes = (
-                df_series_base.groupby("mes_ref", as_index=False)["tempo_medio_pagamento_dias"]
-                .mean()
-                .sort_values("mes_ref")
+    def _mean(df_slice, col):
+        if df_slice.empty or col not in df_slice.columns:
+            return None
+        values = pd.to_numeric(df_slice[col], errors="coerce")
+        if values.dropna().empty:
+            return None
+        return float(values.mean())
+
+    nome_clinica = "Todas as clínicas"
+    codigo_clinica = None
+    nome_real = None
+    if clinica_id:
+        nomes = _linhas_clinica(df, particao, clinica_id)["clinica_nome"].dropna().unique().tolist()
+        nome_clinica = nomes[0] if nomes else "Clínica selecionada"
+        info = clinicas_info_map.get(str(clinica_id), {})
+        codigo_clinica = info.get("codigo_clinica") or nome_clinica
+        nome_real = info.get("nome")
+    
+    # Com clínica, o recorte do período sai só da fatia dela no snapshot
+    df_recorte_all = None
+    if clinica_id:
+        df_ctx = _no_periodo(_linhas_clinica(df, particao, clinica_id))
+    else:
+        df_recorte_all = _no_periodo(df)
+        df_ctx = df_recorte_all
+
+    com_kpis = "kpis" in secoes
+    por_mes = None
+    if not df_ctx.empty and (com_kpis or "series" in secoes):
+        por_mes = _agregar_series_mensais(df_ctx)
+
+    kpis = {}
+    if com_kpis and not df_ctx.empty:
+        max_ctx_dt = df_ctx["mes_ref_date"].max()
+        df_ctx_ultimo = df_ctx[df_ctx["mes_ref_date"] == max_ctx_dt]
+        kpis["score_atual"] = _safe_float(df_ctx_ultimo["score_ajustado"].mean())
+        kpis["categoria_risco"] = _categoria_from_score(kpis["score_atual"])
+        kpis["valor_total_emitido_periodo"] = _safe_float(df_ctx["valor_total_emitido"].sum())
+        kpis["valor_emitido_ultimo_mes"] = _safe_float(df_ctx_ultimo["valor_total_emitido"].sum())
+        kpis["inadimplencia_media_periodo"] = _weighted_avg(df_ctx, "taxa_inadimplencia_real")
+        kpis["inadimplencia_ultimo_mes"] = _weighted_avg(df_ctx_ultimo, "taxa_inadimplencia_real")
+        kpis["taxa_pago_no_vencimento_media_periodo"] = _weighted_avg(df_ctx, "taxa_pago_no_vencimento")
+        kpis["taxa_pago_no_vencimento_ultimo_mes"] = _weighted_avg(df_ctx_ultimo, "taxa_pago_no_vencimento")
+        kpis["ticket_medio_periodo"] = _mean(df_ctx, "valor_medio_boleto")
+        kpis["ticket_medio_ultimo_mes"] = _mean(df_ctx_ultimo, "valor_medio_boleto")
+        kpis["tempo_medio_pagamento_media_periodo"] = _mean(df_ctx, "tempo_medio_pagamento_dias")
+        kpis["tempo_medio_pagamento_ultimo_mes"] = _mean(df_ctx_ultimo, "tempo_medio_pagamento_dias")
+        kpis["parcelas_media_periodo"] = _mean(df_ctx, "parc_media_parcelas_pond")
+        kpis["parcelas_media_ultimo_mes"] = _mean(df_ctx_ultimo, "parc_media_parcelas_pond")
+
+        score_por_mes_df = por_mes["score_ajustado"]
+        if not score_por_mes_df.empty:
+            kpis["score_mes_anterior"] = (
+                score_por_mes_df.iloc[-2]
+                if len(score_por_mes_df) > 1
+                else None
+            )
+            kpis["score_variacao_vs_m1"] = (
+                kpis["score_atual"] - kpis["score_mes_anterior"]
+                if kpis.get("score_atual") is not None and kpis.get("score_mes_anterior") is not None
+                else None
             )
-            series_data["tempo_medio_pagamento_por_mes"] = [
-                {"mes_ref": r["mes_ref"], "tempo_medio_pagamento_dias": _safe_float(r["tempo_medio_pagamento_dias"])}
-                for _, r in tempo_por_mes.iterrows()
+    
+    # Os KPIs de uma clínica incluem os campos do motor de limite
+    limit_motor = None
+    if clinica_id and (com_kpis or "limite_motor" in secoes):
+        limit_motor = _motores_limite(df, particao, tabela_cutoffs, resumo_mensal, [clinica_id])[str(clinica_id)]
+        if com_kpis:
+            kpis.update(limit_motor)
+            limite_utilizado = _safe_float(utilizacao_por_clinica.get(clinica_id))
+            kpis["limite_utilizado"] = limite_utilizado
+            if kpis.get("limite_aprovado") is not None:
+                usado = limite_utilizado or 0.0
+                kpis["limite_disponivel"] = max(float(kpis["limite_aprovado"]) - usado, 0.0)
+        if "limite_motor" not in secoes:
+            limit_motor = None
+    elif com_kpis:
+        kpis["limite_sugerido_teto_global"] = LIMITE_TETO_GLOBAL
+
+    series_data = {}
+    if "series" in secoes and not df_ctx.empty:
+        meses_ref = por_mes["mes_ref"].tolist()
+
+        def _serie(coluna, chave):
+            return [
+                {"mes_ref": m, chave: _safe_float(v)}
+                for m, v in zip(meses_ref, por_mes[coluna])
             ]
 
-            parcelas_por_mes = (
-                df_series_base.groupby("mes_ref", as_index=False)["parc_media_parcelas_pond"]
-                .mean()
-                .sort_values("mes_ref")
+        series_data["score_por_mes"] = _serie("score_ajustado", "score_credito")
+        sem_coluna = [None] * len(meses_ref)
+        series_data["valor_emitido_por_mes"] = [
+            {
+                "clinica_id": clinica_id if clinica_id else None,
+                "mes_ref": m,
+                "valor_total_emitido": _safe_float(valor),
+                "valor_medio_boleto": _safe_float(medio),
+                "qtde_boletos": _safe_float(qtde),
+            }
+            for m, valor, medio, qtde in zip(
+                meses_ref,
+                por_mes["valor_total_emitido"],
+                por_mes.get("valor_medio_boleto", sem_coluna),
+                por_mes.get("qtde_boletos", sem_coluna),
             )
-            series_data["parcelas_media_por_mes"] = [
-                {"mes_ref": r["mes_ref"], "media_parcelas_pond": _safe_float(r["parc_media_parcelas_pond"])}
-                for _, r in parcelas_por_mes.iterrows()
-            ]
-        ranking_data = []
+        ]
+        series_data["inadimplencia_por_mes"] = _serie("taxa_inadimplencia", "taxa_inadimplencia")
+        series_data["taxa_pago_no_vencimento_por_mes"] = _serie("taxa_pago_no_vencimento", "taxa_pago_no_vencimento")
+        series_data["tempo_medio_pagamento_por_mes"] = _serie("tempo_medio_pagamento_dias", "tempo_medio_pagamento_dias")
+        series_data["parcelas_media_por_mes"] = _serie("parc_media_parcelas_pond", "media_parcelas_pond")
+
+    ranking_data = []
+    if "ranking" in secoes:
         hoje_utc = datetime.utcnow().date()
         first_day = hoje_utc.replace(day=1)
-        for cid in df_recorte_all["clinica_id"].dropna().unique():
-            cid = _safe_str(cid)
-            df_clin_periodo = df_recorte_all[df_recorte_all["clinica_id"] == cid].copy()
-            if df_clin_periodo.empty:
-                continue
-            last_dt_periodo = df_clin_periodo["mes_ref_date"].max()
-            df_clin_ultimo = df_clin_periodo[df_clin_periodo["mes_ref_date"] == last_dt_periodo]
-            row = df_clin_ultimo.iloc[0]
-            cutoff_rank = _cutoff_mes_fechado_por_importacao(df_importacoes, cid)
-            if cutoff_rank is None:
-                cutoff_rank = pd.to_datetime(first_day) - pd.Timedelta(days=1)
-            if pd.isna(cutoff_rank) or cutoff_rank > max_dt:
-                cutoff_rank = max_dt
-            (limite_sugerido_rank, _, _, _, _, _, _) = _calculate_limite_sugerido(cid, df, cutoff_rank)
-            info = clinicas_info_map.get(cid, {})
-            ranking_data.append({
-                "clinica_id": cid,
-                "clinica_nome": _safe_str(row.get("clinica_nome")),
-                "clinica_codigo": info.get("codigo_clinica") or _safe_str(row.get("clinica_nome")),
-                "clinica_nome_real": info.get("nome"),
-                "cnpj": _safe_str(row.get("cnpj")),
-                "score_credito": _safe_float(df_clin_ultimo["score_ajustado"].mean()),
-                "categoria_risco": _categoria_from_score(_safe_float(df_clin_ultimo["score_ajustado"].mean())),
-                "limite_aprovado": _safe_float(row.get("limite_aprovado")),
-                "limite_utilizado": _safe_float(utilizacao_por_clinica.get(cid, 0)),
-                "limite_disponivel": (
-                    max(
-                        (_safe_float(row.get("limite_aprovado")) or 0)
-                        - (_safe_float(utilizacao_por_clinica.get(cid, 0)) or 0),
-                        0.0,
-                    )
-                    if row.get("limite_aprovado") is not None
-                    else None
-                ),
-                "limite_sugerido": limite_sugerido_rank,
-                "valor_total_emitido_periodo": _safe_float(df_clin_periodo["valor_total_emitido"].sum()),
-                "inadimplencia_media_periodo": _weighted_avg(df_clin_periodo, "taxa_inadimplencia_real"),
-            })
-        ranking_data = sorted(ranking_data, key=lambda x: (x["score_credito"] or 0), reverse=True)
-
+        chave_ranking = (idx_inicio, idx_fim, first_day)
+        cache_ranking = {} if cache_ranking is None else cache_ranking
+        ranking_data = cache_ranking.get(chave_ranking)
+        if ranking_data is None:
+            if df_recorte_all is None:
+                df_recorte_all = _no_periodo(df)
+            # O recorte mantém a contiguidade por clínica do snapshot
+            clinicas_rank = list(_particionar_por_clinica(df_recorte_all))
+            cutoffs_rank = _cutoffs_clinicas(
+                tabela_cutoffs, clinicas_rank, pd.to_datetime(first_day) - pd.Timedelta(days=1), max_dt
+            )
+            limites_rank = _calcular_limites_sugeridos(
+                df, cutoffs_rank, emitido_por_mes=resumo_mensal["valor_total_emitido"]
+            )["limite_sugerido"]
+            ranking_data = _montar_ranking(df_recorte_all, limites_rank, clinicas_info_map, utilizacao_por_clinica)
+            if len(cache_ranking) >= RANKING_CACHE_MAX:
+                cache_ranking.clear()
+            cache_ranking[chave_ranking] = ranking_data
+
+    filtros = {}
+    if "filtros" in secoes:
         meses_faltantes = []
         disponivel_min = None
         disponivel_max = None
         if not df_ctx.empty:
             disponivel_min = _format_mes_ref(df_ctx["mes_ref_date"].min())
             disponivel_max = _format_mes_ref(df_ctx["mes_ref_date"].max())
-            meses_solicitados = pd.period_range(
-                periodo_inicio,
-                periodo_fim,
-                freq="M",
-            )
-            meses_existentes = set(df_ctx["mes_ref_period"].astype(str))
-            meses_faltantes = [str(p) for p in meses_solicitados if str(p) not in meses_existentes]
-
-        return jsonable_encoder({
-            "filtros": {
-                "periodo": {
-                    "min_mes_ref": _format_mes_ref(dt_inicio),
-                    "max_mes_ref": _format_mes_ref(dt_fim),
-                    "solicitado_min": _format_mes_ref(dt_inicio),
-                    "solicitado_max": _format_mes_ref(dt_fim),
-                    "disponivel_min": disponivel_min,
-                    "disponivel_max": disponivel_max,
-                    "meses_faltantes": meses_faltantes,
-                    "todos_meses": sorted({_format_mes_ref(m) for m in df["mes_ref_date"].unique() if m is not None}),
-                }
-            },
-            "contexto": {
-                "clinica_id": clinica_id,
-                "clinica_nome": nome_clinica,
-                "clinica_codigo": codigo_clinica,
-                "clinica_nome_real": nome_real,
-            },
-            "kpis": kpis,
-            "series": series_data,
-            "ranking_clinicas": ranking_data,
-            "limite_motor": limit_motor,
-        })
+            faltantes = np.setdiff1d(np.arange(idx_inicio, idx_fim + 1), df_ctx["mes_idx"].to_numpy())
+            meses_faltantes = [_mes_ref_de_idx(int(i)) for i in faltantes]
+        filtros["periodo"] = {
+            "min_mes_ref": _mes_ref_de_idx(idx_inicio),
+            "max_mes_ref": _mes_ref_de_idx(idx_fim),
+            "solicitado_min": _mes_ref_de_idx(idx_inicio),
+            "solicitado_max": _mes_ref_de_idx(idx_fim),
+            "disponivel_min": disponivel_min,
+            "disponivel_max": disponivel_max,
+            "meses_faltantes": meses_faltantes,
+            "todos_meses": [_mes_ref_de_idx(int(i)) for i in resumo_mensal.index],
+        }
+
+    return jsonable_encoder({
+        "filtros": filtros,
+        "contexto": {
+            "clinica_id": clinica_id,
+            "clinica_nome": nome_clinica,
+            "clinica_codigo": codigo_clinica,
+            "clinica_nome_real": nome_real,
+        },
+        "kpis": kpis,
+        "series": series_data,
+        "ranking_clinicas": ranking_data,
+        "limite_motor": limit_motor,
+    })
+
+
+@app.get("/dashboard", response_model=DashboardData)
+async def dashboard_completo(
+    clinica_id: str | None = None,
+    meses: int = 12,
+    inicio: str | None = None,
+    fim: str | None = None,
+    mes_ref_custom: str | None = None,
+    sections: str | None = None,
+):
+    secoes = _secoes_dashboard(sections)
+    try:
+        snap = await get_portfolio_snapshot()
+        snap = await _snapshot_dashboard(snap, clinica_id, meses, inicio, fim, mes_ref_custom, secoes)
+        return await run_in_threadpool(
+            _montar_dashboard,
+            snap["df"],
+            snap["particao"],
+            snap["cutoffs"],
+            snap["clinicas_info_map"],
+            snap["utilizacao_por_clinica"],
+            clinica_id,
+            meses,
+            inicio,
+            fim,
+            mes_ref_custom,
+            secoes,
+            snap["resumo_mensal"],
+            snap["cache_ranking"],
+        )
     except Exception as e:
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado: {e}")
 
-async def _generate_export_df(payload: ExportPayload) -> pd.DataFrame:
+
+@app.post("/limites/sugeridos")
+async def limites_sugeridos(payload: LimitesSugeridosPayload):
+    """
+    Limite sugerido e componentes de várias clínicas de uma vez, com os
+    mesmos campos de `limite_motor` do /dashboard?clinica_id=.
+    """
     try:
-        rows = supabase_get_all("vw_dashboard_final", select="*")
-        df = to_df(rows)
-        if df.empty: return pd.DataFrame()
-        importacoes_rows = supabase_get_all(
-            "importacoes",
-            select="clinica_id,criado_em",
+        snap = await get_portfolio_snapshot()
+        snap = await _snapshot_desde(snap, await _mes_idx_limites(snap, payload.clinica_ids))
+        limites = await run_in_threadpool(
+            _motores_limite,
+            snap["df"],
+            snap["particao"],
+            snap["cutoffs"],
+            snap["resumo_mensal"],
+            payload.clinica_ids,
         )
-        df_importacoes = to_df(importacoes_rows, ["clinica_id", "criado_em"])
+        return {"limites": limites}
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado: {e}")
 
+async def _generate_export_df(payload: ExportPayload) -> pd.DataFrame:
+    try:
+        snap = await get_portfolio_snapshot()
+        # Meses pedidos + a janela de 12m dos limites sugeridos exportados
+        meses_pedidos = [
+            _mes_idx_de(dt)
+            for dt in pd.to_datetime(pd.Series(payload.months, dtype=object) + "-01", errors="coerce")
+            if pd.notna(dt)
+        ]
+        if meses_pedidos:
+            snap = await _snapshot_periodo_limites(snap, min(meses_pedidos), max(meses_pedidos))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao carregar dados: {e}")
 
-    df["mes_ref_date"] = pd.to_datetime(df.get("mes_ref_date", df.get("mes_ref")), errors="coerce")
-    
-    numeric_cols = ["valor_total_emitido", "taxa_pago_no_vencimento", "taxa_inadimplencia", "tempo_medio_pagamento_dias", "parc_media_parcelas_pond", "valor_medio_boleto", "limite_aprovado"]
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return await run_in_threadpool(
+        _montar_export_df, snap["df"], snap["cutoffs"], payload
+    )
+
+
+def _colunas_export(payload: ExportPayload, df: pd.DataFrame) -> list:
+    """Colunas do snapshot usadas pela exportação: as do cálculo + as pedidas."""
+    colunas = _uniao_colunas(
+        COLUNAS_PORTFOLIO["export"], COLUNAS_EXPORT_CALCULADAS, payload.columns
+    )
+    return [c for c in colunas if c in df.columns]
+
+
+def _montar_export_df(df: pd.DataFrame, tabela_cutoffs: pd.DataFrame, payload: ExportPayload) -> pd.DataFrame:
+    if df.empty: return pd.DataFrame()
+    # Recorte + assign devolvem um frame novo: o snapshot compartilhado não é alterado
+    df = df[_colunas_export(payload, df)].assign(categoria_risco=df["categoria_risco_ajustada"])
 
-    df["taxa_pago_no_vencimento"] = df["taxa_pago_no_vencimento"].clip(0, 1).fillna(0)
-    df["taxa_inadimplencia"] = df["taxa_inadimplencia"].clip(0, 1).fillna(0)
-    df["valor_nao_pago_no_venc"] = df["valor_total_emitido"].fillna(0) * (1 - df["taxa_pago_no_vencimento"])
-    df["valor_inad_real"] = df["valor_nao_pago_no_venc"] * df["taxa_inadimplencia"]
-    df["taxa_inadimplencia_real"] = (df["valor_inad_real"] / df["valor_total_emitido"]).where(df["valor_total_emitido"] > 0, 0)
-    df["taxa_inadimplencia"] = df["taxa_inadimplencia_real"]
-    df["score_ajustado"] = df.apply(_calc_score_row, axis=1)
-    df["categoria_risco"] = df["score_ajustado"].apply(_categoria_from_score)
-    
     hoje_utc = datetime.utcnow().date()
     first_day = hoje_utc.replace(day=1)
     cutoff_dt = pd.to_datetime(first_day) - pd.Timedelta(days=1)
@@ -2672,25 +4252,15 @@ async def _generate_export_df(payload: ExportPayload) -> pd.DataFrame:
         cutoff_dt = df["mes_ref_date"].max()
 
     max_dt = df["mes_ref_date"].max()
-    limites_sugeridos = {}
-    valor_ultimo_mes_fechado = {}
-    for cid in df["clinica_id"].unique():
-        cutoff_clin = _cutoff_mes_fechado_por_importacao(df_importacoes, cid) or cutoff_dt
-        if pd.isna(cutoff_clin) or cutoff_clin > max_dt:
-            cutoff_clin = max_dt
-        limites_sugeridos[cid] = _calculate_limite_sugerido(cid, df, cutoff_clin)[0]
-        df_clin = df[(df["clinica_id"] == cid) & (df["mes_ref_date"] <= cutoff_clin)].copy()
-        if df_clin.empty:
-            valor_ultimo_mes_fechado[cid] = None
-        else:
-            last_dt = df_clin["mes_ref_date"].max()
-            valor_ultimo_mes_fechado[cid] = _safe_float(
-                df_clin[df_clin["mes_ref_date"] == last_dt]["valor_total_emitido"].sum()
-            )
-    df["limite_sugerido"] = df["clinica_id"].map(limites_sugeridos)
-    df["valor_emitido_ultimo_mes_fechado"] = df["clinica_id"].map(valor_ultimo_mes_fechado)
-
-    df["mes_ref"] = df["mes_ref_date"].dt.strftime('%Y-%m')
+    cutoffs = _cutoffs_clinicas(tabela_cutoffs, df["clinica_id"].unique(), cutoff_dt, max_dt)
+    # O valor do último mês fechado é a própria base_ultimo_mes do motor
+    limites = _calcular_limites_sugeridos(df, cutoffs)
+    limites_sugeridos = limites["limite_sugerido"]
+    valor_ultimo_mes_fechado = limites["base_ultimo_mes"]
+    df["limite_sugerido"] = df["clinica_id"].map(limites_sugeridos).astype("float64")
+    df["valor_emitido_ultimo_mes_fechado"] = df["clinica_id"].map(valor_ultimo_mes_fechado).astype("float64")
+
+    df["mes_ref"] = _meses_ref_de_idx(df["mes_idx"])
     df_filtered = df[df["mes_ref"].isin(payload.months)].copy()
 
     if payload.clinica_ids:
@@ -2707,14 +4277,14 @@ async def _generate_export_df(payload: ExportPayload) -> pd.DataFrame:
         }
         valid_agg_funcs = {k: v for k, v in agg_funcs.items() if k in df_filtered.columns}
         df_filtered = df_filtered.sort_values('mes_ref_date')
-        grouped = df_filtered.groupby(['clinica_id', 'clinica_nome', 'cnpj'], as_index=False)
+        grouped = df_filtered.groupby(['clinica_id', 'clinica_nome', 'cnpj'], as_index=False, observed=True)
         df_agg = grouped.agg(valid_agg_funcs)
 
         if 'valor_total_emitido' in df_agg and 'valor_inad_real' in df_agg:
              df_agg["taxa_inadimplencia_real"] = (df_agg["valor_inad_real"] / df_agg["valor_total_emitido"]).where(df_agg["valor_total_emitido"] > 0, 0)
 
         if 'categoria_risco' in payload.columns and 'clinica_id' in df_filtered.columns:
-            latest_categoria = df_filtered.loc[df_filtered.groupby('clinica_id')['mes_ref_date'].idxmax()][['clinica_id', 'categoria_risco']]
+            latest_categoria = df_filtered.loc[df_filtered.groupby('clinica_id', observed=True)['mes_ref_date'].idxmax()][['clinica_id', 'categoria_risco']]
             df_agg = pd.merge(df_agg, latest_categoria, on='clinica_id', how='left')
 
         df_final = df_agg
@@ -2726,13 +4296,13 @@ async def _generate_export_df(payload: ExportPayload) -> pd.DataFrame:
         and "limite_sugerido" not in df_final.columns
         and "clinica_id" in df_final.columns
     ):
-        df_final["limite_sugerido"] = df_final["clinica_id"].map(limites_sugeridos)
+        df_final["limite_sugerido"] = df_final["clinica_id"].map(limites_sugeridos).astype("float64")
     if (
         "valor_emitido_ultimo_mes_fechado" in payload.columns
         and "valor_emitido_ultimo_mes_fechado" not in df_final.columns
         and "clinica_id" in df_final.columns
     ):
-        df_final["valor_emitido_ultimo_mes_fechado"] = df_final["clinica_id"].map(valor_ultimo_mes_fechado)
+        df_final["valor_emitido_ultimo_mes_fechado"] = df_final["clinica_id"].map(valor_ultimo_mes_fechado).astype("float64")
 
     final_columns = [col for col in payload.columns if col in df_final.columns]
     return df_final[final_columns]
@@ -2760,7 +4330,7 @@ async def export_dashboard(payload: ExportPayload):
         raise HTTPException(status_code=404, detail="Nenhum dado encontrado para exportar com os filtros selecionados.")
 
     output = BytesIO()
-    df.to_excel(output, index=False, sheet_name='Dados')
+    await run_in_threadpool(df.to_excel, output, index=False, sheet_name='Dados')
     output.seek(0)
     
     filename = f"relatorio_credito_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
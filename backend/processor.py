@@ -1,12 +1,13 @@
 import os
 import re
 import math
-import requests
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
 from io import BytesIO
 
+from supabase_client import get_session
+
 # ==========================
 # CARREGAR ENV
 # ==========================
@@ -283,7 +284,7 @@ def dedupe(registros, conflict_cols):
 
 def supabase_upsert(table, data, conflict):
     url = f"{SUPABASE_URL}/rest/v1/{table}?on_conflict={conflict}"
-    r = requests.post(url, headers=HEADERS, json=data)
+    r = get_session().post(url, headers=HEADERS, json=data)
 
     if r.status_code not in (200, 201):
         raise RuntimeError(
@@ -298,7 +299,7 @@ def supabase_upsert(table, data, conflict):
 
 def supabase_insert(table, data):
     url = f"{SUPABASE_URL}/rest/v1/{table}"
-    r = requests.post(url, headers=HEADERS, json=data)
+    r = get_session().post(url, headers=HEADERS, json=data)
     if r.status_code not in (200, 201):
         raise RuntimeError(
             f"Erro ao enviar para {table}: {r.status_code} - {r.text}"
@@ -311,7 +312,7 @@ def supabase_insert(table, data):
 
 def get_or_create_clinica(cnpj, codigo_clinica):
     url = f"{SUPABASE_URL}/rest/v1/clinicas?cnpj=eq.{cnpj}"
-    r = requests.get(url, headers=HEADERS)
+    r = get_session().get(url, headers=HEADERS)
 
     if r.status_code == 200:
         data = r.json()
@@ -546,7 +547,7 @@ def registrar_importacao(clinica_id, arquivo_nome, parsed, contagem):
         "mes_ref": mes_ref  # 🔥 AGORA SALVAMOS O MES_REF
     }
 
-    requests.post(url, headers=HEADERS, json=payload)
+    get_session().post(url, headers=HEADERS, json=payload)
 
 
 # ==========================
@@ -0,0 +1,111 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+    ipc = None
+
+# ==========================
+# SNAPSHOT EM DISCO (ARROW IPC)
+# ==========================
+
+# Ponteiro para a versão atual; trocado atomicamente depois que todos os
+# arquivos .arrow da versão foram gravados.
+ARQUIVO_META = "snapshot.json"
+
+
+def disponivel() -> bool:
+    return pa is not None
+
+
+def _caminho(diretorio: str, nome: str, versao_id: str) -> str:
+    return os.path.join(diretorio, f"{nome}-{versao_id}.arrow")
+
+
+def _tabela(df: pd.DataFrame):
+    """
+    Tabela Arrow do frame com as colunas float gravadas como valores (NaN
+    em vez de bitmap de nulos): sem nulos, voltam do mapa sem cópia.
+    """
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    for i, campo in enumerate(tabela.schema):
+        dtype = df[campo.name].dtype
+        if isinstance(dtype, np.dtype) and dtype.kind == "f":
+            tabela = tabela.set_column(i, campo, pa.array(df[campo.name].to_numpy(), type=campo.type))
+    return tabela
+
+
+def _gravar_frame(caminho: str, df: pd.DataFrame):
+    tabela = _tabela(df)
+    tmp = f"{caminho}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+    os.replace(tmp, caminho)
+
+
+def gravar(diretorio: str, frames: dict, meta: dict):
+    """
+    Grava cada frame em Arrow IPC (`<nome>-<versao>.arrow`) e só então
+    publica `snapshot.json`. Leitores nunca veem uma versão pela metade, e
+    os arquivos antigos podem ser removidos mesmo com outro processo
+    ainda mapeando-os (o inode continua válido até o munmap).
+    """
+    if not disponivel():
+        return
+    os.makedirs(diretorio, exist_ok=True)
+    versao_id = uuid.uuid4().hex
+    for nome, df in frames.items():
+        _gravar_frame(_caminho(diretorio, nome, versao_id), df)
+
+    meta = {**meta, "id": versao_id, "frames": sorted(frames)}
+    tmp = os.path.join(diretorio, f"{ARQUIVO_META}.{versao_id}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(diretorio, ARQUIVO_META))
+
+    for arquivo in os.listdir(diretorio):
+        if arquivo.endswith(".arrow") and versao_id not in arquivo:
+            try:
+                os.remove(os.path.join(diretorio, arquivo))
+            except OSError:
+                pass
+
+
+def carregar(diretorio: str):
+    """
+    Lê a versão publicada via memory map. Números, datas e textos ficam
+    apontando para o mapa (somente leitura, páginas do page cache
+    compartilhadas entre os workers que leem o mesmo arquivo); só as
+    categorias são decodificadas. Retorna (frames, meta) ou None se não
+    houver snapshot.
+    """
+    if not disponivel():
+        return None
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_META), encoding="utf-8") as f:
+            meta = json.load(f)
+        frames = {}
+        for nome in meta["frames"]:
+            # Sem fechar o mapa: colunas sem cópia continuam apontando para ele
+            source = pa.memory_map(_caminho(diretorio, nome, meta["id"]), "r")
+            # split_blocks: uma coluna por bloco, sem consolidar (copiar) as do mesmo dtype
+            frames[nome] = ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+        return frames, meta
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+
+
+def remover(diretorio: str):
+    """Despublica o snapshot (os .arrow órfãos saem na próxima gravação)."""
+    try:
+        os.remove(os.path.join(diretorio, ARQUIVO_META))
+    except OSError:
+        pass
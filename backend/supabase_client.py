@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson é opcional
+    orjson = None
+
+# ==========================
+# CONFIG POOL HTTP
+# ==========================
+
+POOL_CONNECTIONS = int(os.getenv("SUPABASE_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("SUPABASE_POOL_MAXSIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", "60"))
+KEEPALIVE = os.getenv("SUPABASE_KEEPALIVE", "1").strip().lower() not in ("0", "false", "no")
+
+
+def _brotli_disponivel() -> bool:
+    for modulo in ("brotli", "brotlicffi"):
+        try:
+            __import__(modulo)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+# Compressão pedida nas respostas; httpx/urllib3 só decodificam "br" com
+# brotli (ou brotlicffi) instalado.
+ACCEPT_ENCODING = os.getenv("SUPABASE_ACCEPT_ENCODING") or (
+    "br, gzip" if _brotli_disponivel() else "gzip"
+)
+
+
+# ==========================
+# CONTADORES
+# ==========================
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requisicoes": 0,
+    "conexoes_abertas": 0,
+}
+
+
+def _incrementar(chave: str, valor: int = 1):
+    with _stats_lock:
+        _stats[chave] = _stats.get(chave, 0) + valor
+
+
+def pool_stats():
+    """Snapshot dos contadores do pool (requisições x conexões TCP abertas)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["conexoes_reutilizadas"] = max(stats["requisicoes"] - stats["conexoes_abertas"], 0)
+    stats["pool_connections"] = POOL_CONNECTIONS
+    stats["pool_maxsize"] = POOL_MAXSIZE
+    stats["keepalive"] = KEEPALIVE
+    return stats
+
+
+# ---- Bytes transferidos (rede x decodificado) ----
+
+_transferencia: dict = {}
+
+
+def _registrar_transferencia(tabela: str, bytes_rede: int, bytes_decodificados: int):
+    with _stats_lock:
+        t = _transferencia.setdefault(
+            tabela, {"requisicoes": 0, "bytes_rede": 0, "bytes_decodificados": 0}
+        )
+        t["requisicoes"] += 1
+        t["bytes_rede"] += bytes_rede
+        t["bytes_decodificados"] += bytes_decodificados
+
+
+def transferencia_stats():
+    """Bytes na rede (comprimidos) x decodificados, por tabela e no total."""
+    with _stats_lock:
+        por_tabela = {tabela: dict(t) for tabela, t in _transferencia.items()}
+    total = {"requisicoes": 0, "bytes_rede": 0, "bytes_decodificados": 0}
+    for t in por_tabela.values():
+        for chave in total:
+            total[chave] += t[chave]
+    for t in [*por_tabela.values(), total]:
+        t["taxa_compressao"] = (
+            t["bytes_decodificados"] / t["bytes_rede"] if t["bytes_rede"] else None
+        )
+    return {
+        "accept_encoding": ACCEPT_ENCODING,
+        "decodificador": "orjson" if orjson is not None else "json",
+        "total": total,
+        "tabelas": por_tabela,
+    }
+
+
+def decodificar_json(r: httpx.Response, tabela: str):
+    """
+    Decodifica o corpo JSON de uma resposta do PostgREST (orjson quando
+    instalado) e contabiliza os bytes da tabela: `num_bytes_downloaded` é
+    o que veio pela rede, antes de descomprimir.
+    """
+    conteudo = r.content
+    _registrar_transferencia(tabela, r.num_bytes_downloaded, len(conteudo))
+    if orjson is not None:
+        return orjson.loads(conteudo)
+    return json.loads(conteudo)
+
+
+class _ContadorHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _incrementar("conexoes_abertas")
+        return super()._new_conn()
+
+
+class _ContadorHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _incrementar("conexoes_abertas")
+        return super()._new_conn()
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter com timeout padrão e contagem de conexões novas."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _ContadorHTTPConnectionPool,
+            "https": _ContadorHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        _incrementar("requisicoes")
+        return super().send(request, **kwargs)
+
+
+# ==========================
+# SESSÃO COMPARTILHADA
+# ==========================
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _criar_session():
+    session = requests.Session()
+    adapter = _PooledAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    if not KEEPALIVE:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Retorna a sessão HTTP compartilhada (keep-alive + pool de conexões).
+    Todas as chamadas ao Supabase devem passar por aqui para reaproveitar
+    o handshake TCP/TLS entre páginas e entre requisições.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _criar_session()
+    return _session
+
+
+# ==========================
+# CLIENTE ASSÍNCRONO
+# ==========================
+
+_async_client: httpx.AsyncClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def _trace_conexao(event_name: str, info: dict):
+    if event_name == "connection.connect_tcp.complete":
+        _incrementar("conexoes_abertas")
+
+
+async def _on_request(request: httpx.Request):
+    _incrementar("requisicoes")
+    request.extensions["trace"] = _trace_conexao
+
+
+def _criar_async_client():
+    limits = httpx.Limits(
+        max_connections=POOL_MAXSIZE,
+        max_keepalive_connections=POOL_MAXSIZE if KEEPALIVE else 0,
+    )
+    headers = {"Accept-Encoding": ACCEPT_ENCODING}
+    if not KEEPALIVE:
+        headers["Connection"] = "close"
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        headers=headers,
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Retorna o cliente httpx compartilhado do event loop atual.
+    Mesmo pool/timeouts/contadores da sessão síncrona, mas sem bloquear o loop.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = _criar_async_client()
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
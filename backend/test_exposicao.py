@@ -0,0 +1,56 @@
+"""
+Exposição por clínica (rpc exposicao_por_clinica) com ids que não são uuid.
+
+    cd backend && python -m pytest -q test_exposicao.py
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# main exige as credenciais na importação; os testes não chamam o Supabase
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "teste")
+os.environ.setdefault("SUPABASE_KEY", "teste")
+
+import main  # noqa: E402
+
+CLINICA = "0b6f3c2e-6d0a-4c59-9a3f-1f4a2f9d8e11"
+
+
+@pytest.fixture
+def chamadas_rpc(monkeypatch):
+    """Substitui a rpc: registra os parâmetros e devolve uma linha por id pedido."""
+    chamadas = []
+
+    async def rpc(nome, params=None):
+        chamadas.append((nome, params))
+        return [
+            {"clinica_id": cid, "total_antecipado": 100.0, "total_reembolsado": 40.0, "em_aberto": 60.0}
+            for cid in (params or {}).get("p_clinica_ids", [])
+        ]
+
+    monkeypatch.setattr(main, "supabase_rpc", rpc)
+    return chamadas
+
+
+def test_ids_invalidos_nao_chamam_a_rpc(chamadas_rpc):
+    assert asyncio.run(main.exposicao_por_clinica(["abc", "", None, "123"])) == {}
+    assert chamadas_rpc == []
+
+
+def test_ids_invalidos_sao_descartados(chamadas_rpc):
+    exposicao = asyncio.run(main.exposicao_por_clinica([CLINICA, "abc"]))
+    assert list(exposicao) == [CLINICA]
+    assert chamadas_rpc == [("exposicao_por_clinica", {"p_clinica_ids": [CLINICA]})]
+
+
+def test_resumo_antecipacoes_com_id_invalido(chamadas_rpc, monkeypatch):
+    async def get_all(table, **kwargs):
+        return []
+
+    monkeypatch.setattr(main, "supabase_get_all", get_all)
+    r = TestClient(main.app).get("/antecipacoes/resumo", params={"clinica_id": "abc"})
+    assert r.status_code == 200
+    assert chamadas_rpc == []
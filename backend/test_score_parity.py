@@ -0,0 +1,114 @@
+"""
+Paridade entre o score/categoria/fator vetorizados do enriquecimento do
+portfólio e as versões escalares linha a linha.
+
+    cd backend && python -m pytest -q test_score_parity.py
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# main exige as credenciais na importação; os testes não chamam o Supabase
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "teste")
+os.environ.setdefault("SUPABASE_KEY", "teste")
+
+import main  # noqa: E402
+
+COLUNAS_SCORE = [
+    "taxa_inadimplencia_real", "taxa_pago_no_vencimento",
+    "tempo_medio_pagamento_dias", "parc_media_parcelas_pond",
+]
+
+
+def _scores_escalares(df: pd.DataFrame) -> list:
+    return [main._calc_score_row(row) for row in df.to_dict(orient="records")]
+
+
+def _frame_aleatorio(semente: int, n: int = 500) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        "taxa_inadimplencia_real": rng.uniform(-0.01, 0.08, n),
+        "taxa_pago_no_vencimento": rng.uniform(0.3, 1.2, n),
+        "tempo_medio_pagamento_dias": rng.uniform(-5, 120, n),
+        "parc_media_parcelas_pond": rng.uniform(0, 15, n),
+    })
+    # Nulos espalhados em todas as colunas
+    for col in COLUNAS_SCORE:
+        df.loc[rng.random(n) < 0.1, col] = np.nan
+    return df
+
+
+def _bordas() -> pd.DataFrame:
+    """Zeros, nulos e valores exatamente nos pontos de clamp de cada risco."""
+    return pd.DataFrame({
+        "taxa_inadimplencia_real": [0.0, np.nan, 0.03, 0.0300001, 1.0, -1.0, 0.015, 0.0],
+        "taxa_pago_no_vencimento": [1.0, np.nan, 0.75, 0.0, 1.5, 0.74999, 0.875, 0.0],
+        "tempo_medio_pagamento_dias": [5.0, np.nan, 65.0, 0.0, 500.0, 4.999, 35.0, 0.0],
+        "parc_media_parcelas_pond": [1.0, np.nan, 12.0, 0.0, 100.0, 0.5, 6.5, 0.0],
+    })
+
+
+def _limites_das_faixas() -> np.ndarray:
+    """Cada limite de faixa, o vizinho imediato abaixo/acima, extremos e nulo."""
+    limites = [lim for lim, _ in main.FAIXAS_FATOR_LIMITE + main.FAIXAS_CATEGORIA]
+    valores = [0.0, 1.0, -0.1, 1.1, np.nan]
+    for lim in limites:
+        valores += [lim, np.nextafter(lim, -np.inf), np.nextafter(lim, np.inf)]
+    return np.array(valores, dtype="float64")
+
+
+@pytest.mark.parametrize("semente", [0, 1, 2, 3])
+def test_score_vetorizado_igual_ao_escalar_aleatorio(semente):
+    df = _frame_aleatorio(semente)
+    np.testing.assert_array_equal(main._calc_score_df(df).to_numpy(), _scores_escalares(df))
+
+
+def test_score_vetorizado_igual_ao_escalar_bordas():
+    df = _bordas()
+    np.testing.assert_array_equal(main._calc_score_df(df).to_numpy(), _scores_escalares(df))
+
+
+@pytest.mark.parametrize("ausente", COLUNAS_SCORE)
+def test_score_coluna_ausente_nao_gera_risco(ausente):
+    df = _frame_aleatorio(7, n=50).drop(columns=ausente)
+    np.testing.assert_array_equal(main._calc_score_df(df).to_numpy(), _scores_escalares(df))
+
+
+def test_score_frame_vazio():
+    df = pd.DataFrame({col: pd.Series(dtype="float64") for col in COLUNAS_SCORE})
+    resultado = main._calc_score_df(df)
+    assert resultado.empty
+    assert resultado.dtype == "float64"
+
+
+def test_categoria_vetorizada_igual_a_escalar():
+    scores = np.concatenate([_limites_das_faixas(), np.random.default_rng(11).uniform(0, 1, 500)])
+    vetorizada = main._categoria_from_score_arr(scores)
+    assert list(vetorizada) == [main._categoria_from_score(s) for s in scores]
+
+
+def test_fator_limite_vetorizado_igual_ao_escalar():
+    scores = np.concatenate([_limites_das_faixas(), np.random.default_rng(12).uniform(0, 1, 500)])
+    vetorizado = main._fator_limite_score_arr(scores)
+    np.testing.assert_array_equal(vetorizado, [main._fator_limite_score(s) for s in scores])
+
+
+def test_categoria_e_fator_de_lista_vazia():
+    assert len(main._categoria_from_score_arr([])) == 0
+    assert len(main._fator_limite_score_arr([])) == 0
+
+
+def test_pipeline_do_score_ate_categoria_e_fator():
+    """Score calculado linha a linha e vetorizado levam às mesmas faixas."""
+    df = pd.concat([_frame_aleatorio(5), _bordas()], ignore_index=True)
+    escalares = _scores_escalares(df)
+    vetorizados = main._calc_score_df(df)
+    assert list(main._categoria_from_score_arr(vetorizados)) == [
+        main._categoria_from_score(s) for s in escalares
+    ]
+    np.testing.assert_array_equal(
+        main._fator_limite_score_arr(vetorizados), [main._fator_limite_score(s) for s in escalares]
+    )
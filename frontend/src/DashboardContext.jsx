@@ -7,6 +7,34 @@ import SidebarLimite from "./dashboard/SidebarLimite";
 
 const DashboardContext = createContext();
 
+// Seções do /dashboard que cada aba lê; filtros (cabeçalho e filtros) e,
+// com clínica, kpis + limite_motor (resumo do motor e SidebarLimite) vêm sempre
+const SECOES_POR_ABA = {
+  overview: ["kpis"],
+  qualidade: [],
+  limites: ["ranking"],
+  decisao: ["kpis", "limite_motor"],
+  comportamento: ["kpis", "series"],
+  carteira: ["ranking"],
+};
+
+const ORDEM_SECOES = ["kpis", "series", "ranking", "limite_motor", "filtros"];
+
+function secoesDaTela(pathname, activeTab, clinicaId) {
+  const secoes = new Set(["filtros"]);
+  if (clinicaId && clinicaId !== "todas") {
+    secoes.add("kpis");
+    secoes.add("limite_motor");
+  }
+  if (pathname.endsWith("/clinicas")) {
+    secoes.add("ranking");
+  } else if (pathname.endsWith("/dashboard")) {
+    (SECOES_POR_ABA[activeTab] || []).forEach((s) => secoes.add(s));
+  }
+  // Ordem fixa: a mesma tela gera sempre a mesma string (e o mesmo fetch)
+  return ORDEM_SECOES.filter((s) => secoes.has(s)).join(",");
+}
+
 export function DashboardProvider({ children }) {
   const { profile } = useAuth();
   const location = useLocation();
@@ -24,6 +52,9 @@ export function DashboardProvider({ children }) {
   }, [location.search]);
 
 
+  const [panelLimiteAberto, setPanelLimiteAberto] = useState(false);
+  const [activeTab, setActiveTab] = useState("overview");
+
   const { clinicas, loading: loadingClinicas } = useClinicas();
   const {
     dados,
@@ -34,11 +65,9 @@ export function DashboardProvider({ children }) {
     clinicaId,
     inicio: periodoInicio,
     fim: periodoFim,
+    sections: secoesDaTela(location.pathname, activeTab, clinicaId),
   });
 
-  const [panelLimiteAberto, setPanelLimiteAberto] = useState(false);
-  const [activeTab, setActiveTab] = useState("overview");
-
   const value = {
     profile,
     
@@ -275,17 +275,20 @@ export default function Antecipacoes() {
     let cancelled = false;
     const loadSuggestions = async () => {
       try {
-        const entries = await Promise.all(
-          missingClinicas.map(async (row) => {
-            const res = await fetch(
-              `${API_BASE_URL}/dashboard?meses=12&clinica_id=${row.clinica_id}`
-            );
-            if (!res.ok) return [row.clinica_id, null];
-            const json = await res.json();
-            return [row.clinica_id, json?.kpis?.limite_sugerido ?? null];
-          })
-        );
+        const res = await fetch(`${API_BASE_URL}/limites/sugeridos`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            clinica_ids: missingClinicas.map((row) => row.clinica_id),
+          }),
+        });
+        // Falha do lote: todas as clínicas ficam sem sugestão, como antes por clínica
+        const json = res.ok ? await res.json() : null;
         if (cancelled) return;
+        const entries = missingClinicas.map((row) => [
+          row.clinica_id,
+          json?.limites?.[row.clinica_id]?.limite_sugerido ?? null,
+        ]);
         const suggestedMap = {};
         const valueUpdates = {};
         entries.forEach(([cid, value]) => {
@@ -17,6 +17,7 @@ export function useDashboardData({
   clinicaId,
   inicio,
   fim,
+  sections,
 }) {
   const [dados, setDados] = useState(null);
   const [erro, setErro] = useState(null);
@@ -42,6 +43,11 @@ export function useDashboardData({
         params.set("clinica_id", clinicaId);
       }
 
+      // seções (kpis,series,ranking,limite_motor,filtros); sem valor = todas
+      if (sections) {
+        params.set("sections", sections);
+      }
+
       // 🔥 mês de referência forçado
       const url = `${API_BASE_URL}/dashboard?${params.toString()}`;
       const res = await fetch(url);
@@ -63,7 +69,7 @@ export function useDashboardData({
 
   useEffect(() => {
     carregar();
-  }, [clinicaId, inicio, fim]);
+  }, [clinicaId, inicio, fim, sections]);
 
   return {
     dados,
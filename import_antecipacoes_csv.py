@@ -2,7 +2,9 @@ import csv
 import os
 import sys
 from datetime import datetime
-import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from supabase_client import get_session  # noqa: E402
 
 def _load_env_file(path: str):
     if not os.path.exists(path):
@@ -44,7 +46,7 @@ def supabase_get(table: str, select: str = "*", extra_params: dict | None = None
     params = {"select": select}
     if extra_params:
         params.update(extra_params)
-    r = requests.get(url, headers=HEADERS, params=params)
+    r = get_session().get(url, headers=HEADERS, params=params)
     if r.status_code not in (200, 206):
         raise RuntimeError(f"Erro ao buscar {table}: {r.status_code} - {r.text}")
     return r.json()
@@ -54,7 +56,7 @@ def supabase_insert(table: str, data: list[dict]):
     if not data:
         return []
     url = f"{SUPABASE_URL}/rest/v1/{table}"
-    r = requests.post(
+    r = get_session().post(
         url,
         headers={**HEADERS, "Prefer": "return=representation"},
         json=data,
@@ -5,7 +5,8 @@ import zipfile
 import xml.etree.ElementTree as ET
 from decimal import Decimal, InvalidOperation
 
-import requests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from supabase_client import get_session  # noqa: E402
 
 
 def _load_env_file(path: str):
@@ -51,7 +52,7 @@ def supabase_get(table: str, select: str = "*", extra_params: dict | None = None
     params = {"select": select}
     if extra_params:
         params.update(extra_params)
-    r = requests.get(url, headers=HEADERS, params=params)
+    r = get_session().get(url, headers=HEADERS, params=params)
     if r.status_code not in (200, 206):
         raise RuntimeError(f"Erro ao buscar {table}: {r.status_code} - {r.text}")
     return r.json()
@@ -62,7 +63,7 @@ def supabase_upsert(table: str, data: list[dict], on_conflict: str = "id"):
         return []
     url = f"{SUPABASE_URL}/rest/v1/{table}"
     params = {"on_conflict": on_conflict}
-    r = requests.post(
+    r = get_session().post(
         url,
         headers={**HEADERS, "Prefer": "resolution=merge-duplicates,return=representation"},
         params=params,
@@ -0,0 +1,1077 @@
+"""
+Stand-in local do PostgREST/Supabase para desenvolvimento offline e
+benchmarks. Implementa o subconjunto da API REST que o backend usa:
+
+- GET com `select`, filtros `eq/neq/gt/gte/lt/lte/like/ilike/in/is` (e
+  `not.`), árvores lógicas `or=`/`and=`, `order`, `limit`/`offset`;
+- POST (inclusive em lote) com `on_conflict` e `Prefer: resolution=...`;
+- PATCH e DELETE com os mesmos filtros;
+- `Prefer: count=exact` / `return=representation` e `Content-Range`;
+- RPC (`/rest/v1/rpc/<funcao>`) das funções definidas em `sql/`;
+- compressão gzip/brotli conforme `Accept-Encoding`, como o gateway do
+  Supabase.
+
+As tabelas ficam em memória e são criadas a partir do schema exportado
+por `export_supabase_schema.py` (schema `public`), mais as colunas
+adicionadas pelas migrações `alter table ... add column` de `sql/`.
+Views não executam o SQL de definição: são relações somente leitura
+preenchidas pelos arquivos de dados ou pela carga sintética.
+
+Uso:
+    python postgrest_local.py --porta 54321 --sintetico 200
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE_KEY=local \\
+        uvicorn main:app   # (dentro de backend/)
+
+`--dados DIR` carrega `DIR/<tabela>.json` (lista de linhas) antes de subir.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli é opcional
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ==========================
+# CONFIGURAÇÃO
+# ==========================
+
+SCHEMA_FILE = os.getenv(
+    "POSTGREST_LOCAL_SCHEMA", os.path.join(BASE_DIR, "supabase_schema_full.json")
+)
+SQL_DIR = os.path.join(BASE_DIR, "sql")
+PORTA_PADRAO = int(os.getenv("POSTGREST_LOCAL_PORTA", "54321"))
+
+TIPOS_INTEIROS = {"int2", "int4", "int8"}
+TIPOS_DECIMAIS = {"numeric", "float4", "float8"}
+
+# Tipos SQL das migrações -> udt_name do information_schema
+TIPOS_SQL = {
+    "integer": "int4",
+    "int": "int4",
+    "bigint": "int8",
+    "smallint": "int2",
+    "boolean": "bool",
+    "timestamp": "timestamp",
+    "timestamptz": "timestamptz",
+    "date": "date",
+    "numeric": "numeric",
+    "text": "text",
+    "uuid": "uuid",
+    "jsonb": "jsonb",
+    "varchar": "varchar",
+}
+
+# Respostas a partir deste tamanho são comprimidas se o cliente aceitar
+# (no Supabase quem comprime é o gateway na frente do PostgREST)
+COMPRESSAO_MIN_BYTES = int(os.getenv("POSTGREST_LOCAL_COMPRESSAO_MIN", "1024"))
+
+# Parâmetros da URL que não são filtros de coluna
+PARAMETROS_RESERVADOS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class ErroPostgrest(Exception):
+    """Erro no formato do PostgREST ({code, message, details, hint})."""
+
+    def __init__(self, status: int, code: str, message: str, details: str | None = None):
+        super().__init__(message)
+        self.status = status
+        self.corpo = {"code": code, "message": message, "details": details, "hint": None}
+
+
+# ==========================
+# ESTADO (EM MEMÓRIA)
+# ==========================
+
+_lock = threading.RLock()
+_relacoes: dict = {}  # nome -> {"tipo", "colunas", "pk", "fks"}
+_linhas: dict = {}  # nome -> list[dict]
+_sequencias: dict = {}  # (tabela, coluna) -> último valor
+_stats = {"requisicoes": 0}
+
+
+# ==========================
+# SCHEMA
+# ==========================
+
+
+def _relacao_do_schema(item: dict, tipo: str) -> dict:
+    return {
+        "tipo": tipo,
+        "colunas": {
+            c["column_name"]: {
+                "tipo": c["udt_name"],
+                "nulo": c.get("is_nullable") != "NO",
+                "default": c.get("column_default"),
+            }
+            for c in item["columns"]
+        },
+        "pk": list(item.get("primary_key") or []),
+        "fks": [
+            fk for fk in item.get("foreign_keys") or []
+            if fk.get("foreign_table_schema", "public") == "public"
+        ],
+    }
+
+
+_RE_ALTER = re.compile(r"alter\s+table\s+(?:public\.)?(\w+)\s+(.*?);", re.I | re.S)
+_RE_ADD_COLUMN = re.compile(
+    r"add\s+column\s+(?:if\s+not\s+exists\s+)?(\w+)\s+(\w+)(.*)", re.I | re.S
+)
+_RE_DEFAULT = re.compile(r"default\s+(.+?)(?:\s+not\s+null)?\s*$", re.I | re.S)
+
+
+def _aplicar_migracoes(relacoes: dict, sql_dir: str):
+    """Colunas novas das migrações `alter table ... add column` de sql/."""
+    if not os.path.isdir(sql_dir):
+        return
+    for arquivo in sorted(os.listdir(sql_dir)):
+        if not arquivo.endswith(".sql"):
+            continue
+        with open(os.path.join(sql_dir, arquivo), encoding="utf-8") as f:
+            sql = re.sub(r"--[^\n]*", "", f.read())
+        for tabela, corpo in _RE_ALTER.findall(sql):
+            relacao = relacoes.get(tabela)
+            if relacao is None:
+                continue
+            for acao in re.split(r",\s*(?=add\s)", corpo, flags=re.I):
+                m = _RE_ADD_COLUMN.match(acao.strip())
+                if not m:
+                    continue
+                coluna, tipo_sql, resto = m.groups()
+                default = _RE_DEFAULT.search(resto.strip())
+                relacao["colunas"].setdefault(coluna, {
+                    "tipo": TIPOS_SQL.get(tipo_sql.lower(), tipo_sql.lower()),
+                    "nulo": not re.search(r"not\s+null", resto, re.I),
+                    "default": default.group(1).strip() if default else None,
+                })
+
+
+def carregar_schema(caminho: str = SCHEMA_FILE, sql_dir: str = SQL_DIR):
+    """Cria as relações (vazias) do schema `public` exportado."""
+    with open(caminho, encoding="utf-8") as f:
+        schema = json.load(f)
+
+    relacoes = {}
+    for chave, tipo in (("tables", "tabela"), ("views", "view"), ("materialized_views", "view")):
+        for item in schema.get(chave) or []:
+            if item.get("schema") == "public":
+                relacoes[item["name"]] = _relacao_do_schema(item, tipo)
+    _aplicar_migracoes(relacoes, sql_dir)
+
+    with _lock:
+        _relacoes.clear()
+        _relacoes.update(relacoes)
+        _linhas.clear()
+        _linhas.update({nome: [] for nome in relacoes})
+        _sequencias.clear()
+
+
+def _relacao(nome: str) -> dict:
+    relacao = _relacoes.get(nome)
+    if relacao is None:
+        raise ErroPostgrest(
+            404, "PGRST205", f"Could not find the table 'public.{nome}' in the schema cache"
+        )
+    return relacao
+
+
+def _coluna(relacao: dict, nome_relacao: str, coluna: str) -> dict:
+    info = relacao["colunas"].get(coluna)
+    if info is None:
+        raise ErroPostgrest(400, "42703", f"column {nome_relacao}.{coluna} does not exist")
+    return info
+
+
+# ==========================
+# TIPOS
+# ==========================
+
+
+def _normalizar(valor, tipo: str):
+    """Converte um valor (JSON ou texto da URL) para a forma que o PostgREST devolve."""
+    if valor is None:
+        return None
+    try:
+        if tipo in TIPOS_INTEIROS:
+            return int(valor)
+        if tipo in TIPOS_DECIMAIS:
+            return float(valor)
+        if tipo == "bool":
+            return valor if isinstance(valor, bool) else str(valor).lower() in ("true", "t", "1")
+        if tipo == "uuid":
+            return str(uuid.UUID(str(valor)))
+        if tipo == "date":
+            return date.fromisoformat(str(valor)[:10]).isoformat()
+        if tipo == "timestamp":
+            return datetime.fromisoformat(str(valor)).replace(tzinfo=None).isoformat()
+        if tipo == "timestamptz":
+            dt = datetime.fromisoformat(str(valor))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt.astimezone(timezone.utc).isoformat()
+        if tipo == "jsonb" or tipo == "json":
+            return valor
+        return str(valor)
+    except (TypeError, ValueError):
+        raise ErroPostgrest(400, "22P02", f'invalid input syntax for type {tipo}: "{valor}"')
+
+
+def _comparavel(valor, tipo: str):
+    """Valor normalizado -> chave de comparação/ordenação."""
+    if valor is None:
+        return None
+    if tipo in TIPOS_INTEIROS or tipo in TIPOS_DECIMAIS:
+        return float(valor)
+    if tipo in ("timestamp", "timestamptz"):
+        return datetime.fromisoformat(valor)
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, sort_keys=True)
+    return valor
+
+
+def _default(nome_relacao: str, coluna: str, default: str | None):
+    if default is None:
+        return None
+    d = default.strip()
+    if d == "gen_random_uuid()":
+        return str(uuid.uuid4())
+    if d == "now()":
+        return datetime.now(timezone.utc).isoformat()
+    if d.lower() == "current_date":
+        return date.today().isoformat()
+    if d.startswith("nextval("):
+        chave = (nome_relacao, coluna)
+        atual = _sequencias.get(chave)
+        if atual is None:
+            valores = [r.get(coluna) for r in _linhas[nome_relacao] if r.get(coluna) is not None]
+            atual = max(valores, default=0)
+        _sequencias[chave] = atual + 1
+        return atual + 1
+    m = re.match(r"^'(.*)'(?:::\w+)?$", d, re.S)
+    if m:
+        return m.group(1).replace("''", "'")
+    if d.lower() in ("true", "false"):
+        return d.lower() == "true"
+    try:
+        return float(d) if "." in d else int(d)
+    except ValueError:
+        return None
+
+
+# ==========================
+# FILTROS
+# ==========================
+
+
+def _dividir_topo(texto: str) -> list:
+    """Divide por vírgulas fora de parênteses e aspas."""
+    partes, atual, nivel, aspas, escape = [], [], 0, False, False
+    for ch in texto:
+        if escape:
+            atual.append(ch)
+            escape = False
+            continue
+        if ch == "\\" and aspas:
+            atual.append(ch)
+            escape = True
+            continue
+        if ch == '"':
+            aspas = not aspas
+        elif not aspas and ch == "(":
+            nivel += 1
+        elif not aspas and ch == ")":
+            nivel -= 1
+        elif not aspas and nivel == 0 and ch == ",":
+            partes.append("".join(atual))
+            atual = []
+            continue
+        atual.append(ch)
+    partes.append("".join(atual))
+    return partes
+
+
+def _sem_aspas(texto: str) -> str:
+    if len(texto) >= 2 and texto[0] == '"' and texto[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", texto[1:-1])
+    return texto
+
+
+def _like_regex(padrao: str, ignorar_caixa: bool):
+    regex = ""
+    for ch in padrao:
+        if ch in "%*":
+            regex += ".*"
+        elif ch == "_":
+            regex += "."
+        else:
+            regex += re.escape(ch)
+    return re.compile(regex, re.S | (re.I if ignorar_caixa else 0))
+
+
+def _nao(resultado):
+    return None if resultado is None else not resultado
+
+
+def _e(resultados: list):
+    if any(r is False for r in resultados):
+        return False
+    return None if any(r is None for r in resultados) else True
+
+
+def _ou(resultados: list):
+    if any(r is True for r in resultados):
+        return True
+    return None if any(r is None for r in resultados) else False
+
+
+def _condicao(nome_relacao: str, relacao: dict, coluna: str, expr: str, em_arvore: bool):
+    """
+    `coluna=<op>.<valor>` -> função linha -> True/False/None (lógica de três
+    valores do SQL: comparações com NULL são desconhecidas).
+    """
+    tipo = _coluna(relacao, nome_relacao, coluna)["tipo"]
+    negar = False
+    if expr.startswith("not."):
+        negar, expr = True, expr[4:]
+    op, _, valor = expr.partition(".")
+    if em_arvore and op != "in":
+        valor = _sem_aspas(valor)
+
+    if op == "is":
+        alvo = valor.lower()
+        if alvo == "null":
+            teste = lambda v: v is None  # noqa: E731
+        elif alvo == "not_null":
+            teste = lambda v: v is not None  # noqa: E731
+        elif alvo in ("true", "false"):
+            teste = lambda v: v is (alvo == "true")  # noqa: E731
+        else:
+            raise ErroPostgrest(400, "PGRST100", f'"failed to parse filter (is.{valor})"')
+
+        def cond(row):
+            return teste(row.get(coluna))
+
+    elif op == "in":
+        if not (valor.startswith("(") and valor.endswith(")")):
+            raise ErroPostgrest(400, "PGRST100", f'"failed to parse filter (in.{valor})"')
+        itens = [_sem_aspas(i.strip()) for i in _dividir_topo(valor[1:-1]) if i.strip()]
+        alvos = {_comparavel(_normalizar(i, tipo), tipo) for i in itens}
+
+        def cond(row):
+            v = row.get(coluna)
+            return None if v is None else _comparavel(v, tipo) in alvos
+
+    elif op in ("like", "ilike"):
+        regex = _like_regex(valor, op == "ilike")
+
+        def cond(row):
+            v = row.get(coluna)
+            return None if v is None else bool(regex.fullmatch(str(v)))
+
+    elif op in ("eq", "neq", "gt", "gte", "lt", "lte"):
+        alvo = _comparavel(_normalizar(valor, tipo), tipo)
+        comparar = {
+            "eq": lambda a: a == alvo,
+            "neq": lambda a: a != alvo,
+            "gt": lambda a: a > alvo,
+            "gte": lambda a: a >= alvo,
+            "lt": lambda a: a < alvo,
+            "lte": lambda a: a <= alvo,
+        }[op]
+
+        def cond(row):
+            v = row.get(coluna)
+            return None if v is None else comparar(_comparavel(v, tipo))
+
+    else:
+        raise ErroPostgrest(400, "PGRST100", f'"failed to parse filter ({op}.{valor})"')
+
+    return (lambda row: _nao(cond(row))) if negar else cond
+
+
+def _arvore(nome_relacao: str, relacao: dict, operador: str, corpo: str):
+    """`or=(a.eq.1,and(b.gt.2,c.is.null))` -> função linha -> True/False/None."""
+    negar = operador.startswith("not.")
+    operador = operador[4:] if negar else operador
+    if not (corpo.startswith("(") and corpo.endswith(")")):
+        raise ErroPostgrest(400, "PGRST100", f'"failed to parse logic tree ({corpo})"')
+
+    conds = []
+    for item in _dividir_topo(corpo[1:-1]):
+        item = item.strip()
+        m = re.match(r"^((?:not\.)?(?:and|or))(\(.*\))$", item, re.S)
+        if m:
+            conds.append(_arvore(nome_relacao, relacao, m.group(1), m.group(2)))
+            continue
+        coluna, _, expr = item.partition(".")
+        conds.append(_condicao(nome_relacao, relacao, coluna, expr, em_arvore=True))
+
+    combinar = _e if operador == "and" else _ou
+
+    def cond(row):
+        resultado = combinar([c(row) for c in conds])
+        return _nao(resultado) if negar else resultado
+
+    return cond
+
+
+def _filtros(nome_relacao: str, relacao: dict, params: list) -> list:
+    filtros = []
+    for chave, valor in params:
+        if chave in PARAMETROS_RESERVADOS:
+            continue
+        if chave in ("or", "and", "not.or", "not.and"):
+            filtros.append(_arvore(nome_relacao, relacao, chave, valor))
+        else:
+            filtros.append(_condicao(nome_relacao, relacao, chave, valor, em_arvore=False))
+    return filtros
+
+
+def _filtrar(linhas: list, filtros: list) -> list:
+    if not filtros:
+        return list(linhas)
+    return [row for row in linhas if all(f(row) is True for f in filtros)]
+
+
+# ==========================
+# SELECT / ORDER / PAGINAÇÃO
+# ==========================
+
+
+def _embed(nome_relacao: str, relacao: dict, alias: str, alvo: str, corpo: str):
+    """`clinicas:clinica_id(id,nome)`: recurso muitos-para-um pela chave estrangeira."""
+    for fk in relacao.get("fks", []):
+        if alvo in (fk["column_name"], fk["foreign_table_name"]):
+            destino = fk["foreign_table_name"]
+            subcampos = _projecao(destino, _relacao(destino), corpo)
+            return (alias or alvo, ("embed", fk, subcampos))
+    raise ErroPostgrest(
+        400, "PGRST200",
+        f"Could not find a relationship between '{nome_relacao}' and '{alvo}' in the schema cache",
+    )
+
+
+def _projecao(nome_relacao: str, relacao: dict, select: str | None):
+    """`select` -> lista de (nome_na_saida, coluna ou embed), ou None para `*`."""
+    if not select or select.strip() == "*":
+        return None
+    campos = []
+    for item in _dividir_topo(select):
+        item = item.strip()
+        if not item:
+            continue
+        m = re.match(r"^(?:(\w+):)?(\w+)(?:!\w+)?\((.*)\)$", item, re.S)
+        if m:
+            campos.append(_embed(nome_relacao, relacao, m.group(1), m.group(2), m.group(3)))
+            continue
+        item = item.split("::", 1)[0]  # casts são ignorados
+        alias, _, coluna = item.rpartition(":")
+        coluna = coluna.strip()
+        if coluna == "*":
+            campos.extend((c, c) for c in relacao["colunas"])
+            continue
+        _coluna(relacao, nome_relacao, coluna)
+        campos.append((alias.strip() or coluna, coluna))
+    return campos
+
+
+def _projetar(linhas: list, campos: list | None) -> list:
+    if campos is None:
+        return [dict(row) for row in linhas]
+
+    indices = {}
+    for _, coluna in campos:
+        if isinstance(coluna, tuple):
+            fk = coluna[1]
+            indices[id(fk)] = {
+                r.get(fk["foreign_column_name"]): r for r in _linhas[fk["foreign_table_name"]]
+            }
+
+    def valor(row, coluna):
+        if not isinstance(coluna, tuple):
+            return row.get(coluna)
+        _, fk, subcampos = coluna
+        alvo = indices[id(fk)].get(row.get(fk["column_name"]))
+        return None if alvo is None else _projetar([alvo], subcampos)[0]
+
+    return [{saida: valor(row, coluna) for saida, coluna in campos} for row in linhas]
+
+
+def _ordenar(nome_relacao: str, relacao: dict, linhas: list, order: str | None) -> list:
+    if not order:
+        return linhas
+    # Ordenações estáveis da última chave para a primeira
+    for termo in reversed([t.strip() for t in order.split(",") if t.strip()]):
+        partes = termo.split(".")
+        coluna = partes[0]
+        tipo = _coluna(relacao, nome_relacao, coluna)["tipo"]
+        desc = "desc" in partes[1:]
+        if "nullsfirst" in partes[1:]:
+            nulos_primeiro = True
+        elif "nullslast" in partes[1:]:
+            nulos_primeiro = False
+        else:
+            nulos_primeiro = desc  # padrão do Postgres
+
+        nao_nulos = [r for r in linhas if r.get(coluna) is not None]
+        nulos = [r for r in linhas if r.get(coluna) is None]
+        nao_nulos.sort(key=lambda r: _comparavel(r[coluna], tipo), reverse=desc)
+        linhas = nulos + nao_nulos if nulos_primeiro else nao_nulos + nulos
+    return linhas
+
+
+def _inteiro_param(valor: str | None, nome: str) -> int | None:
+    if valor is None or valor == "":
+        return None
+    try:
+        return max(int(valor), 0)
+    except ValueError:
+        raise ErroPostgrest(400, "PGRST100", f'"failed to parse {nome} ({valor})"')
+
+
+def _preferencias(headers) -> dict:
+    prefs = {}
+    for valor in headers.get_all("Prefer") or []:
+        for item in valor.split(","):
+            chave, _, v = item.strip().partition("=")
+            if chave:
+                prefs[chave] = v
+    return prefs
+
+
+def _content_range(inicio: int, quantidade: int, total: int | None) -> str:
+    total_txt = "*" if total is None else str(total)
+    if quantidade == 0:
+        return f"*/{total_txt}"
+    return f"{inicio}-{inicio + quantidade - 1}/{total_txt}"
+
+
+# ==========================
+# OPERAÇÕES
+# ==========================
+
+
+def _param(params: list, nome: str) -> str | None:
+    for chave, valor in params:
+        if chave == nome:
+            return valor
+    return None
+
+
+def _ler(nome_relacao: str, relacao: dict, linhas: list, params: list, prefs: dict):
+    """Filtra, ordena, pagina e projeta. Retorna (status, corpo, headers)."""
+    campos = _projecao(nome_relacao, relacao, _param(params, "select"))
+    linhas = _filtrar(linhas, _filtros(nome_relacao, relacao, params))
+    linhas = _ordenar(nome_relacao, relacao, linhas, _param(params, "order"))
+
+    total = len(linhas)
+    offset = _inteiro_param(_param(params, "offset"), "offset") or 0
+    limit = _inteiro_param(_param(params, "limit"), "limit")
+    pagina = linhas[offset:] if limit is None else linhas[offset:offset + limit]
+
+    contar = prefs.get("count") in ("exact", "planned", "estimated")
+    headers = {"Content-Range": _content_range(offset, len(pagina), total if contar else None)}
+    parcial = contar and (offset > 0 or len(pagina) < total)
+    return (206 if parcial else 200), _projetar(pagina, campos), headers
+
+
+def _exigir_tabela(nome_relacao: str, relacao: dict):
+    if relacao["tipo"] != "tabela":
+        raise ErroPostgrest(
+            400, "55000", f'cannot change view "{nome_relacao}"',
+            "Views não são atualizáveis neste stand-in.",
+        )
+
+
+def _montar_linha(nome_relacao: str, relacao: dict, dados: dict, colunas_lote: set) -> dict:
+    """Linha nova: valores enviados, NULL para chaves do lote ausentes, default para o resto."""
+    for coluna in dados:
+        _coluna(relacao, nome_relacao, coluna)
+    linha = {}
+    for coluna, info in relacao["colunas"].items():
+        if coluna in dados:
+            valor = _normalizar(dados[coluna], info["tipo"])
+        elif coluna in colunas_lote:
+            valor = None
+        else:
+            valor = _normalizar(_default(nome_relacao, coluna, info["default"]), info["tipo"])
+        if valor is None and not info["nulo"]:
+            raise ErroPostgrest(
+                400, "23502",
+                f'null value in column "{coluna}" of relation "{nome_relacao}" violates not-null constraint',
+            )
+        linha[coluna] = valor
+    return linha
+
+
+def _inserir(nome_relacao: str, relacao: dict, corpo, params: list, prefs: dict):
+    _exigir_tabela(nome_relacao, relacao)
+    itens = corpo if isinstance(corpo, list) else [corpo]
+    if not all(isinstance(i, dict) for i in itens):
+        raise ErroPostgrest(400, "PGRST102", "All object keys must match")
+    colunas_lote = {c for i in itens for c in i}
+
+    on_conflict = _param(params, "on_conflict")
+    chave = [c.strip() for c in on_conflict.split(",")] if on_conflict else relacao["pk"]
+    for coluna in chave:
+        _coluna(relacao, nome_relacao, coluna)
+    resolucao = prefs.get("resolution")
+
+    tabela = _linhas[nome_relacao]
+    indice = {tuple(r.get(c) for c in chave): r for r in tabela} if chave else {}
+    afetadas, vistas = [], set()
+    for item in itens:
+        linha = _montar_linha(nome_relacao, relacao, item, colunas_lote)
+        k = tuple(linha.get(c) for c in chave)
+        existente = indice.get(k) if chave and None not in k else None
+        if existente is None:
+            tabela.append(linha)
+            if chave:
+                indice[k] = linha
+            afetadas.append(linha)
+            vistas.add(k)
+            continue
+        if resolucao == "ignore-duplicates":
+            continue
+        if resolucao != "merge-duplicates":
+            raise ErroPostgrest(
+                409, "23505", "duplicate key value violates unique constraint",
+                f"Key ({', '.join(chave)})=({', '.join(map(str, k))}) already exists.",
+            )
+        if k in vistas:
+            raise ErroPostgrest(
+                400, "21000", "ON CONFLICT DO UPDATE command cannot affect row a second time"
+            )
+        for coluna in item:
+            existente[coluna] = linha[coluna]
+        afetadas.append(existente)
+        vistas.add(k)
+    return afetadas
+
+
+def _atualizar(nome_relacao: str, relacao: dict, corpo, params: list):
+    _exigir_tabela(nome_relacao, relacao)
+    if not isinstance(corpo, dict):
+        raise ErroPostgrest(400, "PGRST102", "Empty or invalid json")
+    novos = {c: _normalizar(v, _coluna(relacao, nome_relacao, c)["tipo"]) for c, v in corpo.items()}
+    gatilhos = {
+        coluna: _normalizar(datetime.now(timezone.utc).isoformat(), relacao["colunas"][coluna]["tipo"])
+        for tabela, coluna in GATILHOS_ATUALIZACAO
+        if tabela == nome_relacao and coluna in relacao["colunas"]
+    }
+    afetadas = _filtrar(_linhas[nome_relacao], _filtros(nome_relacao, relacao, params))
+    for row in afetadas:
+        row.update(novos)
+        row.update(gatilhos)
+    return afetadas
+
+
+def _excluir(nome_relacao: str, relacao: dict, params: list):
+    _exigir_tabela(nome_relacao, relacao)
+    afetadas = _filtrar(_linhas[nome_relacao], _filtros(nome_relacao, relacao, params))
+    ids = {id(r) for r in afetadas}
+    _linhas[nome_relacao] = [r for r in _linhas[nome_relacao] if id(r) not in ids]
+    return afetadas
+
+
+# ==========================
+# FUNÇÕES (RPC) E GATILHOS
+# ==========================
+
+# Espelham os gatilhos de sql/ (set_atualizado_em)
+GATILHOS_ATUALIZACAO = {("antecipacoes", "atualizado_em")}
+
+
+def _rpc_exposicao_por_clinica(args: dict) -> list:
+    """sql/create_exposicao_por_clinica.sql (soma exata, como numeric)."""
+    filtro = args.get("p_clinica_ids")
+    ids = {_normalizar(c, "uuid") for c in filtro} if filtro is not None else None
+    somas = {}
+    for row in _linhas.get("antecipacoes", []):
+        cid = row.get("clinica_id")
+        if ids is not None and cid not in ids:
+            continue
+        total, reembolsado = somas.get(cid, (Decimal(0), Decimal(0)))
+        valor = Decimal(str(row.get("valor_liquido") or 0))
+        total += valor
+        if row.get("data_reembolso") is not None:
+            reembolsado += valor
+        somas[cid] = (total, reembolsado)
+    return [
+        {
+            "clinica_id": cid,
+            "total_antecipado": float(total),
+            "total_reembolsado": float(reembolsado),
+            "em_aberto": float(max(total - reembolsado, Decimal(0))),
+        }
+        for cid, (total, reembolsado) in somas.items()
+    ]
+
+
+def _rpc_resumo_mensal_dashboard(args: dict) -> list:
+    """sql/create_resumo_mensal_dashboard.sql (soma exata por mês, como numeric)."""
+    somas = {}
+    for row in _linhas.get("vw_dashboard_final", []):
+        data = row.get("mes_ref_date")
+        if data is None:
+            continue
+        mes = date.fromisoformat(str(data)[:10]).replace(day=1).isoformat()
+        somas[mes] = somas.get(mes, Decimal(0)) + Decimal(str(row.get("valor_total_emitido") or 0))
+    return [
+        {"mes_ref_date": mes, "valor_total_emitido": float(total)}
+        for mes, total in sorted(somas.items())
+    ]
+
+
+FUNCOES = {
+    "resumo_mensal_dashboard": {
+        "fn": _rpc_resumo_mensal_dashboard,
+        "colunas": {
+            "mes_ref_date": {"tipo": "date"},
+            "valor_total_emitido": {"tipo": "numeric"},
+        },
+    },
+    "exposicao_por_clinica": {
+        "fn": _rpc_exposicao_por_clinica,
+        "colunas": {
+            "clinica_id": {"tipo": "uuid"},
+            "total_antecipado": {"tipo": "numeric"},
+            "total_reembolsado": {"tipo": "numeric"},
+            "em_aberto": {"tipo": "numeric"},
+        },
+    },
+}
+
+
+def _chamar_rpc(nome: str, args: dict, params: list, prefs: dict):
+    funcao = FUNCOES.get(nome)
+    if funcao is None:
+        raise ErroPostgrest(
+            404, "PGRST202", f"Could not find the function public.{nome} in the schema cache"
+        )
+    linhas = funcao["fn"](args)
+    relacao = {"tipo": "funcao", "colunas": funcao["colunas"], "pk": [], "fks": []}
+    return _ler(nome, relacao, linhas, params, prefs)
+
+
+# ==========================
+# CARGA DE DADOS
+# ==========================
+
+
+def carregar_dados(diretorio: str):
+    """Carrega `<relacao>.json` (lista de linhas) de `diretorio`."""
+    with _lock:
+        for arquivo in sorted(os.listdir(diretorio)):
+            nome, ext = os.path.splitext(arquivo)
+            if ext != ".json" or nome not in _relacoes:
+                continue
+            with open(os.path.join(diretorio, arquivo), encoding="utf-8") as f:
+                linhas = json.load(f)
+            relacao = _relacoes[nome]
+            colunas = {c for r in linhas for c in r}
+            _linhas[nome].extend(_montar_linha(nome, relacao, r, colunas) for r in linhas)
+
+
+def _categoria(score: float) -> str:
+    if score >= 0.80:
+        return "A"
+    if score >= 0.60:
+        return "B"
+    if score >= 0.40:
+        return "C"
+    if score >= 0.20:
+        return "D"
+    return "E"
+
+
+def gerar_sintetico(clinicas: int, meses: int = 24, semente: int = 42):
+    """
+    Carga sintética determinística: clínicas, limites, importações,
+    antecipações, tabelas de fatos mensais e a vw_dashboard_final
+    correspondente (uma linha por clínica x mês).
+    """
+    rnd = random.Random(semente)
+    hoje = date.today().replace(day=1)
+    lista_meses = []
+    ano, mes = hoje.year, hoje.month
+    for _ in range(meses):
+        lista_meses.append(f"{ano:04d}-{mes:02d}")
+        ano, mes = (ano, mes - 1) if mes > 1 else (ano - 1, 12)
+    lista_meses.reverse()
+
+    def uid():
+        return str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+    def inserir(nome, rows):
+        relacao = _relacoes[nome]
+        colunas = {c for r in rows for c in r}
+        _linhas[nome].extend(_montar_linha(nome, relacao, r, colunas) for r in rows)
+
+    with _lock:
+        tabelas = {nome: [] for nome in (
+            "clinicas", "clinica_limite", "importacoes", "antecipacoes", "boletos_emitidos",
+            "inadimplencia", "taxa_pago_no_vencimento", "tempo_medio_pagamento",
+            "valor_medio_boleto", "vw_dashboard_final",
+        )}
+        for i in range(clinicas):
+            cid = uid()
+            codigo = f"{10000 + i}"
+            cnpj = f"{rnd.randrange(10**13, 10**14):014d}"
+            tabelas["clinicas"].append(
+                {"id": cid, "codigo_clinica": codigo, "cnpj": cnpj, "nome": f"Clínica {codigo}"}
+            )
+            limite = None
+            if rnd.random() < 0.7:
+                limite = float(rnd.choice([20000, 50000, 100000, 200000]))
+                tabelas["clinica_limite"].append({
+                    "clinica_id": cid,
+                    "limite_aprovado": limite,
+                    "aprovado_em": f"{lista_meses[-1]}-05T10:00:00",
+                    "aprovado_por": "sintetico",
+                })
+            inicio = rnd.randrange(0, max(meses // 2, 1))
+            for mes_ref in lista_meses[inicio:]:
+                qtde = rnd.randint(20, 800)
+                valor = round(qtde * rnd.uniform(80, 600), 2)
+                inad = round(rnd.betavariate(1.2, 40), 4)
+                pago = round(rnd.uniform(0.55, 0.98), 4)
+                dias = rnd.randint(2, 70)
+                ticket = round(valor / qtde, 2)
+                parc = round(rnd.uniform(1, 10), 3)
+                tabelas["boletos_emitidos"].append(
+                    {"clinica_id": cid, "mes_ref": mes_ref, "qtde": qtde, "valor_total": valor}
+                )
+                tabelas["inadimplencia"].append({"clinica_id": cid, "mes_ref": mes_ref, "taxa": inad})
+                tabelas["taxa_pago_no_vencimento"].append(
+                    {"clinica_id": cid, "mes_ref": mes_ref, "taxa": pago}
+                )
+                tabelas["tempo_medio_pagamento"].append(
+                    {"clinica_id": cid, "mes_ref": mes_ref, "dias": dias}
+                )
+                tabelas["valor_medio_boleto"].append(
+                    {"clinica_id": cid, "mes_ref": mes_ref, "valor": ticket}
+                )
+                score = round(max(0.0, 1.0 - inad * 8 - (1 - pago) * 0.5), 4)
+                tabelas["vw_dashboard_final"].append({
+                    "clinica_id": cid,
+                    "clinica_nome": codigo,
+                    "cnpj": cnpj,
+                    "mes_ref": mes_ref,
+                    "mes_ref_date": f"{mes_ref}-01",
+                    "qtde_boletos": qtde,
+                    "valor_total_emitido": valor,
+                    "valor_medio_boleto": ticket,
+                    "taxa_pago_no_vencimento": pago,
+                    "tempo_medio_pagamento_dias": dias,
+                    "taxa_inadimplencia": inad,
+                    "parc_media_parcelas_pond": parc,
+                    "score_credito": score,
+                    "categoria_risco": _categoria(score),
+                    "limite_aprovado": limite,
+                })
+            criado = datetime(hoje.year, hoje.month, 1) - timedelta(days=rnd.randint(0, 60))
+            tabelas["importacoes"].append({
+                "id": uid(),
+                "clinica_id": cid,
+                "arquivo_nome": f"{codigo}.xlsx",
+                "total_linhas": meses * 5,
+                "status": "concluido",
+                "criado_em": criado.isoformat(),
+                "mes_ref": lista_meses[-1],
+            })
+            if limite is not None:
+                for _ in range(rnd.randint(0, 8)):
+                    dia = hoje - timedelta(days=rnd.randint(1, 180))
+                    tabelas["antecipacoes"].append({
+                        "id": uid(),
+                        "clinica_id": cid,
+                        "cnpj": cnpj,
+                        "data_antecipacao": dia.isoformat(),
+                        "valor_liquido": round(rnd.uniform(500, limite / 8), 2),
+                        "data_reembolso": (dia + timedelta(days=30)).isoformat()
+                        if rnd.random() < 0.6 else None,
+                        "registrado_por": "sintetico",
+                        "criado_em": datetime.combine(dia, datetime.min.time()).isoformat(),
+                    })
+
+        # Mesma ordem da view no Postgres
+        tabelas["vw_dashboard_final"].sort(key=lambda r: (r["clinica_nome"], r["mes_ref_date"]))
+        for nome, rows in tabelas.items():
+            if nome in _relacoes:
+                inserir(nome, rows)
+
+
+# ==========================
+# SERVIDOR HTTP
+# ==========================
+
+
+def _params_da_url(query: str) -> list:
+    """Como parse_qsl, mas sem trocar `+` por espaço (timestamps com fuso)."""
+    params = []
+    for parte in query.split("&"):
+        if not parte:
+            continue
+        chave, _, valor = parte.partition("=")
+        params.append((unquote(chave), unquote(valor)))
+    return params
+
+
+class PostgrestLocalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latencia = 0.0
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _responder(self, status: int, corpo=None, headers: dict | None = None):
+        dados = b"" if corpo is None else json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        codificacao = self._codificacao() if len(dados) >= COMPRESSAO_MIN_BYTES else None
+        if codificacao == "br":
+            dados = brotli.compress(dados, quality=4)
+        elif codificacao == "gzip":
+            dados = gzip.compress(dados, compresslevel=5)
+        self.send_response(status)
+        if corpo is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        if codificacao:
+            self.send_header("Content-Encoding", codificacao)
+            self.send_header("Vary", "Accept-Encoding")
+        for chave, valor in (headers or {}).items():
+            self.send_header(chave, valor)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        if dados and self.command != "HEAD":
+            self.wfile.write(dados)
+
+    def _codificacao(self) -> str | None:
+        aceitas = {
+            parte.split(";")[0].strip().lower()
+            for parte in (self.headers.get("Accept-Encoding") or "").split(",")
+        }
+        if "br" in aceitas and brotli is not None:
+            return "br"
+        if "gzip" in aceitas:
+            return "gzip"
+        return None
+
+    def _corpo_json(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        bruto = self.rfile.read(tamanho) if tamanho else b""
+        if not bruto:
+            return {}
+        try:
+            return json.loads(bruto)
+        except ValueError:
+            raise ErroPostgrest(400, "PGRST102", "Empty or invalid json")
+
+    def _despachar(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+        url = urlsplit(self.path)
+        params = _params_da_url(url.query)
+        prefs = _preferencias(self.headers)
+        caminho = url.path.rstrip("/")
+        try:
+            if not caminho.startswith("/rest/v1/"):
+                raise ErroPostgrest(404, "PGRST125", f"Invalid path specified in request URL: {url.path}")
+            alvo = caminho[len("/rest/v1/"):]
+            corpo = self._corpo_json() if self.command in ("POST", "PATCH") else None
+
+            with _lock:
+                _stats["requisicoes"] += 1
+                if alvo.startswith("rpc/"):
+                    if self.command != "POST":
+                        raise ErroPostgrest(405, "PGRST101", "Only POST is supported for RPC here")
+                    if not isinstance(corpo, dict):
+                        raise ErroPostgrest(400, "PGRST102", "Empty or invalid json")
+                    status, resposta, headers = _chamar_rpc(alvo[4:], corpo, params, prefs)
+                    return self._responder(status, resposta, headers)
+
+                relacao = _relacao(alvo)
+                if self.command in ("GET", "HEAD"):
+                    status, resposta, headers = _ler(alvo, relacao, _linhas[alvo], params, prefs)
+                    return self._responder(status, resposta, headers)
+
+                if self.command == "POST":
+                    afetadas = _inserir(alvo, relacao, corpo, params, prefs)
+                    status_ok = 201
+                elif self.command == "PATCH":
+                    afetadas = _atualizar(alvo, relacao, corpo, params)
+                    status_ok = 200
+                else:
+                    afetadas = _excluir(alvo, relacao, params)
+                    status_ok = 200
+
+                headers = {"Content-Range": _content_range(0, len(afetadas), None)}
+                if prefs.get("return") == "representation":
+                    campos = _projecao(alvo, relacao, _param(params, "select"))
+                    return self._responder(status_ok, _projetar(afetadas, campos), headers)
+                return self._responder(201 if self.command == "POST" else 204, None, headers)
+        except ErroPostgrest as e:
+            self._responder(e.status, e.corpo)
+
+    do_GET = _despachar
+    do_HEAD = _despachar
+    do_POST = _despachar
+    do_PATCH = _despachar
+    do_DELETE = _despachar
+
+
+def iniciar(porta: int = PORTA_PADRAO, host: str = "127.0.0.1", latencia_ms: float = 0.0):
+    """Sobe o servidor numa thread; retorna o ThreadingHTTPServer (porta 0 = livre)."""
+    handler = type("Handler", (PostgrestLocalHandler,), {"latencia": latencia_ms / 1000.0})
+    servidor = ThreadingHTTPServer((host, porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def stats() -> dict:
+    with _lock:
+        return {"requisicoes": _stats["requisicoes"], "linhas": {n: len(r) for n, r in _linhas.items() if r}}
+
+
+# ==========================
+# MAIN
+# ==========================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in local do PostgREST (Supabase).")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--schema", default=SCHEMA_FILE)
+    parser.add_argument("--dados", help="diretório com <tabela>.json para carregar")
+    parser.add_argument("--sintetico", type=int, default=0, help="número de clínicas sintéticas")
+    parser.add_argument("--meses", type=int, default=24)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="atraso por requisição")
+    args = parser.parse_args()
+
+    carregar_schema(args.schema)
+    if args.dados:
+        carregar_dados(args.dados)
+    if args.sintetico:
+        gerar_sintetico(args.sintetico, args.meses)
+
+    servidor = iniciar(args.porta, args.host, args.latencia_ms)
+    print(f"PostgREST local em http://{args.host}:{servidor.server_port} · {stats()['linhas']}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,26 @@
+alter table public.antecipacoes
+  add column if not exists atualizado_em timestamptz not null default now();
+
+create or replace function public.set_atualizado_em()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.atualizado_em := now();
+  return new;
+end;
+$$;
+
+drop trigger if exists trg_antecipacoes_atualizado_em on public.antecipacoes;
+create trigger trg_antecipacoes_atualizado_em
+  before update on public.antecipacoes
+  for each row execute function public.set_atualizado_em();
+
+create index if not exists idx_antecipacoes_atualizado_em
+  on public.antecipacoes (atualizado_em);
+
+create index if not exists idx_importacoes_criado_em
+  on public.importacoes (criado_em);
+
+create index if not exists idx_clinica_limite_aprovado_em
+  on public.clinica_limite (aprovado_em);
@@ -0,0 +1,33 @@
+-- Exposição em aberto por clínica (antecipado - reembolsado), uma linha por
+-- clínica. Chamada via PostgREST: POST /rest/v1/rpc/exposicao_por_clinica
+-- com {"p_clinica_ids": [...]} ou {} para todas as clínicas.
+create or replace function public.exposicao_por_clinica(p_clinica_ids uuid[] default null)
+returns table (
+  clinica_id uuid,
+  total_antecipado numeric,
+  total_reembolsado numeric,
+  em_aberto numeric
+)
+language sql
+stable
+as $$
+  select a.clinica_id,
+         sum(a.valor_liquido) as total_antecipado,
+         coalesce(sum(a.valor_liquido) filter (where a.data_reembolso is not null), 0) as total_reembolsado,
+         greatest(
+           sum(a.valor_liquido)
+             - coalesce(sum(a.valor_liquido) filter (where a.data_reembolso is not null), 0),
+           0
+         ) as em_aberto
+  from public.antecipacoes a
+  where p_clinica_ids is null
+     or a.clinica_id = any (p_clinica_ids)
+  group by a.clinica_id;
+$$;
+
+grant execute on function public.exposicao_por_clinica(uuid[]) to service_role;
+
+create index if not exists idx_antecipacoes_clinica_id
+  on public.antecipacoes (clinica_id);
+
+notify pgrst, 'reload schema';
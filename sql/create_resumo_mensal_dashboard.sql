@@ -0,0 +1,22 @@
+-- Emissão total do portfólio por mês da vw_dashboard_final, uma linha por
+-- mês (inclusive os fora da janela carregada no snapshot do backend).
+-- Chamada via PostgREST: POST /rest/v1/rpc/resumo_mensal_dashboard com {}.
+create or replace function public.resumo_mensal_dashboard()
+returns table (
+  mes_ref_date date,
+  valor_total_emitido numeric
+)
+language sql
+stable
+as $$
+  select date_trunc('month', v.mes_ref_date)::date as mes_ref_date,
+         coalesce(sum(v.valor_total_emitido), 0) as valor_total_emitido
+  from public.vw_dashboard_final v
+  where v.mes_ref_date is not null
+  group by 1
+  order by 1;
+$$;
+
+grant execute on function public.resumo_mensal_dashboard() to service_role;
+
+notify pgrst, 'reload schema';